@@ -6,13 +6,18 @@ import itertools
 import logging
 import operator
 import warnings
+from collections import defaultdict
 from uuid import UUID
 
-from django.conf import settings
-from django.core.cache import cache
-from django.db import DatabaseError, IntegrityError, transaction
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, IntegrityError, connections, router, transaction
+from django.db.models import Avg, Count, Max, Min, Q
+from django.utils.timezone import now
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import IntegerField
 
+from submissions import caching
 # SubmissionError imported so that code importing this api has access
+from submissions.dispatch import send_score_signal
 from submissions.errors import (  # pylint: disable=unused-import
     ExternalGraderQueueEmptyError,
     SubmissionError,
@@ -22,16 +27,28 @@ from submissions.errors import (  # pylint: disable=unused-import
 )
 from submissions.models import (
     DELETED,
+    ArchivedScore,
     ExternalGraderDetail,
     Score,
     ScoreAnnotation,
     ScoreSummary,
     StudentItem,
     Submission,
+    TeamSubmission,
+    TeamSubmissionMembership,
     score_reset,
     score_set
 )
+from submissions.replicas import (
+    get_router,
+    has_recent_item_write,
+    has_recent_write,
+    mark_recent_item_writes,
+    mark_recent_write,
+    mark_recent_writes
+)
 from submissions.serializers import (
+    ArchivedScoreSerializer,
     ScoreSerializer,
     StudentItemSerializer,
     SubmissionSerializer,
@@ -48,6 +65,15 @@ MAX_TOP_SUBMISSIONS = 100
 # Set a relatively low cache timeout for top submissions.
 TOP_SUBMISSIONS_CACHE_TIMEOUT = 300
 
+# Number of rows fetched (and annotations prefetched) at a time when iterating over a course's submissions.
+COURSE_SUBMISSIONS_CHUNK_SIZE = 1000
+
+# Number of student items reset per transaction by reset_scores_for_item.
+RESET_SCORES_CHUNK_SIZE = 500
+
+# Score statistics are invalidated by score writes, so they can be cached for longer.
+SCORE_STATISTICS_CACHE_TIMEOUT = 3600
+
 
 # pylint: disable=unused-argument
 def create_external_grader_detail(student_item_dict,
@@ -210,6 +236,7 @@ def create_submission(
 
         sub_data = submission_serializer.data
         _log_submission(sub_data, student_item_dict)
+        mark_recent_write(student_item_model.pk, [sub_data["uuid"]])
 
         return sub_data
 
@@ -222,6 +249,74 @@ def create_submission(
         raise SubmissionInternalError(error_message) from error
 
 
+def create_team_member_submissions(
+    base_student_item_dict,
+    student_ids,
+    answer,
+    team_submission,
+    submitted_at=None,
+    attempt_number=1,
+):  # pylint: disable=too-many-positional-arguments
+    """
+    Creates the individual submissions of a team submission, one per student, in bulk.
+
+    Equivalent to calling `create_submission` for each student, but the answer is
+    validated once, the student items are fetched (and created) together and the
+    submissions are inserted with a single query.
+
+    Args:
+        base_student_item_dict (dict): The course_id, item_id and item_type of the student items.
+        student_ids (list of str): The students to create a submission for.
+        answer (JSON-serializable): The team's answer.
+        team_submission (TeamSubmission): The team submission the submissions belong to.
+        submitted_at (datetime, optional): The date on which the submissions were submitted.
+            Defaults to the current date.
+        attempt_number (int, optional): The attempt number of the submissions. Defaults to 1.
+
+    Returns:
+        list of dict: The serialized submissions, in the order of `student_ids`.
+
+    Raises:
+        SubmissionRequestError: The answer or a student item failed validation.
+        SubmissionInternalError: An error occurred while creating the submissions.
+    """
+    try:
+        SubmissionSerializer().validate_answer(answer)
+    except ValidationError as error:
+        raise SubmissionRequestError(field_errors={'answer': error.detail}) from error
+
+    student_items = _get_or_create_student_items(base_student_item_dict, student_ids)
+    model_kwargs = {
+        'answer': answer,
+        'attempt_number': attempt_number,
+        'team_submission': team_submission,
+    }
+    if submitted_at:
+        model_kwargs['submitted_at'] = submitted_at
+
+    try:
+        submissions = Submission.objects.bulk_create([
+            Submission(student_item=student_items[student_id], **model_kwargs)
+            for student_id in student_ids
+        ])
+        TeamSubmissionMembership.objects.bulk_create(TeamSubmissionMembership.for_submissions(submissions))
+        submissions_data = SubmissionSerializer(submissions, many=True).data
+        for student_id, sub_data in zip(student_ids, submissions_data):
+            _log_submission(sub_data, dict(base_student_item_dict, student_id=student_id))
+        mark_recent_writes(
+            [student_item.pk for student_item in student_items.values()],
+            [sub_data['uuid'] for sub_data in submissions_data],
+        )
+        return submissions_data
+    except DatabaseError as error:
+        error_message = (
+            f"An error occurred while creating submissions for students {student_ids} "
+            f"and team submission {team_submission.uuid}"
+        )
+        logger.exception(error_message)
+        raise SubmissionInternalError(error_message) from error
+
+
 def _get_submission_model(uuid, read_replica=False):
     """
     Helper to retrieve a given Submission object from the database. Helper is needed to centralize logic that fixes
@@ -229,7 +324,7 @@ def _get_submission_model(uuid, read_replica=False):
     """
     submission_qs = Submission.objects
     if read_replica:
-        submission_qs = _use_read_replica(submission_qs)
+        submission_qs = _use_read_replica(submission_qs, submission_uuid=uuid)
     try:
         submission = submission_qs.get(uuid=uuid)
     except Submission.DoesNotExist:
@@ -299,7 +394,7 @@ def get_submission(submission_uuid, read_replica=False):
 
     cache_key = Submission.get_cache_key(submission_uuid)
     try:
-        cached_submission_data = cache.get(cache_key)
+        cached_submission_data = caching.get(cache_key, codec=caching.SUBMISSION_CODEC)
     except Exception:  # pylint: disable=broad-except
         # The cache backend could raise an exception
         # (for example, memcache keys that contain spaces)
@@ -318,7 +413,7 @@ def get_submission(submission_uuid, read_replica=False):
 
         submission = _get_submission_model(submission_uuid, read_replica)
         submission_data = SubmissionSerializer(submission).data
-        cache.set(cache_key, submission_data)
+        caching.set(cache_key, submission_data, codec=caching.SUBMISSION_CODEC)
     except Submission.DoesNotExist as error:
         logger.error("Submission %s not found.", submission_uuid)
         raise SubmissionNotFoundError(
@@ -364,7 +459,7 @@ def get_submission_and_student(uuid, read_replica=False):
     # Retrieve the student item from the cache
     cache_key = f"submissions.student_item.{submission['student_item']}"
     try:
-        cached_student_item = cache.get(cache_key)
+        cached_student_item = caching.get(cache_key, codec=caching.STUDENT_ITEM_CODEC)
     except Exception:  # pylint: disable=broad-except
         # The cache backend could raise an exception
         # (for example, memcache keys that contain spaces)
@@ -378,11 +473,11 @@ def get_submission_and_student(uuid, read_replica=False):
         try:
             student_item_qs = StudentItem.objects
             if read_replica:
-                student_item_qs = _use_read_replica(student_item_qs)
+                student_item_qs = _use_read_replica(student_item_qs, student_item_id=submission['student_item'])
 
             student_item = student_item_qs.get(id=submission['student_item'])
             submission['student_item'] = StudentItemSerializer(student_item).data
-            cache.set(cache_key, submission['student_item'])
+            caching.set(cache_key, submission['student_item'], codec=caching.STUDENT_ITEM_CODEC)
         except Exception as ex:
             err_msg = f"Could not get submission due to error: {ex}"
             logger.exception(err_msg)
@@ -536,10 +631,14 @@ def get_all_course_submission_information(course_id, item_type, read_replica=Tru
     if read_replica:
         submission_qs = _use_read_replica(submission_qs)
 
-    query = submission_qs.select_related('student_item__scoresummary__latest__submission').filter(
+    # The annotations of the latest scores are prefetched one chunk at a time,
+    # so serializing the scores does not cost a query per row.
+    query = submission_qs.select_related('student_item__scoresummary__latest__submission').prefetch_related(
+        'student_item__scoresummary__latest__scoreannotation_set',
+    ).filter(
         student_item__course_id=course_id,
         student_item__item_type=item_type,
-    ).iterator()
+    ).iterator(chunk_size=COURSE_SUBMISSIONS_CHUNK_SIZE)
 
     for submission in query:
         student_item = submission.student_item
@@ -565,6 +664,7 @@ def get_top_submissions(course_id, item_id, item_type, number_of_top_scores, use
 
     This function will return top scores for the piece of assessment.
     It will consider only the latest and greater than 0 score for a piece of assessment.
+    Scores are ranked by their ratio of points earned to points possible, then by points earned.
     A score is only calculated for a student item if it has completed the workflow for
     a particular assessment module.
 
@@ -618,22 +718,27 @@ def get_top_submissions(course_id, item_id, item_type, number_of_top_scores, use
         raise SubmissionRequestError(msg=error_msg)
 
     # First check the cache (unless caching is disabled)
-    cache_key = (
-        f"submissions.top_submissions.{course_id}."
-        f"{item_id}.{item_type}.{number_of_top_scores}"
+    cache_key = _get_top_submissions_cache_key(
+        course_id, item_id, item_type, number_of_top_scores,
+        caching.get_generation(_get_top_submissions_generation_key(course_id, item_id, item_type)),
     )
-    top_submissions = cache.get(cache_key) if use_cache else None
+    top_submissions = caching.get(cache_key, codec=caching.TOP_SUBMISSIONS_CODEC, local=False) if use_cache else None
 
     # If we can't find it in the cache (or caching is disabled), check the database
     # By default, prefer the read-replica.
     if top_submissions is None:
         try:
+            # Ranked on the copy of the latest score kept on the summary, which is indexed by item
             query = ScoreSummary.objects.filter(
+                item_id=item_id,
                 student_item__course_id=course_id,
-                student_item__item_id=item_id,
                 student_item__item_type=item_type,
-                latest__points_earned__gt=0
-            ).select_related('latest', 'latest__submission').order_by("-latest__points_earned")
+                latest_points_earned__gt=0,
+                latest_normalized_score__isnull=False,
+            ).select_related('latest', 'latest__submission').order_by(
+                "-latest_normalized_score",
+                "-latest_points_earned",
+            )
 
             if read_replica:
                 query = _use_read_replica(query)
@@ -656,11 +761,193 @@ def get_top_submissions(course_id, item_id, item_type, number_of_top_scores, use
         ]
 
         # Always store the retrieved list in the cache
-        cache.set(cache_key, top_submissions, TOP_SUBMISSIONS_CACHE_TIMEOUT)
+        caching.set(
+            cache_key,
+            top_submissions,
+            TOP_SUBMISSIONS_CACHE_TIMEOUT,
+            codec=caching.TOP_SUBMISSIONS_CODEC,
+            local=False,
+        )
 
     return top_submissions
 
 
+# pylint: disable=too-many-positional-arguments
+def get_score_statistics(course_id, item_id, item_type, buckets=10, percentiles=None, use_cache=True,
+                         read_replica=True):
+    """
+    Get the distribution of the latest scores of every student on an item.
+
+    Scores are compared by their ratio of points earned to points possible,
+    between 0 and 1.  Hidden scores (such as the ones created by `reset_score`)
+    are left out.  The statistics are computed by the database in a single
+    aggregate query over the score summaries of the item, and cached until
+    the next score is set or reset for the item.
+
+    Args:
+        course_id (str): The course containing the item.
+        item_id (str): The item to get the statistics of.
+        item_type (str): The type of the item.
+
+    Kwargs:
+        buckets (int or list of float): The number of equal-width histogram buckets
+            between 0 and 1, or the increasing edges of the buckets. The first bucket
+            also counts ratios lower than its lower edge, and the last bucket ratios
+            greater than its upper edge, so the bucket counts add up to "count".
+        percentiles (list of int): Percentiles to estimate, e.g. [50, 90]. The
+            estimates are interpolated from the histogram, so they are only as
+            precise as its buckets.
+        use_cache (bool): If true, check the cache before querying the database.
+        read_replica (bool): If true, attempt to use the read replica database,
+            unless a score was set or reset for the item within the maximum
+            tolerated replica lag.
+
+    Returns:
+        dict: with the keys "count", "mean", "min", "max" (None if there are no
+            scores), "histogram" (a list of dicts with "lower", "upper" and
+            "count") and, if requested, "percentiles" (a dict mapping each
+            percentile to its estimate, or None if there are no scores).
+
+    Raises:
+        SubmissionRequestError: Raised if the buckets or percentiles are invalid.
+        SubmissionInternalError: Raised if the statistics cannot be computed.
+
+    Examples:
+        >>> get_score_statistics("TestCourse", "u_67", "openassessment", buckets=2, percentiles=[50])
+        {
+            'count': 3,
+            'mean': 0.6,
+            'min': 0.2,
+            'max': 1.0,
+            'histogram': [
+                {'lower': 0.0, 'upper': 0.5, 'count': 1},
+                {'lower': 0.5, 'upper': 1.0, 'count': 2},
+            ],
+            'percentiles': {50: 0.625},
+        }
+
+    """
+    edges = _get_histogram_edges(buckets)
+    if percentiles is not None and any(not 0 <= percentile <= 100 for percentile in percentiles):
+        raise SubmissionRequestError(msg="Percentiles must be between 0 and 100.")
+
+    # All the statistics of an item are cached under one key, so that score writes
+    # can invalidate them whatever buckets they were computed with.
+    cache_key = _get_score_statistics_cache_key(course_id, item_id, item_type)
+    item_statistics = (caching.get(cache_key, local=False) if use_cache else None) or {}
+    statistics = item_statistics.get(edges)
+
+    if statistics is None:
+        # The first and last buckets are open-ended, so that every ratio is counted in one bucket
+        ratio_histogram = {}
+        for index, (lower, upper) in enumerate(zip(edges, edges[1:])):
+            bucket_filter = Q()
+            if index > 0:
+                bucket_filter &= Q(latest_normalized_score__gte=lower)
+            if index < len(edges) - 2:
+                bucket_filter &= Q(latest_normalized_score__lt=upper)
+            ratio_histogram[f"bucket_{index}"] = Count('id', filter=bucket_filter or None)
+        try:
+            query = ScoreSummary.objects.filter(
+                item_id=item_id,
+                student_item__course_id=course_id,
+                student_item__item_type=item_type,
+                latest_normalized_score__isnull=False,
+            )
+            # A replica may not have caught up with a recent score write yet, and whatever
+            # is read here is cached for much longer than it can lag.
+            if read_replica and not has_recent_item_write(course_id, item_id, item_type):
+                query = _use_read_replica(query)
+            aggregates = query.aggregate(
+                count=Count('id'),
+                mean=Avg('latest_normalized_score'),
+                min=Min('latest_normalized_score'),
+                max=Max('latest_normalized_score'),
+                **ratio_histogram
+            )
+        except DatabaseError as error:
+            msg = (
+                f"Could not compute score statistics for course {course_id}, "
+                f"item {item_id} of type {item_type}"
+            )
+            logger.exception(msg)
+            raise SubmissionInternalError(msg) from error
+
+        statistics = {
+            "count": aggregates["count"],
+            "mean": aggregates["mean"],
+            "min": aggregates["min"],
+            "max": aggregates["max"],
+            "histogram": [
+                {"lower": lower, "upper": upper, "count": aggregates[f"bucket_{index}"]}
+                for index, (lower, upper) in enumerate(zip(edges, edges[1:]))
+            ],
+        }
+        item_statistics[edges] = statistics
+        caching.set(cache_key, item_statistics, SCORE_STATISTICS_CACHE_TIMEOUT, local=False)
+
+    statistics = dict(statistics)
+    if percentiles is not None:
+        statistics["percentiles"] = {
+            percentile: _approximate_percentile(statistics, percentile) for percentile in percentiles
+        }
+    return statistics
+
+
+def _get_histogram_edges(buckets):
+    """
+    Return the histogram bucket edges, as a tuple of floats, for `get_score_statistics`.
+    """
+    if isinstance(buckets, int):
+        if buckets < 1:
+            raise SubmissionRequestError(msg="The number of buckets must be at least 1.")
+        return tuple(index / buckets for index in range(buckets + 1))
+    edges = tuple(float(edge) for edge in buckets)
+    if len(edges) < 2 or any(lower >= upper for lower, upper in zip(edges, edges[1:])):
+        raise SubmissionRequestError(msg="Bucket edges must be at least two increasing numbers.")
+    return edges
+
+
+def _approximate_percentile(statistics, percentile):
+    """
+    Estimate a percentile by linear interpolation within the histogram bucket that contains it.
+    """
+    count = statistics["count"]
+    if not count:
+        return None
+    rank = percentile / 100 * count
+    cumulative = 0
+    histogram = statistics["histogram"]
+    for index, bucket in enumerate(histogram):
+        if bucket["count"] and cumulative + bucket["count"] >= rank:
+            # Clamp to the observed range, which is exact; the first and last buckets are open-ended
+            lower = statistics["min"] if index == 0 else max(bucket["lower"], statistics["min"])
+            upper = statistics["max"] if index == len(histogram) - 1 else min(bucket["upper"], statistics["max"])
+            estimate = lower + (upper - lower) * (rank - cumulative) / bucket["count"]
+            return max(statistics["min"], min(statistics["max"], estimate))
+        cumulative += bucket["count"]
+    return statistics["max"]
+
+
+def _get_score_statistics_cache_key(course_id, item_id, item_type):
+    return f"submissions.score_statistics.{course_id}.{item_id}.{item_type}"
+
+
+def _invalidate_score_statistics(student_items):
+    """
+    Drop the cached score statistics of the items of the given student items.
+
+    The items are also marked as recently written, so that the statistics are
+    recomputed from the primary database rather than from a lagging replica.
+    """
+    items = {
+        (student_item.course_id, student_item.item_id, student_item.item_type)
+        for student_item in student_items
+    }
+    caching.delete_many({_get_score_statistics_cache_key(*item) for item in items})
+    mark_recent_item_writes(items)
+
+
 def get_student_ids_by_submission_uuid(course_id, submission_uuids, read_replica=True):
     """
     Given a list of submission uuids, and a course id for security,
@@ -798,7 +1085,11 @@ def get_latest_score_for_submission(submission_uuid, read_replica=False):
         ).order_by("-id").select_related("submission")
 
         if read_replica:
-            score_qs = _use_read_replica(score_qs)
+            score_qs = _use_read_replica(
+                score_qs,
+                student_item_id=submission_model.student_item_id,
+                submission_uuid=submission_uuid,
+            )
 
         score = score_qs[0]
         if score.is_hidden():
@@ -809,6 +1100,88 @@ def get_latest_score_for_submission(submission_uuid, read_replica=False):
     return ScoreSerializer(score).data
 
 
+def get_score_history(student_item):
+    """
+    Get every score given for a student item, oldest first.
+
+    Scores moved to the archive by the archive_scores command are included, as
+    are hidden scores (such as the ones created by `reset_score`), so the
+    history can be replayed in full.  This reads two tables and is not meant
+    for hot paths; use `get_score` for the current score.
+
+    Args:
+        student_item (dict): The dictionary representation of a student item.
+
+    Returns:
+        list of dict: The serialized scores, with the fields of `get_scores`. An
+            empty list if the student item does not exist.
+
+    Raises:
+        SubmissionInternalError: Raised if the scores cannot be retrieved because
+            of an internal server error.
+
+    """
+    try:
+        student_item_model = StudentItem.objects.get(**student_item)
+        scores = list(Score.objects.filter(student_item=student_item_model).select_related('submission'))
+        archived_scores = list(
+            ArchivedScore.objects.filter(student_item=student_item_model).select_related('submission')
+        )
+    except StudentItem.DoesNotExist:
+        return []
+    except DatabaseError as error:
+        msg = f"Could not fetch score history for student item {student_item}"
+        logger.exception(msg)
+        raise SubmissionInternalError(msg) from error
+
+    history = [(score.created_at, score.id, UnannotatedScoreSerializer(score).data) for score in scores]
+    history.extend(
+        (score.created_at, score.score_id, ArchivedScoreSerializer(score).data) for score in archived_scores
+    )
+    return [data for _, _, data in sorted(history, key=lambda entry: entry[:2])]
+
+
+def rebuild_score_summaries(student_item_ids, dry_run=False):
+    """
+    Repair the score summaries of the given student items from their score history.
+
+    Summaries can drift from the scores when updating them failed (such
+    errors are logged and swallowed so that the score itself is saved).  This
+    recomputes the highest and latest scores the way they are maintained when
+    scores are set and reset, and fixes the summaries that differ.  Use the
+    rebuild_score_summaries management command to go over every student item.
+
+    Args:
+        student_item_ids (list of int): The ids of the student items to repair.
+
+    Kwargs:
+        dry_run (bool): If True, only report the differences.
+
+    Returns:
+        list of dict: The summaries that differ (and were fixed, unless dry_run
+            is set), as returned by `ScoreSummary.rebuild`.
+
+    Raises:
+        SubmissionInternalError: Raised if the summaries cannot be rebuilt.
+
+    Examples:
+        >>> rebuild_score_summaries([12, 13])
+        [{'student_item_id': 12, 'highest': (40, 38), 'latest': (41, 41)}]
+
+    """
+    try:
+        differences = ScoreSummary.rebuild(student_item_ids, dry_run=dry_run)
+        if differences and not dry_run:
+            changed_ids = [difference['student_item_id'] for difference in differences]
+            mark_recent_writes(changed_ids)
+            _invalidate_score_statistics(StudentItem.objects.filter(id__in=changed_ids))
+    except DatabaseError as error:
+        msg = "Error occurred while rebuilding score summaries"
+        logger.exception(msg)
+        raise SubmissionInternalError(msg) from error
+    return differences
+
+
 def reset_score(student_id, course_id, item_id, clear_state=False, emit_signal=True):
     """
     Reset scores for a specific student on a specific problem.
@@ -845,23 +1218,39 @@ def reset_score(student_id, course_id, item_id, clear_state=False, emit_signal=T
         score = Score.create_reset_score(student_item)
         if emit_signal:
             # Send a signal out to any listeners who are waiting for scoring events.
-            score_reset.send(
-                sender=None,
+            send_score_signal(
+                score_reset,
                 anonymous_user_id=student_id,
                 course_id=course_id,
                 item_id=item_id,
                 created_at=score.created_at,
             )
 
+        cleared_uuids = []
         if clear_state:
-            for sub in student_item.submission_set.all():
-                # soft-delete the Submission
-                sub.status = DELETED
-                sub.save(update_fields=["status"])
+            # soft-delete the Submissions, in one statement
+            submissions = {
+                pk: (sub_uuid, team_submission_uuid)
+                for pk, sub_uuid, team_submission_uuid in student_item.submission_set.order_by().values_list(
+                    'pk', 'uuid', 'team_submission__uuid'
+                )
+            }
+            if submissions:
+                Submission.objects.filter(pk__in=list(submissions)).update(status=DELETED)
+            if any(team_submission_uuid for _, team_submission_uuid in submissions.values()):
+                TeamSubmissionMembership.remove_for_student_items([student_item])
+            cleared_uuids = [sub_uuid for sub_uuid, _ in submissions.values()]
+
+            # Also clear out cached values, including the leaderboards that may show these submissions
+            # and the team submissions they belong to
+            caching.delete_many(
+                [Submission.get_cache_key(sub_uuid) for sub_uuid in cleared_uuids]
+                + _get_team_submission_cache_keys(submissions.values())
+            )
+            invalidate_top_submissions(course_id, item_id, [student_item.item_type])
 
-                # Also clear out cached values
-                cache_key = Submission.get_cache_key(sub.uuid)
-                cache.delete(cache_key)
+        mark_recent_write(student_item.pk, cleared_uuids)
+        _invalidate_score_statistics([student_item])
 
     except DatabaseError as error:
         msg = (
@@ -880,6 +1269,129 @@ def reset_score(student_id, course_id, item_id, clear_state=False, emit_signal=T
     )
 
 
+def reset_scores_for_item(course_id, item_id, student_ids=None, clear_state=False, emit_signal=True):
+    """
+    Reset scores for every student (or the given students) on a specific problem.
+
+    This is the bulk counterpart of `reset_score`.  Student items are reset
+    in chunks of `RESET_SCORES_CHUNK_SIZE`, one transaction per chunk, so
+    resetting a whole item does not hold locks on the score tables for long.
+    Within a chunk, the reset scores are inserted, the score summaries
+    updated and (with `clear_state`) the submissions soft-deleted set-wise.
+    The `score_reset` signals of a chunk are sent once it has committed.
+
+    Args:
+        course_id (unicode): The ID of the course containing the item to reset.
+        item_id (unicode): The ID of the item for which to reset scores.
+        student_ids (list of unicode): If given, only reset the scores of these students.
+        clear_state (bool): If True, will appear to delete any submissions associated with the reset StudentItems
+        emit_signal (bool): If True, send the `score_reset` signal for each reset StudentItem.
+
+    Returns:
+        int: The number of student items that were reset.
+
+    Raises:
+        SubmissionInternalError: An unexpected error occurred while resetting scores.
+            The chunks committed before the error stay reset.
+
+    """
+    student_items = StudentItem.objects.filter(course_id=course_id, item_id=item_id)
+    if student_ids is not None:
+        student_items = student_items.filter(student_id__in=list(student_ids))
+
+    reset_count = 0
+    last_id = 0
+    item_types = set()
+    try:
+        while True:
+            chunk = list(student_items.filter(id__gt=last_id).order_by('id')[:RESET_SCORES_CHUNK_SIZE])
+            if not chunk:
+                break
+            reset_student_items(chunk, clear_state, emit_signal)
+            reset_count += len(chunk)
+            last_id = chunk[-1].id
+            item_types.update(student_item.item_type for student_item in chunk)
+    except DatabaseError as error:
+        msg = f"Error occurred while reseting scores for item {item_id} in course {course_id}"
+        logger.exception(msg)
+        raise SubmissionInternalError(msg) from error
+    finally:
+        if clear_state:
+            invalidate_top_submissions(course_id, item_id, item_types)
+
+    logger.info(
+        "Scores reset for %(count)s students on item %(item_id)s in course %(course_id)s",
+        {
+            'count': reset_count,
+            'item_id': item_id,
+            'course_id': course_id,
+        }
+    )
+    return reset_count
+
+
+def reset_student_items(student_items, clear_state, emit_signal):
+    """
+    Reset the scores of several student items, such as the members of a team, in one transaction.
+
+    The reset scores are inserted and their score summaries updated set-wise,
+    and the `score_reset` signals are sent once the transaction has committed.
+
+    Args:
+        student_items (list of StudentItem): The student items to reset.
+        clear_state (bool): If True, also soft-delete the submissions of the student items.
+        emit_signal (bool): If True, send the `score_reset` signal for each student item.
+
+    Raises:
+        DatabaseError: The scores could not be reset.
+    """
+    reset_scores = [Score(student_item=student_item, reset=True) for student_item in student_items]
+    student_item_ids = [student_item.id for student_item in student_items]
+    submissions = {}
+    with transaction.atomic():
+        _create_scores(reset_scores)
+        if clear_state:
+            submissions = {
+                pk: (sub_uuid, team_submission_uuid)
+                for pk, sub_uuid, team_submission_uuid in Submission.objects.filter(
+                    student_item_id__in=student_item_ids
+                ).order_by().values_list('pk', 'uuid', 'team_submission__uuid')
+            }
+            if submissions:
+                Submission.objects.filter(pk__in=list(submissions)).update(status=DELETED)
+            if any(team_submission_uuid for _, team_submission_uuid in submissions.values()):
+                TeamSubmissionMembership.remove_for_student_items(student_items)
+        if emit_signal:
+            transaction.on_commit(lambda: _send_score_reset_signals(reset_scores))
+
+    cleared_uuids = [sub_uuid for sub_uuid, _ in submissions.values()]
+    if submissions:
+        caching.delete_many(
+            [Submission.get_cache_key(sub_uuid) for sub_uuid in cleared_uuids]
+            + _get_team_submission_cache_keys(submissions.values())
+        )
+    mark_recent_writes(student_item_ids, cleared_uuids)
+    _invalidate_score_statistics(student_items)
+
+
+def _get_team_submission_cache_keys(cleared_submissions):
+    """
+    Return the cache keys of the team submissions of cleared submissions.
+
+    A team submission lists the uuids of its active submissions, so its cached
+    form is stale once one of them is soft-deleted.
+
+    Args:
+        cleared_submissions (iterable of tuple): (submission uuid, team submission uuid or None) pairs.
+    """
+    return [
+        TeamSubmission.get_cache_key(team_submission_uuid)
+        for team_submission_uuid in {
+            team_submission_uuid for _, team_submission_uuid in cleared_submissions if team_submission_uuid is not None
+        }
+    ]
+
+
 # pylint: disable=too-many-positional-arguments
 def set_score(submission_uuid, points_earned, points_possible,
               annotation_creator=None, annotation_type=None, annotation_reason=None):
@@ -961,9 +1473,11 @@ def set_score(submission_uuid, points_earned, points_possible,
                     reason=annotation_reason
                 )
                 score_annotation.save()
+        mark_recent_write(submission_model.student_item_id, [submission_model.uuid])
+        _invalidate_score_statistics([submission_model.student_item])
         # Send a signal out to any listeners who are waiting for scoring events.
-        score_set.send(
-            sender=None,
+        send_score_signal(
+            score_set,
             points_possible=points_possible,
             points_earned=points_earned,
             anonymous_user_id=submission_model.student_item.student_id,
@@ -975,6 +1489,328 @@ def set_score(submission_uuid, points_earned, points_possible,
         pass
 
 
+def set_scores_bulk(scores):
+    """
+    Set scores for many submissions at once.
+
+    This is the batch counterpart of `set_score`, meant for grading runs and
+    backfills.  All the submissions are looked up in one query, and the
+    scores, annotations and score summaries are written set-wise in a single
+    transaction.  The `score_set` signals are sent once that transaction has
+    committed.
+
+    Items that cannot be scored (missing or unknown submission, invalid
+    points) are reported as failures without preventing the rest of the
+    batch from being scored.  If the batch cannot be saved, its items are
+    retried one at a time, so that only the items that fail are reported.
+
+    Args:
+        scores (list of dict): One dict per score to set, with the keys
+            `submission_uuid`, `points_earned` and `points_possible`, and
+            optionally `annotation_creator`, `annotation_type` and
+            `annotation_reason` (see `set_score`).
+
+    Returns:
+        list of dict: One result per input item, in the same order, with the
+        keys `submission_uuid`, `success` (bool) and `error` (str or None).
+
+    Examples:
+        >>> set_scores_bulk([
+        ...     {"submission_uuid": "a778b933-9fb3-11e3-9c0f-040ccee02800", "points_earned": 11, "points_possible": 12},
+        ...     {"submission_uuid": "deadbeef-1234-5678-9100-1234deadbeef", "points_earned": 3, "points_possible": 12},
+        ... ])
+        [
+            {'submission_uuid': 'a778b933-9fb3-11e3-9c0f-040ccee02800', 'success': True, 'error': None},
+            {
+                'submission_uuid': 'deadbeef-1234-5678-9100-1234deadbeef',
+                'success': False,
+                'error': 'No submission matching uuid deadbeef-1234-5678-9100-1234deadbeef'
+            },
+        ]
+
+    """
+    results = [
+        {"submission_uuid": item.get("submission_uuid"), "success": False, "error": None}
+        for item in scores
+    ]
+    points_field = IntegerField(min_value=0)
+
+    # Validate the items before touching the database
+    pending = []
+    for index, item in enumerate(scores):
+        if not item.get("submission_uuid"):
+            results[index]["error"] = "Missing submission_uuid"
+            continue
+        try:
+            points = (
+                points_field.run_validation(item.get("points_earned")),
+                points_field.run_validation(item.get("points_possible")),
+            )
+        except ValidationError as error:
+            results[index]["error"] = f"Invalid points: {error.detail}"
+            continue
+        pending.append((index, item, points))
+
+    submissions = get_submission_models_by_uuid([item["submission_uuid"] for _index, item, _points in pending])
+
+    entries = []
+    for index, item, points in pending:
+        submission_model = submissions.get(_parse_uuid(item["submission_uuid"]))
+        if submission_model is None:
+            results[index]["error"] = f"No submission matching uuid {item['submission_uuid']}"
+            continue
+        entries.append((index, item, submission_model, points))
+
+    if not entries:
+        return results
+
+    try:
+        saved = _save_scores_in_bulk(entries)
+    except DatabaseError as error:
+        if len(entries) == 1:
+            logger.exception("Error occurred while setting a score in bulk")
+            results[entries[0][0]]["error"] = f"Could not save score: {error}"
+            return results
+        # Isolate the items that cannot be saved by retrying them one at a time
+        logger.exception("Error occurred while setting %s scores in bulk, retrying them one by one", len(entries))
+        saved = []
+        for entry in entries:
+            try:
+                saved.extend(_save_scores_in_bulk([entry]))
+            except DatabaseError as item_error:
+                logger.exception("Error occurred while setting score for submission %s", entry[2].uuid)
+                results[entry[0]]["error"] = f"Could not save score: {item_error}"
+
+    if not saved:
+        return results
+    score_models = [score_model for _index, score_model in saved]
+    for score_model in score_models:
+        _log_score(score_model)
+    mark_recent_writes(
+        {score_model.student_item_id for score_model in score_models},
+        [score_model.submission.uuid for score_model in score_models],
+    )
+    _invalidate_score_statistics({score_model.student_item for score_model in score_models})
+    for index, _score_model in saved:
+        results[index]["success"] = True
+    return results
+
+
+def _save_scores_in_bulk(entries):
+    """
+    Save the scores of validated `set_scores_bulk` items, with their annotations, in one transaction.
+
+    Args:
+        entries (list of tuple): (index, item, submission model, (points_earned, points_possible)).
+
+    Returns:
+        list of tuple: (index, saved Score) for each entry.
+
+    Raises:
+        DatabaseError: None of the scores could be saved.
+    """
+    saved = []
+    annotations = []
+    for index, item, submission_model, (points_earned, points_possible) in entries:
+        score_model = Score(
+            student_item=submission_model.student_item,
+            submission=submission_model,
+            points_earned=points_earned,
+            points_possible=points_possible,
+        )
+        saved.append((index, score_model))
+        if item.get("annotation_creator") is not None:
+            annotations.append(ScoreAnnotation(
+                score=score_model,
+                creator=item["annotation_creator"],
+                annotation_type=item.get("annotation_type"),
+                reason=item.get("annotation_reason"),
+            ))
+    score_models = [score_model for _index, score_model in saved]
+
+    with transaction.atomic():
+        _create_scores(score_models)
+        ScoreAnnotation.objects.bulk_create(annotations)
+        transaction.on_commit(lambda: _send_score_set_signals(score_models))
+    return saved
+
+
+# pylint: disable=too-many-positional-arguments
+def set_score_for_submissions(submission_models, points_earned, points_possible,
+                              annotation_creator=None, annotation_type=None, annotation_reason=None):
+    """
+    Set the same score for several submissions, such as the members of a team, in one transaction.
+
+    The scores are inserted and their score summaries updated set-wise, along
+    with their annotations, and the `score_set` signals are sent once the
+    transaction has committed.  Either all of the scores are set or none is.
+
+    Args:
+        submission_models (list of Submission): The submissions, with their student items.
+        points_earned, points_possible, annotation_creator, annotation_type, annotation_reason: See `set_score`.
+
+    Raises:
+        SubmissionInternalError: The points are invalid, or the scores could not be saved.
+    """
+    points_field = IntegerField(min_value=0)
+    try:
+        points_earned = points_field.run_validation(points_earned)
+        points_possible = points_field.run_validation(points_possible)
+    except ValidationError as error:
+        logger.exception(error.detail)
+        raise SubmissionInternalError(error.detail) from error
+
+    score_models = [
+        Score(
+            student_item=submission_model.student_item,
+            submission=submission_model,
+            points_earned=points_earned,
+            points_possible=points_possible,
+        )
+        for submission_model in submission_models
+    ]
+    if not score_models:
+        return
+
+    try:
+        with transaction.atomic():
+            _create_scores(score_models)
+            for score_model in score_models:
+                _log_score(score_model)
+            if annotation_creator is not None:
+                ScoreAnnotation.objects.bulk_create([
+                    ScoreAnnotation(
+                        score=score_model,
+                        creator=annotation_creator,
+                        annotation_type=annotation_type,
+                        reason=annotation_reason,
+                    )
+                    for score_model in score_models
+                ])
+            transaction.on_commit(lambda: _send_score_set_signals(score_models))
+    except DatabaseError as error:
+        error_message = f"Could not save scores for submissions {[sub.uuid for sub in submission_models]}"
+        logger.exception(error_message)
+        raise SubmissionInternalError(error_message) from error
+
+    mark_recent_writes(
+        {score_model.student_item_id for score_model in score_models},
+        [score_model.submission.uuid for score_model in score_models],
+    )
+    _invalidate_score_statistics({score_model.student_item for score_model in score_models})
+
+
+def _parse_uuid(value):
+    """
+    Return ``value`` as a UUID, or None if it is not a valid uuid.
+    """
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return None
+
+
+def get_submission_models_by_uuid(submission_uuids):
+    """
+    Look up several submissions, with their student items, in one query.
+
+    Returns:
+        dict: Submission models keyed by UUID. Unknown or malformed uuids are left out.
+    """
+    uuids = {_parse_uuid(submission_uuid) for submission_uuid in submission_uuids} - {None}
+    found = {
+        submission.uuid: submission
+        for submission in Submission.objects.select_related('student_item').filter(uuid__in=list(uuids))
+    }
+    # Fall back to the slow lookup for uuids that may be stored with hyphens (EDUCATOR-1090)
+    for missing_uuid in uuids - set(found):
+        try:
+            found[missing_uuid] = _get_submission_model(str(missing_uuid))
+        except Submission.DoesNotExist:
+            pass
+    return found
+
+
+def _create_scores(score_models):
+    """
+    Insert new scores in one statement and update their student items' summaries set-wise.
+
+    The scores of a batch share their creation time.  Where the database does
+    not return the ids of bulk-inserted rows (MySQL), they are read back by
+    student item and creation time, which reset scores (without a submission)
+    also have: the rows inserted by one statement get increasing ids, in
+    insertion order.  Should be called inside a transaction.
+
+    Raises:
+        DatabaseError: The scores could not be saved, or their ids could not be read back.
+    """
+    using = router.db_for_write(Score)
+    created_at = now()
+    for score_model in score_models:
+        # bulk_create does not call Score.save, which fills in the normalized score
+        score_model.normalized_score = score_model.to_float()
+        score_model.created_at = created_at
+    Score.objects.using(using).bulk_create(score_models)
+    if not connections[using].features.can_return_rows_from_bulk_insert:
+        score_ids = defaultdict(list)
+        for score_id, student_item_id in Score.objects.using(using).filter(
+            student_item_id__in={score_model.student_item_id for score_model in score_models},
+            created_at=created_at,
+        ).order_by('id').values_list('id', 'student_item_id'):
+            score_ids[student_item_id].append(score_id)
+        for score_model in score_models:
+            if not score_ids[score_model.student_item_id]:
+                raise DatabaseError(f"Could not read back the id of the score of {score_model.student_item}")
+            score_model.id = score_ids[score_model.student_item_id].pop(0)
+    ScoreSummary.update_for_scores(score_models)
+
+
+def _send_score_set_signals(score_models):
+    """
+    Send the `score_set` signal for each of the given scores.
+    """
+    for score_model in score_models:
+        send_score_signal(
+            score_set,
+            points_possible=score_model.points_possible,
+            points_earned=score_model.points_earned,
+            anonymous_user_id=score_model.student_item.student_id,
+            course_id=score_model.student_item.course_id,
+            item_id=score_model.student_item.item_id,
+            created_at=score_model.created_at,
+        )
+
+
+def _get_top_submissions_cache_key(course_id, item_id, item_type, number_of_top_scores, generation):
+    return f"submissions.top_submissions.{course_id}.{item_id}.{item_type}.{generation}.{number_of_top_scores}"
+
+
+def _get_top_submissions_generation_key(course_id, item_id, item_type):
+    return f"submissions.top_submissions_generation.{course_id}.{item_id}.{item_type}"
+
+
+def invalidate_top_submissions(course_id, item_id, item_types):
+    """
+    Invalidate every cached `get_top_submissions` result of an item, whatever its number of top scores.
+    """
+    for item_type in item_types:
+        caching.bump_generation(_get_top_submissions_generation_key(course_id, item_id, item_type))
+
+
+def _send_score_reset_signals(reset_scores):
+    """
+    Send the `score_reset` signal for each of the given reset scores.
+    """
+    for score_model in reset_scores:
+        send_score_signal(
+            score_reset,
+            anonymous_user_id=score_model.student_item.student_id,
+            course_id=score_model.student_item.course_id,
+            item_id=score_model.student_item.item_id,
+            created_at=score_model.created_at,
+        )
+
+
 def _log_submission(submission, student_item):
     """
     Log the creation of a submission.
@@ -1086,19 +1922,99 @@ def _get_or_create_student_item(student_item_dict):
         raise SubmissionInternalError(error_message) from error
 
 
-def _use_read_replica(queryset):
+def _get_or_create_student_items(base_student_item_dict, student_ids):
+    """Gets or creates the Student Items of several students for the same item.
+
+    Batch form of `_get_or_create_student_item`: the existing student items are
+    fetched with one query, and the missing ones are validated and created
+    with one more.
+
+    Args:
+        base_student_item_dict (dict): The course_id, item_id and item_type of the student items.
+        student_ids (list of str): The students whose student items to get or create.
+
+    Returns:
+        dict: The StudentItem of each student, keyed by student_id.
+
+    Raises:
+        SubmissionInternalError: Thrown if there was an internal error while
+            attempting to create or retrieve the student items.
+        SubmissionRequestError: Thrown if the parameters of a student item fail
+            validation.
     """
-    Use the read replica if it's available.
+    try:
+        student_items = {
+            student_item.student_id: student_item
+            for student_item in StudentItem.objects.filter(student_id__in=student_ids, **base_student_item_dict)
+        }
+        missing_student_ids = [student_id for student_id in student_ids if student_id not in student_items]
+        if not missing_student_ids:
+            return student_items
+
+        new_student_items = []
+        for student_id in missing_student_ids:
+            student_item_dict = dict(base_student_item_dict, student_id=student_id)
+            student_item_serializer = StudentItemSerializer(data=student_item_dict)
+            # Uniqueness is left to the insert below rather than checked with a query per student
+            student_item_serializer.validators = []
+            if not student_item_serializer.is_valid():
+                logger.error(
+                    "Invalid StudentItemSerializer: errors:%(errors)s data:%(data)s",
+                    {
+                        'errors': student_item_serializer.errors,
+                        'data': student_item_dict,
+                    }
+                )
+                raise SubmissionRequestError(field_errors=student_item_serializer.errors)
+            new_student_items.append(StudentItem(**student_item_serializer.validated_data))
+
+        # Concurrent calls may have created some of these student items since the lookup above,
+        # so skip the conflicting rows and load them back along with the ones created here.
+        StudentItem.objects.bulk_create(new_student_items, ignore_conflicts=True)
+        student_items.update(
+            (student_item.student_id, student_item)
+            for student_item in StudentItem.objects.filter(
+                student_id__in=missing_student_ids, **base_student_item_dict
+            )
+        )
+        missing_student_ids = [student_id for student_id in student_ids if student_id not in student_items]
+        if missing_student_ids:
+            raise IntegrityError(f"Could not create student items for students {missing_student_ids}")
+        return student_items
+    except DatabaseError as error:
+        error_message = f"An error occurred creating student items for {student_ids}: {base_student_item_dict}"
+        logger.exception(error_message)
+        raise SubmissionInternalError(error_message) from error
+
+
+def _use_read_replica(queryset, student_item_id=None, submission_uuid=None):
+    """
+    Use a read replica if one is available.
+
+    The replica is chosen by the configured read replica router, which skips
+    replicas that are lagging too far behind; if none is usable, the queryset
+    is left on the default database.
+
+    If the query is about a student item or submission that was written within
+    the read-your-writes window, it also stays on the default database, so that
+    a learner always sees their own recent submissions and scores.
 
     Args:
         queryset (QuerySet)
 
+    Kwargs:
+        student_item_id (int): The student item the query is about, if known.
+        submission_uuid (str): The submission the query is about, if known.
+
     Returns:
         QuerySet
 
     """
+    if has_recent_write(student_item_id, submission_uuid):
+        return queryset
+    alias = get_router().db_for_read()
     return (
-        queryset.using("read_replica")
-        if "read_replica" in settings.DATABASES
+        queryset.using(alias)
+        if alias != DEFAULT_DB_ALIAS
         else queryset
     )
@@ -0,0 +1,475 @@
+"""
+Cache helpers for the submissions app.
+
+Submissions are immutable, so their serialized form (and that of the student
+item they belong to) can be kept in a small per-process LRU tier in front of
+the shared Django cache.  A hit in the local tier avoids the network round trip
+to the cache server, and the unpickling of the payload: entries are kept in a
+frozen form, from which every hit builds fresh dicts and lists around the
+shared immutable values.  So, like the shared cache, it returns a copy of the
+payload that callers may mutate.
+
+The local tier is disabled unless ``settings.SUBMISSIONS_LOCAL_CACHE_SIZE`` is
+set to a positive number of entries.  Entries expire after
+``settings.SUBMISSIONS_LOCAL_CACHE_TTL`` seconds (60 by default).  Deleting a
+key through this module removes it from the local tier of the current process
+only, so the TTL bounds how long another process can keep serving a submission
+that has since been soft-deleted.
+
+Payloads written to the shared cache can also be stored in a compact binary
+form (see ``CacheCodec``): a versioned tuple without the repeated dict keys,
+with uuids packed into 16 bytes and datetimes into integers, optionally
+zlib-compressed.  Encoded entries live under their own key (suffixed with the
+schema version), so processes running an older version never read a payload
+they cannot decode.  Compact encoding is on unless
+``settings.SUBMISSIONS_CACHE_COMPACT_ENCODING`` is False; payloads larger than
+``settings.SUBMISSIONS_CACHE_COMPRESSION_THRESHOLD`` bytes (1024 by default,
+None to disable) are compressed.
+"""
+
+import datetime
+import decimal
+import logging
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from types import MappingProxyType
+from uuid import UUID, uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_CACHE_TTL = 60
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+# Bump whenever the layout of an encoded tuple changes.
+CODEC_SCHEMA_VERSION = 1
+
+_RAW = b'\x00'
+_ZLIB = b'\x01'
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo=datetime.timezone.utc)
+
+
+# Values that the local tier shares between hits
+_IMMUTABLE_TYPES = (
+    str, bytes, int, float, bool, type(None), decimal.Decimal, UUID,
+    datetime.datetime, datetime.date, datetime.time, datetime.timedelta,
+)
+
+
+class _FrozenList(tuple):
+    """
+    A list, as stored in the local tier.
+    """
+
+
+class _Pickled(bytes):
+    """
+    A value of another type, pickled, as stored in the local tier.
+    """
+
+
+def _freeze(value):
+    """
+    Return an immutable representation of ``value``, to be turned back into a copy of it by ``_thaw``.
+    """
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return value
+    value_type = type(value)
+    if value_type is dict:
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if value_type is list:
+        return _FrozenList(_freeze(item) for item in value)
+    if value_type is tuple:
+        return tuple(_freeze(item) for item in value)
+    return _Pickled(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _thaw(value):
+    """
+    Return a copy of the value frozen by ``_freeze``, with new dicts and lists but shared immutable values.
+    """
+    value_type = type(value)
+    if value_type is MappingProxyType:
+        return {key: _thaw(item) for key, item in value.items()}
+    if value_type is _FrozenList:
+        return [_thaw(item) for item in value]
+    if value_type is tuple:
+        return tuple(_thaw(item) for item in value)
+    if value_type is _Pickled:
+        return pickle.loads(value)
+    return value
+
+
+class LocalLRUCache:
+    """
+    A thread-safe, size-bounded and TTL-bounded LRU cache.
+
+    Values are stored frozen, and every hit returns a copy with its own dicts
+    and lists, so, as with the shared cache, callers may mutate a returned
+    value (including its nested dicts) without affecting the cached entry.
+    Dicts, lists, tuples and immutable scalars are copied without pickling;
+    values of other types are pickled.
+    """
+
+    def __init__(self, max_size, ttl=DEFAULT_LOCAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Return the cached value for ``key``, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _thaw(value)
+
+    def set(self, key, value):
+        """
+        Store ``value`` under ``key``, evicting the least recently used entries beyond ``max_size``.
+        """
+        value = _freeze(value)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return a dict of hit, miss, eviction and expiration counts, and the current size.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._entries),
+            }
+
+
+def _pack_uuid(value):
+    return None if value is None else UUID(str(value)).bytes
+
+
+def _pack_datetime(value):
+    """
+    Pack a datetime into integer microseconds since the epoch.
+    """
+    if value is None:
+        return None
+    epoch = _EPOCH_UTC if value.tzinfo is not None else _EPOCH
+    return (value - epoch) // datetime.timedelta(microseconds=1)
+
+
+def _unpack_datetime(value):
+    """
+    Datetimes come back the way the database returns them: in UTC if time zone support is on, naive otherwise.
+    """
+    if value is None:
+        return None
+    epoch = _EPOCH_UTC if settings.USE_TZ else _EPOCH
+    return epoch + datetime.timedelta(microseconds=value)
+
+
+class CacheCodec:
+    """
+    Converts a cached payload to and from compact bytes.
+
+    Subclasses implement ``pack`` (payload to tuple) and ``unpack`` (tuple to
+    payload).  The tuple is prefixed with ``CODEC_SCHEMA_VERSION``, pickled,
+    and compressed when it is larger than the configured threshold.
+    """
+
+    def pack(self, value):
+        raise NotImplementedError
+
+    def unpack(self, fields):
+        raise NotImplementedError
+
+    def encode(self, value):
+        """
+        Return ``value`` as compact bytes.
+        """
+        data = pickle.dumps((CODEC_SCHEMA_VERSION,) + self.pack(value), protocol=pickle.HIGHEST_PROTOCOL)
+        threshold = getattr(settings, 'SUBMISSIONS_CACHE_COMPRESSION_THRESHOLD', DEFAULT_COMPRESSION_THRESHOLD)
+        if threshold is not None and len(data) > threshold:
+            return _ZLIB + zlib.compress(data)
+        return _RAW + data
+
+    def decode(self, data):
+        """
+        Return the decoded payload, or None if ``data`` cannot be decoded by this version of the codec.
+
+        Values that are not bytes were written without encoding and are returned unchanged.
+        """
+        if not isinstance(data, bytes):
+            return data
+        try:
+            header, body = data[:1], data[1:]
+            if header == _ZLIB:
+                body = zlib.decompress(body)
+            elif header != _RAW:
+                return None
+            fields = pickle.loads(body)
+        except (zlib.error, pickle.UnpicklingError, EOFError, ValueError):
+            logger.exception("Could not decode cached payload")
+            return None
+        if not fields or fields[0] != CODEC_SCHEMA_VERSION:
+            return None
+        return self.unpack(fields[1:])
+
+
+class SubmissionCodec(CacheCodec):
+    """
+    Codec for serialized submissions, as returned by ``api.get_submission``.
+    """
+
+    def pack(self, value):
+        return (
+            _pack_uuid(value['uuid']),
+            value['student_item'],
+            value['attempt_number'],
+            _pack_datetime(value['submitted_at']),
+            _pack_datetime(value['created_at']),
+            value['answer'],
+            _pack_uuid(value['team_submission_uuid']),
+        )
+
+    def unpack(self, fields):
+        uuid, student_item, attempt_number, submitted_at, created_at, answer, team_submission_uuid = fields
+        return {
+            'uuid': str(UUID(bytes=uuid)),
+            'student_item': student_item,
+            'attempt_number': attempt_number,
+            'submitted_at': _unpack_datetime(submitted_at),
+            'created_at': _unpack_datetime(created_at),
+            'answer': answer,
+            'team_submission_uuid': None if team_submission_uuid is None else UUID(bytes=team_submission_uuid),
+        }
+
+
+class StudentItemCodec(CacheCodec):
+    """
+    Codec for serialized student items.
+    """
+
+    def pack(self, value):
+        return (value['student_id'], value['course_id'], value['item_id'], value['item_type'])
+
+    def unpack(self, fields):
+        student_id, course_id, item_id, item_type = fields
+        return {
+            'student_id': student_id,
+            'course_id': course_id,
+            'item_id': item_id,
+            'item_type': item_type,
+        }
+
+
+class TeamSubmissionCodec(CacheCodec):
+    """
+    Codec for serialized team submissions, as returned by ``team_api.get_team_submission``.
+    """
+
+    def pack(self, value):
+        return (
+            _pack_uuid(value['team_submission_uuid']),
+            value['attempt_number'],
+            _pack_datetime(value['submitted_at']),
+            value['course_id'],
+            value['item_id'],
+            value['team_id'],
+            value['submitted_by'],
+            _pack_datetime(value['created_at']),
+            value['answer'],
+            tuple(_pack_uuid(submission_uuid) for submission_uuid in value['submission_uuids']),
+        )
+
+    def unpack(self, fields):
+        (
+            team_submission_uuid, attempt_number, submitted_at, course_id, item_id, team_id,
+            submitted_by, created_at, answer, submission_uuids,
+        ) = fields
+        return {
+            'team_submission_uuid': str(UUID(bytes=team_submission_uuid)),
+            'attempt_number': attempt_number,
+            'submitted_at': _unpack_datetime(submitted_at),
+            'course_id': course_id,
+            'item_id': item_id,
+            'team_id': team_id,
+            'submitted_by': submitted_by,
+            'created_at': _unpack_datetime(created_at),
+            'answer': answer,
+            'submission_uuids': [UUID(bytes=submission_uuid) for submission_uuid in submission_uuids],
+        }
+
+
+class TopSubmissionsCodec(CacheCodec):
+    """
+    Codec for the lists returned by ``api.get_top_submissions``.
+    """
+
+    def pack(self, value):
+        return tuple((entry['score'], entry['content']) for entry in value)
+
+    def unpack(self, fields):
+        return [{'score': score, 'content': content} for score, content in fields]
+
+
+SUBMISSION_CODEC = SubmissionCodec()
+STUDENT_ITEM_CODEC = StudentItemCodec()
+TEAM_SUBMISSION_CODEC = TeamSubmissionCodec()
+TOP_SUBMISSIONS_CODEC = TopSubmissionsCodec()
+
+
+def _use_codec(codec):
+    return codec is not None and getattr(settings, 'SUBMISSIONS_CACHE_COMPACT_ENCODING', True)
+
+
+def _encoded_key(key):
+    return f"{key}.v{CODEC_SCHEMA_VERSION}"
+
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache():
+    """
+    Return the per-process LRU tier, or None if it is disabled.
+    """
+    global _local_cache  # pylint: disable=global-statement
+    max_size = getattr(settings, 'SUBMISSIONS_LOCAL_CACHE_SIZE', 0)
+    if not max_size:
+        return None
+    if _local_cache is None:
+        with _local_cache_lock:
+            if _local_cache is None:
+                _local_cache = LocalLRUCache(
+                    max_size,
+                    ttl=getattr(settings, 'SUBMISSIONS_LOCAL_CACHE_TTL', DEFAULT_LOCAL_CACHE_TTL),
+                )
+    return _local_cache
+
+
+def local_cache_stats():
+    """
+    Return the statistics of the per-process LRU tier, or None if it is disabled.
+    """
+    local_cache = get_local_cache()
+    return local_cache.stats() if local_cache is not None else None
+
+
+def get(key, codec=None, local=True):
+    """
+    Look ``key`` up in the local tier, then in the shared cache.
+
+    If ``codec`` is given, the shared cache entry is decoded with it.  Shared
+    cache hits are copied into the local tier unless ``local`` is False.  Like
+    ``cache.get``, this may raise if the cache backend fails.
+    """
+    local_cache = get_local_cache() if local else None
+    if local_cache is not None:
+        value = local_cache.get(key)
+        if value is not None:
+            return value
+    if _use_codec(codec):
+        value = codec.decode(cache.get(_encoded_key(key)))
+    else:
+        value = cache.get(key)
+    if value is not None and local_cache is not None:
+        local_cache.set(key, value)
+    return value
+
+
+def set(key, value, timeout=DEFAULT_TIMEOUT, codec=None, local=True):  # pylint: disable=redefined-builtin
+    """
+    Store ``value`` in the shared cache (encoded with ``codec``, if given) and in the local tier.
+    """
+    if _use_codec(codec):
+        cache.set(_encoded_key(key), codec.encode(value), timeout)
+    else:
+        cache.set(key, value, timeout)
+    local_cache = get_local_cache() if local else None
+    if local_cache is not None:
+        local_cache.set(key, value)
+
+
+def delete_many(keys):
+    """
+    Remove ``keys``, in both their plain and encoded forms, from the shared cache and from this process's local tier.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        local_cache.delete_many(keys)
+    cache.delete_many(keys + [_encoded_key(key) for key in keys])
+
+
+def get_generation(key):
+    """
+    Return the current generation stored under ``key`` in the shared cache, creating one if there is none.
+
+    Cache keys that embed a generation are all invalidated at once by
+    ``bump_generation``, however many of them there are.  A missing
+    generation (never set, or evicted) is replaced by a new random one, so
+    that entries from before a bump can never be read again.
+    """
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key):
+    """
+    Replace the generation stored under ``key``, invalidating the cache keys that embed it.
+    """
+    cache.set(key, uuid4().hex, None)
+
+
+@receiver(setting_changed)
+def _reset_local_cache(sender, setting, **kwargs):  # pylint: disable=unused-argument
+    global _local_cache  # pylint: disable=global-statement
+    if setting.startswith('SUBMISSIONS_LOCAL_CACHE'):
+        _local_cache = None
@@ -0,0 +1,221 @@
+"""
+Delivery of the ``score_set`` and ``score_reset`` signals.
+
+By default, the API sends these signals synchronously, as soon as the score
+is written.  Receivers such as grade recalculation then add their latency to
+every grading call.  In "deferred" mode, signals are instead queued once the
+surrounding transaction commits (signals of transactions that roll back are
+never sent).  Repeated signals for the same student item within the coalescing
+window are merged, and only the most recent one is kept.  Queued signals are
+handed to an executor in batches.
+
+Settings:
+
+    SUBMISSIONS_SIGNAL_DISPATCH: "sync" (default) or "deferred".
+    SUBMISSIONS_SIGNAL_COALESCE_WINDOW: Number of seconds to hold queued
+        signals before delivering them.  Defaults to 0: each signal is
+        delivered as soon as its transaction commits, without coalescing.
+    SUBMISSIONS_SIGNAL_BATCH_SIZE: Deliver as soon as this many distinct
+        signals are queued, without waiting for the window.  Defaults to 100.
+    SUBMISSIONS_SIGNAL_EXECUTOR: Dotted path to a callable returning an object
+        with a ``submit(fn, *args)`` method, such as a
+        ``concurrent.futures.Executor``.  Defaults to a single background
+        thread.  ``submissions.dispatch.InlineExecutor`` delivers in the
+        calling thread, which is convenient in tests.
+
+In deferred mode, receivers run outside of the request, so exceptions they
+raise are logged instead of propagating to the API caller.  Before and after
+each batch, the worker drops its database connections that are unusable or
+older than ``CONN_MAX_AGE``, as Django does around requests.  Signals still
+queued when the process exits normally are delivered by an ``atexit``
+handler; those of a process that is killed are lost.
+"""
+
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SYNC = 'sync'
+DEFERRED = 'deferred'
+
+DEFAULT_COALESCE_WINDOW = 0
+DEFAULT_BATCH_SIZE = 100
+
+
+class InlineExecutor:
+    """
+    Executor that runs submitted functions immediately, in the calling thread.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+def default_executor():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='submissions-signals')
+
+
+class SignalDispatcher:
+    """
+    Sends score signals, either right away or deferred, coalesced and batched.
+
+    Signals are coalesced on the signal and the (anonymous_user_id, course_id,
+    item_id) of the student item they are about.
+    """
+
+    def __init__(self, mode=SYNC, *, executor=None, window=DEFAULT_COALESCE_WINDOW, batch_size=DEFAULT_BATCH_SIZE):
+        if mode not in (SYNC, DEFERRED):
+            raise ValueError(f"Unknown signal dispatch mode: {mode}")
+        self.mode = mode
+        self.executor = executor
+        self.window = window
+        self.batch_size = batch_size
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def send(self, signal, **kwargs):
+        """
+        Send ``signal`` with ``kwargs``, or queue it once the current transaction commits.
+        """
+        if self.mode == SYNC:
+            signal.send(sender=None, **kwargs)
+        else:
+            transaction.on_commit(lambda: self._enqueue(signal, kwargs))
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, inline=False):
+        """
+        Hand all queued signals to the executor as one batch.
+
+        With ``inline``, deliver them in the calling thread instead, as when
+        the executor no longer accepts work at interpreter shutdown.
+        """
+        with self._lock:
+            batch = list(self._pending.values())
+            self._pending.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if batch and inline:
+            self._deliver(batch)
+        elif batch:
+            self._get_executor().submit(self._deliver, batch)
+
+    def _enqueue(self, signal, kwargs):
+        """
+        Queue a signal, replacing any queued signal for the same student item.
+        """
+        key = (signal, kwargs.get('anonymous_user_id'), kwargs.get('course_id'), kwargs.get('item_id'))
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = (signal, kwargs)
+            flush_now = not self.window or len(self._pending) >= self.batch_size
+            if not flush_now and self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+
+    def _get_executor(self):
+        """
+        Return the executor, building the configured one on first use.
+        """
+        if self.executor is None:
+            self.executor = import_string(
+                getattr(settings, 'SUBMISSIONS_SIGNAL_EXECUTOR', 'submissions.dispatch.default_executor')
+            )()
+        return self.executor
+
+    @staticmethod
+    def _deliver(batch):
+        """
+        Send each signal of ``batch``, logging the exceptions raised by receivers.
+        """
+        _close_old_connections()
+        try:
+            for signal, kwargs in batch:
+                for receiver_func, response in signal.send_robust(sender=None, **kwargs):
+                    if isinstance(response, Exception):
+                        logger.error(
+                            "Score signal receiver %s failed",
+                            receiver_func,
+                            exc_info=(type(response), response, response.__traceback__),
+                        )
+        finally:
+            _close_old_connections()
+
+
+def _close_old_connections():
+    """
+    Close the database connections of this thread that are unusable or past their maximum age.
+
+    Like ``django.db.close_old_connections``, except that connections inside a
+    transaction are left alone, since an executor may deliver in the thread
+    of the caller.
+    """
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    """
+    Return the process-wide signal dispatcher, building it from settings on first use.
+    """
+    global _dispatcher  # pylint: disable=global-statement
+    if _dispatcher is None:
+        _dispatcher = SignalDispatcher(
+            getattr(settings, 'SUBMISSIONS_SIGNAL_DISPATCH', SYNC),
+            window=getattr(settings, 'SUBMISSIONS_SIGNAL_COALESCE_WINDOW', DEFAULT_COALESCE_WINDOW),
+            batch_size=getattr(settings, 'SUBMISSIONS_SIGNAL_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+        )
+    return _dispatcher
+
+
+def set_dispatcher(dispatcher):
+    """
+    Replace the process-wide dispatcher (or pass None to rebuild it from settings).
+    """
+    global _dispatcher  # pylint: disable=global-statement
+    _dispatcher = dispatcher
+
+
+def send_score_signal(signal, **kwargs):
+    """
+    Send ``signal`` through the process-wide dispatcher.
+    """
+    get_dispatcher().send(signal, **kwargs)
+
+
+@atexit.register
+def _flush_at_exit():
+    """
+    Deliver the signals still queued when the process exits.
+    """
+    if _dispatcher is not None:
+        _dispatcher.flush(inline=True)
+
+
+@receiver(setting_changed)
+def _reset_dispatcher(sender, setting, **kwargs):  # pylint: disable=unused-argument
+    global _dispatcher  # pylint: disable=global-statement
+    if setting.startswith('SUBMISSIONS_SIGNAL'):
+        _dispatcher = None
@@ -0,0 +1,100 @@
+"""
+Command to move superseded scores out of the Score table and into ArchivedScore.
+
+Score rows are never updated, so every rescore and reset adds to the table.
+Only the scores that score summaries point at, and the latest score for each
+submission, are read on hot paths; the others can be archived.  Archived
+scores are still returned by ``api.get_score_history``.
+
+Scores are archived in chunks of increasing id, one transaction per chunk, so
+the command can be stopped and restarted at any time.
+"""
+
+
+import logging
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import is_naive, make_aware, now
+
+from submissions.models import ArchivedScore, Score
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Example usage: ./manage.py lms --settings=devstack archive_scores --days 365 --chunk 5000
+    """
+    help = 'Moves scores that were superseded before a cutoff date into the score archive.'
+
+    def add_arguments(self, parser):
+        """
+        Add arguments to the command parser.
+
+        Uses argparse syntax.  See documentation at
+        https://docs.python.org/3/library/argparse.html.
+        """
+        parser.add_argument(
+            '--days', '-d',
+            default=90,
+            type=int,
+            help="Archive scores created more than this many days ago. Default 90.",
+        )
+        parser.add_argument(
+            '--before', '-b',
+            help="Archive scores created before this date (ISO 8601). Overrides --days.",
+        )
+        parser.add_argument(
+            '--chunk', '-c',
+            default=1000,
+            type=int,
+            help="Batch size, how many scores to archive in a given transaction. Default 1000.",
+        )
+        parser.add_argument(
+            '--wait', '-w',
+            default=0,
+            type=float,
+            help="Wait time between transactions, in seconds. Default 0.",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report how many scores would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = self._get_cutoff(options)
+
+        if options['dry_run']:
+            count = Score.archivable(cutoff).count()
+            self.stdout.write(f"{count} scores created before {cutoff.isoformat()} would be archived")
+            return
+
+        log.info("Archiving scores superseded before %s", cutoff.isoformat())
+        last_id = 0
+        total = 0
+        while True:
+            archived_ids = ArchivedScore.archive_scores(cutoff, after_id=last_id, limit=options['chunk'])
+            if not archived_ids:
+                break
+            total += len(archived_ids)
+            last_id = archived_ids[-1]
+            log.info("Archived %s scores up to Score.id %s", len(archived_ids), last_id)
+            if options['wait']:
+                time.sleep(options['wait'])
+
+        self.stdout.write(f"Archived {total} scores")
+
+    def _get_cutoff(self, options):
+        """
+        Return the cutoff datetime from the --before or --days option.
+        """
+        if options['before'] is None:
+            return now() - timedelta(days=options['days'])
+        try:
+            cutoff = datetime.fromisoformat(options['before'])
+        except ValueError as error:
+            raise CommandError(f"Invalid --before date: {options['before']}") from error
+        return make_aware(cutoff) if is_naive(cutoff) else cutoff
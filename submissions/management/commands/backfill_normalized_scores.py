@@ -0,0 +1,77 @@
+"""
+Command to fill in Score.normalized_score for scores written before the field existed.
+
+Scores are updated in chunks of consecutive ids, one UPDATE statement per
+chunk, so the command can run against a live database.  It can be stopped and
+restarted at any time: rows that already have a normalized score are skipped.
+"""
+
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from submissions.models import Score
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Example usage: ./manage.py lms --settings=devstack backfill_normalized_scores --chunk 5000
+    """
+    help = 'Stores points_earned / points_possible on all Scores that do not have a normalized score yet.'
+
+    def add_arguments(self, parser):
+        """
+        Add arguments to the command parser.
+
+        Uses argparse syntax.  See documentation at
+        https://docs.python.org/3/library/argparse.html.
+        """
+        parser.add_argument(
+            '--start', '-s',
+            default=0,
+            type=int,
+            help="The Score.id at which to begin updating rows. 0 by default."
+        )
+        parser.add_argument(
+            '--chunk', '-c',
+            default=1000,
+            type=int,
+            help="Batch size, how many rows to update in a given transaction. Default 1000.",
+        )
+        parser.add_argument(
+            '--wait', '-w',
+            default=0,
+            type=float,
+            help="Wait time between transactions, in seconds. Default 0.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Walk the scores missing a normalized score in id order, one chunk at a time.
+        """
+        pending = Score.objects.filter(normalized_score__isnull=True, points_possible__gt=0)
+        last_id = options['start'] - 1
+        total = 0
+        log.info("Beginning normalized score backfill")
+
+        while True:
+            ids = list(pending.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['chunk']])
+            if not ids:
+                break
+            with transaction.atomic():
+                total += Score.objects.filter(id__in=ids, normalized_score__isnull=True).update(
+                    normalized_score=Cast('points_earned', FloatField()) / F('points_possible'),
+                )
+            last_id = ids[-1]
+            log.info("Backfilled normalized scores up to Score.id %s", last_id)
+            if options['wait']:
+                time.sleep(options['wait'])
+
+        log.info("Finished normalized score backfill, %s scores updated", total)
@@ -0,0 +1,70 @@
+"""
+Command to return the external grader submissions whose lease expired to their queue.
+
+A submission pulled by an external grader carries a lease.  When the grader
+crashes or gives up without retiring or failing the submission, nothing else
+moves it out of 'pulled'.  This command moves the submissions whose lease
+expired back to 'pending', in chunks, one transaction per chunk, so that
+other graders can pull them.  It is meant to be run periodically.
+"""
+
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from submissions.models import ExternalGraderDetail
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Example usage: ./manage.py lms --settings=devstack reap_expired_grader_leases --chunk 500
+    """
+    help = 'Returns the pulled external grader submissions whose lease expired to their queue.'
+
+    def add_arguments(self, parser):
+        """
+        Add arguments to the command parser.
+
+        Uses argparse syntax.  See documentation at
+        https://docs.python.org/3/library/argparse.html.
+        """
+        parser.add_argument(
+            '--chunk', '-c',
+            default=1000,
+            type=int,
+            help="Batch size, how many submissions to return in a given transaction. Default 1000.",
+        )
+        parser.add_argument(
+            '--wait', '-w',
+            default=0,
+            type=float,
+            help="Wait time between transactions, in seconds. Default 0.",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report how many submissions have an expired lease.",
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = ExternalGraderDetail.objects.expired_leases().count()
+            self.stdout.write(f"{count} submissions would be returned to their queue")
+            return
+
+        total = 0
+        while True:
+            reaped = ExternalGraderDetail.objects.reap_expired_leases(limit=options['chunk'])
+            total += reaped
+            if reaped:
+                log.info("Returned %s submissions with an expired lease to their queue", reaped)
+            if reaped < options['chunk']:
+                break
+            if options['wait']:
+                time.sleep(options['wait'])
+
+        self.stdout.write(f"Returned {total} submissions to their queue")
@@ -0,0 +1,137 @@
+"""
+Command to recompute ScoreSummary.highest and ScoreSummary.latest from the Score history.
+
+Summaries are updated by a post_save receiver that logs and swallows database
+errors, so that the score itself is saved.  When that happens, the summary no
+longer reflects the scores.  This command goes over the student items in chunks
+of increasing id and repairs the summaries that differ, one transaction per
+chunk.  With --dry-run, it only prints the differences.
+
+Id ranges can be split across several processes with --processes.
+"""
+
+
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max
+
+from submissions import api as sub_api
+from submissions.models import StudentItem
+
+log = logging.getLogger(__name__)
+
+
+def rebuild_range(start, end, chunk, wait, dry_run):
+    """
+    Rebuild the summaries of the student items with an id in [start, end].
+
+    Returns:
+        list of dict: The differences found, as returned by ``api.rebuild_score_summaries``.
+    """
+    differences = []
+    last_id = start - 1
+    while True:
+        student_item_ids = list(
+            StudentItem.objects.filter(id__gt=last_id, id__lte=end).order_by('id').values_list('id', flat=True)[:chunk]
+        )
+        if not student_item_ids:
+            break
+        log.info("Rebuilding score summaries of student items %s to %s", student_item_ids[0], student_item_ids[-1])
+        differences.extend(sub_api.rebuild_score_summaries(student_item_ids, dry_run=dry_run))
+        last_id = student_item_ids[-1]
+        if wait:
+            time.sleep(wait)
+    return differences
+
+
+def split_range(start, end, parts):
+    """
+    Split [start, end] into at most ``parts`` contiguous ranges of similar size.
+    """
+    size = max(1, -(-(end - start + 1) // parts))
+    return [(lower, min(lower + size - 1, end)) for lower in range(start, end + 1, size)]
+
+
+class Command(BaseCommand):
+    """
+    Example usage: ./manage.py lms --settings=devstack rebuild_score_summaries --dry-run
+    """
+    help = 'Recomputes the highest and latest scores of ScoreSummaries from the Score history.'
+
+    def add_arguments(self, parser):
+        """
+        Add arguments to the command parser.
+
+        Uses argparse syntax.  See documentation at
+        https://docs.python.org/3/library/argparse.html.
+        """
+        parser.add_argument(
+            '--start', '-s',
+            default=1,
+            type=int,
+            help="The StudentItem.id at which to begin. 1 by default."
+        )
+        parser.add_argument(
+            '--end', '-e',
+            type=int,
+            help="The StudentItem.id at which to stop. The highest id by default."
+        )
+        parser.add_argument(
+            '--chunk', '-c',
+            default=1000,
+            type=int,
+            help="Batch size, how many student items to rebuild in a given transaction. Default 1000.",
+        )
+        parser.add_argument(
+            '--wait', '-w',
+            default=2,
+            type=float,
+            help="Wait time between transactions, in seconds. Default 2.",
+        )
+        parser.add_argument(
+            '--processes', '-p',
+            default=1,
+            type=int,
+            help="Number of processes to split the id range across. Default 1.",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only print the summaries that differ from the score history.",
+        )
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError("--processes must be at least 1")
+        end = options['end']
+        if end is None:
+            end = StudentItem.objects.aggregate(Max('id'))['id__max'] or 0
+        ranges = split_range(options['start'], end, options['processes']) if end >= options['start'] else []
+        range_args = [
+            (lower, upper, options['chunk'], options['wait'], options['dry_run'])
+            for lower, upper in ranges
+        ]
+
+        if len(range_args) <= 1:
+            differences = [difference for args in range_args for difference in rebuild_range(*args)]
+        else:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=len(range_args), mp_context=multiprocessing.get_context('fork')
+            ) as executor:
+                results = executor.map(rebuild_range, *zip(*range_args))
+                differences = [difference for result in results for difference in result]
+
+        for difference in differences:
+            self.stdout.write(
+                "student item {student_item_id}: highest {highest[0]} -> {highest[1]}, "
+                "latest {latest[0]} -> {latest[1]}".format(**difference)
+            )
+        verb = "would be rebuilt" if options['dry_run'] else "rebuilt"
+        self.stdout.write(f"{len(differences)} score summaries {verb}")
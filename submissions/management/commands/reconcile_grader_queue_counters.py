@@ -0,0 +1,46 @@
+"""
+Command to correct the ExternalGraderQueueCounter counts that drifted from the records.
+
+Queue counters are updated along with the status changes made through the
+API, but not by other writes, such as deleting submissions.  This command
+counts the ExternalGraderDetail records of every queue and status, and
+corrects the counters that differ.  With --dry-run, it only prints the
+differences.
+"""
+
+
+import logging
+
+from django.core.management.base import BaseCommand
+
+from submissions.models import ExternalGraderQueueCounter
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Example usage: ./manage.py lms --settings=devstack reconcile_grader_queue_counters --dry-run
+    """
+    help = 'Recounts the external grader records of every queue and status, and corrects the queue counters.'
+
+    def add_arguments(self, parser):
+        """
+        Add arguments to the command parser.
+
+        Uses argparse syntax.  See documentation at
+        https://docs.python.org/3/library/argparse.html.
+        """
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only print the counters that differ from the records.",
+        )
+
+    def handle(self, *args, **options):
+        differences = ExternalGraderQueueCounter.reconcile(dry_run=options['dry_run'])
+        for difference in differences:
+            self.stdout.write("queue {queue_name}, {status}: {count[0]} -> {count[1]}".format(**difference))
+        verb = "would be corrected" if options['dry_run'] else "corrected"
+        log.info("%s queue counters %s", len(differences), verb)
+        self.stdout.write(f"{len(differences)} queue counters {verb}")
@@ -0,0 +1,84 @@
+"""
+Tests for the archive_scores management command.
+"""
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.timezone import now
+from freezegun import freeze_time
+from six import StringIO
+
+from submissions import api
+from submissions.models import ArchivedScore, Score, ScoreAnnotation, ScoreSummary
+
+STUDENT_ITEM = {
+    "student_id": "Tim",
+    "course_id": "Demo_Course",
+    "item_id": "item_one",
+    "item_type": "Peer_Submission",
+}
+
+
+class TestArchiveScores(TestCase):
+    """ Tests for the archive_scores command. """
+
+    def setUp(self):
+        super().setUp()
+        with freeze_time(now() - timedelta(days=100)):
+            self.first = api.create_submission(STUDENT_ITEM, "first")
+            self.second = api.create_submission(STUDENT_ITEM, "second")
+            api.set_score(self.first['uuid'], 4, 4)
+            api.set_score(self.first['uuid'], 1, 4)
+            api.set_score(self.second['uuid'], 2, 4)
+            api.set_score(self.second['uuid'], 3, 4, 'staff', 'staff_override', 'regrade')
+            api.reset_score(STUDENT_ITEM['student_id'], STUDENT_ITEM['course_id'], STUDENT_ITEM['item_id'])
+            api.set_score(self.second['uuid'], 2, 4)
+
+    def _call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command('archive_scores', *args, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def test_archive(self):
+        summary = ScoreSummary.objects.get()
+        before = api.get_score_history(STUDENT_ITEM)
+
+        self.assertEqual(self._call_command(chunk=1), "Archived 3 scores\n")
+
+        # Kept: the latest score (2/4), which is also the highest since the reset,
+        # the annotated score, and the latest score of the first submission (1/4).
+        # Archived: the scores superseded for their submission, and the reset score.
+        self.assertEqual(
+            list(Score.objects.order_by('id').values_list('points_earned', 'points_possible')),
+            [(1, 4), (3, 4), (2, 4)],
+        )
+        self.assertEqual(
+            sorted(ArchivedScore.objects.values_list('points_earned', 'points_possible', 'reset')),
+            [(0, 0, True), (2, 4, False), (4, 4, False)],
+        )
+        self.assertEqual(
+            ScoreSummary.objects.values_list('highest_id', 'latest_id').get(),
+            (summary.highest_id, summary.latest_id),
+        )
+        self.assertEqual(ScoreAnnotation.objects.count(), 1)
+        self.assertEqual(api.get_latest_score_for_submission(self.first['uuid'])['points_earned'], 1)
+        self.assertEqual(api.get_score_history(STUDENT_ITEM), before)
+
+        # Running again has nothing left to do
+        self.assertEqual(self._call_command(), "Archived 0 scores\n")
+
+    def test_recent_scores_are_kept(self):
+        self.assertEqual(self._call_command(days=365), "Archived 0 scores\n")
+        self.assertEqual(self._call_command(before=(now() - timedelta(days=200)).date().isoformat()),
+                         "Archived 0 scores\n")
+
+    def test_dry_run(self):
+        output = self._call_command('--dry-run')
+        self.assertTrue(output.startswith("3 scores created before"))
+        self.assertFalse(ArchivedScore.objects.exists())
+
+    def test_invalid_before(self):
+        with self.assertRaises(CommandError):
+            self._call_command(before='yesterday')
@@ -0,0 +1,40 @@
+"""
+Tests for the backfill_normalized_scores management command.
+"""
+from django.core.management import call_command
+from django.test import TestCase
+
+from submissions.models import Score
+from submissions.tests.factories import StudentItemFactory
+
+
+class TestBackfillNormalizedScores(TestCase):
+    """ Tests for the backfill_normalized_scores command. """
+
+    def setUp(self):
+        super().setUp()
+        student_item = StudentItemFactory.create()
+        self.scores = [
+            Score.objects.create(student_item=student_item, points_earned=earned, points_possible=possible)
+            for earned, possible in ((1, 4), (2, 4), (0, 5), (0, 0), (3, 3))
+        ]
+        # Simulate scores written before the normalized score was stored
+        Score.objects.update(normalized_score=None)
+
+    def _normalized_scores(self):
+        return list(Score.objects.order_by('id').values_list('normalized_score', flat=True))
+
+    def test_backfill(self):
+        # Two chunks of a select and an update (in a savepoint), then a select finding nothing left
+        with self.assertNumQueries(9):
+            call_command('backfill_normalized_scores', chunk=2)
+        self.assertEqual(self._normalized_scores(), [0.25, 0.5, 0.0, None, 1.0])
+
+    def test_start(self):
+        call_command('backfill_normalized_scores', start=self.scores[2].id)
+        self.assertEqual(self._normalized_scores(), [None, None, 0.0, None, 1.0])
+
+    def test_rows_already_filled_are_skipped(self):
+        Score.objects.filter(pk=self.scores[0].pk).update(normalized_score=0.9)
+        call_command('backfill_normalized_scores')
+        self.assertEqual(self._normalized_scores(), [0.9, 0.5, 0.0, None, 1.0])
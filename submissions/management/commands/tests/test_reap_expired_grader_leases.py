@@ -0,0 +1,51 @@
+"""
+Tests for the reap_expired_grader_leases management command.
+"""
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.timezone import now
+from six import StringIO
+
+from submissions.models import ExternalGraderDetail, StudentItem, Submission
+
+
+class TestReapExpiredGraderLeases(TestCase):
+    """ Tests for the reap_expired_grader_leases command. """
+
+    def setUp(self):
+        super().setUp()
+        student_item = StudentItem.objects.create(student_id="Tim", course_id="Demo_Course", item_id="item_one")
+        for attempt_number in (1, 2, 3):
+            ExternalGraderDetail.objects.create(
+                submission=Submission.objects.create(
+                    student_item=student_item, answer="answer", attempt_number=attempt_number
+                ),
+                queue_name="test_queue",
+                status_time=now() - timedelta(minutes=61),
+            )
+        pulled = ExternalGraderDetail.objects.pull_submissions("test_queue", 3)
+        self.expired_ids = [detail.id for detail in pulled[:2]]
+        ExternalGraderDetail.objects.filter(id__in=self.expired_ids).update(lease_expiry=now() - timedelta(minutes=1))
+
+    def _call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command('reap_expired_grader_leases', *args, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def test_reap(self):
+        self.assertEqual(self._call_command(chunk=1), "Returned 2 submissions to their queue\n")
+        self.assertEqual(
+            set(ExternalGraderDetail.objects.filter(status='pending').values_list('id', flat=True)),
+            set(self.expired_ids),
+        )
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue", approximate=True), 2)
+
+    def test_nothing_to_reap(self):
+        self._call_command()
+        self.assertEqual(self._call_command(), "Returned 0 submissions to their queue\n")
+
+    def test_dry_run(self):
+        self.assertEqual(self._call_command('--dry-run'), "2 submissions would be returned to their queue\n")
+        self.assertFalse(ExternalGraderDetail.objects.filter(status='pending').exists())
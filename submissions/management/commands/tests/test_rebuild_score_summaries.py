@@ -0,0 +1,120 @@
+"""
+Tests for the rebuild_score_summaries management command.
+"""
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from six import StringIO
+
+from submissions import api
+from submissions.management.commands.rebuild_score_summaries import split_range
+from submissions.models import ScoreSummary, StudentItem
+
+
+class InlinePoolExecutor:
+    """ Stands in for ProcessPoolExecutor, running the workers in this process. """
+
+    def __init__(self, max_workers, mp_context):
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+class TestRebuildScoreSummaries(TestCase):
+    """ Tests for the rebuild_score_summaries command. """
+
+    def setUp(self):
+        super().setUp()
+        self.student_items = []
+        for student_id in ('Tim', 'Bob', 'Li'):
+            student_item = {
+                "student_id": student_id,
+                "course_id": "Demo_Course",
+                "item_id": "item_one",
+                "item_type": "Peer_Submission",
+            }
+            submission = api.create_submission(student_item, "answer")
+            api.set_score(submission['uuid'], 3, 4)
+            api.set_score(submission['uuid'], 1, 4)
+            self.student_items.append(StudentItem.objects.get(student_id=student_id))
+        self.summaries = {
+            summary.student_item_id: (summary.highest_id, summary.latest_id)
+            for summary in ScoreSummary.objects.all()
+        }
+
+    def _call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command('rebuild_score_summaries', *args, wait=0, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def _drift(self):
+        """
+        Break the summaries of the first two student items.
+        """
+        tim, bob = self.student_items[0], self.student_items[1]
+        tim_highest, tim_latest = self.summaries[tim.id]
+        ScoreSummary.objects.filter(student_item=tim).update(highest_id=tim_latest)
+        ScoreSummary.objects.filter(student_item=bob).delete()
+        return [
+            f"student item {tim.id}: highest {tim_latest} -> {tim_highest}, latest {tim_latest} -> {tim_latest}",
+            f"student item {bob.id}: highest None -> {self.summaries[bob.id][0]}, "
+            f"latest None -> {self.summaries[bob.id][1]}",
+        ]
+
+    def _current_summaries(self):
+        return {
+            summary.student_item_id: (summary.highest_id, summary.latest_id)
+            for summary in ScoreSummary.objects.all()
+        }
+
+    def test_nothing_to_rebuild(self):
+        self.assertEqual(self._call_command(), "0 score summaries rebuilt\n")
+        self.assertEqual(self._current_summaries(), self.summaries)
+
+    def test_rebuild(self):
+        expected_lines = self._drift()
+        output = self._call_command(chunk=1)
+        self.assertEqual(output.splitlines(), expected_lines + ["2 score summaries rebuilt"])
+        self.assertEqual(self._current_summaries(), self.summaries)
+
+    def test_dry_run(self):
+        expected_lines = self._drift()
+        drifted = self._current_summaries()
+        output = self._call_command('--dry-run')
+        self.assertEqual(output.splitlines(), expected_lines + ["2 score summaries would be rebuilt"])
+        self.assertEqual(self._current_summaries(), drifted)
+
+    def test_id_range(self):
+        self._drift()
+        output = self._call_command(start=self.student_items[1].id, end=self.student_items[1].id)
+        self.assertEqual(output.splitlines()[-1], "1 score summaries rebuilt")
+
+    def test_processes(self):
+        self._drift()
+        with mock.patch(
+            'submissions.management.commands.rebuild_score_summaries.ProcessPoolExecutor', InlinePoolExecutor
+        ):
+            with mock.patch('submissions.management.commands.rebuild_score_summaries.connections') as connections:
+                output = self._call_command(processes=3)
+        connections.close_all.assert_called_once()
+        self.assertEqual(output.splitlines()[-1], "2 score summaries rebuilt")
+        self.assertEqual(self._current_summaries(), self.summaries)
+
+    def test_invalid_processes(self):
+        with self.assertRaises(CommandError):
+            self._call_command(processes=0)
+
+    def test_split_range(self):
+        self.assertEqual(split_range(1, 10, 3), [(1, 4), (5, 8), (9, 10)])
+        self.assertEqual(split_range(1, 2, 4), [(1, 1), (2, 2)])
+        self.assertEqual(split_range(5, 5, 1), [(5, 5)])
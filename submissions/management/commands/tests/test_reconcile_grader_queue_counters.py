@@ -0,0 +1,46 @@
+"""
+Tests for the reconcile_grader_queue_counters management command.
+"""
+from django.core.management import call_command
+from django.test import TestCase
+from six import StringIO
+
+from submissions.models import ExternalGraderDetail, ExternalGraderQueueCounter, StudentItem, Submission
+
+
+class TestReconcileGraderQueueCounters(TestCase):
+    """ Tests for the reconcile_grader_queue_counters command. """
+
+    def setUp(self):
+        super().setUp()
+        student_item = StudentItem.objects.create(student_id="Tim", course_id="Demo_Course", item_id="item_one")
+        for attempt_number in (1, 2):
+            ExternalGraderDetail.objects.create(
+                submission=Submission.objects.create(
+                    student_item=student_item, answer="answer", attempt_number=attempt_number
+                ),
+                queue_name="test_queue",
+            )
+
+    def _call_command(self, *args):
+        out = StringIO()
+        call_command('reconcile_grader_queue_counters', *args, stdout=out)
+        return out.getvalue()
+
+    def test_nothing_to_correct(self):
+        self.assertEqual(self._call_command(), "0 queue counters corrected\n")
+
+    def test_reconcile(self):
+        ExternalGraderQueueCounter.objects.filter(queue_name="test_queue").update(count=5)
+        output = self._call_command()
+        self.assertEqual(output.splitlines(), ["queue test_queue, pending: 5 -> 2", "1 queue counters corrected"])
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue", approximate=True), 2)
+
+    def test_dry_run(self):
+        ExternalGraderQueueCounter.objects.all().delete()
+        output = self._call_command('--dry-run')
+        self.assertEqual(
+            output.splitlines(),
+            ["queue test_queue, pending: 0 -> 2", "1 queue counters would be corrected"]
+        )
+        self.assertFalse(ExternalGraderQueueCounter.objects.exists())
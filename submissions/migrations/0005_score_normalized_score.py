@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0004_externalgraderdetail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='score',
+            name='normalized_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
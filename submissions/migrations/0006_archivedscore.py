@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0005_score_normalized_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score_id', models.IntegerField(unique=True)),
+                ('points_earned', models.PositiveIntegerField(default=0)),
+                ('points_possible', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('reset', models.BooleanField(default=False)),
+                ('normalized_score', models.FloatField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('student_item', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, to='submissions.studentitem'
+                )),
+                ('submission', models.ForeignKey(
+                    null=True, on_delete=django.db.models.deletion.CASCADE, to='submissions.submission'
+                )),
+            ],
+        ),
+    ]
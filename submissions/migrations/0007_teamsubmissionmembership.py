@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:26
+
+import itertools
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_memberships(apps, schema_editor):
+    """
+    Index the active team-based submissions that already exist.
+    """
+    Submission = apps.get_model('submissions', 'Submission')
+    TeamSubmissionMembership = apps.get_model('submissions', 'TeamSubmissionMembership')
+    rows = Submission.objects.filter(
+        status='A',
+        team_submission__isnull=False,
+    ).order_by('id').values_list(
+        'student_item__course_id',
+        'student_item__item_id',
+        'student_item__student_id',
+        'team_submission_id',
+        'team_submission__team_id',
+    ).iterator(chunk_size=BACKFILL_BATCH_SIZE)
+    while True:
+        batch = list(itertools.islice(rows, BACKFILL_BATCH_SIZE))
+        if not batch:
+            break
+        TeamSubmissionMembership.objects.bulk_create([
+            TeamSubmissionMembership(
+                course_id=course_id,
+                item_id=item_id,
+                student_id=student_id,
+                team_submission_id=team_submission_id,
+                team_id=team_id,
+            )
+            for course_id, item_id, student_id, team_submission_id, team_id in batch
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0006_archivedscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamSubmissionMembership',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_id', models.CharField(max_length=255)),
+                ('item_id', models.CharField(max_length=255)),
+                ('student_id', models.CharField(max_length=255)),
+                ('team_id', models.CharField(max_length=255)),
+                ('team_submission', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='memberships',
+                    to='submissions.teamsubmission',
+                )),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['course_id', 'item_id', 'student_id'], name='submissions_course__130340_idx'),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_memberships, migrations.RunPython.noop),
+    ]
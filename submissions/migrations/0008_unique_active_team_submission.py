@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:29
+
+import logging
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def soft_delete_duplicate_team_submissions(apps, schema_editor):
+    """
+    Keep only the latest active team submission of each team, soft-deleting (and reporting) the others.
+
+    The members' submissions of the duplicates are soft-deleted with them, and
+    their memberships removed, like when a team submission is deleted through the API.
+    """
+    TeamSubmission = apps.get_model('submissions', 'TeamSubmission')
+    Submission = apps.get_model('submissions', 'Submission')
+    TeamSubmissionMembership = apps.get_model('submissions', 'TeamSubmissionMembership')
+    active = TeamSubmission.objects.filter(status='A')
+    teams = list(
+        active.values('course_id', 'item_id', 'team_id').annotate(
+            count=models.Count('id'),
+        ).filter(count__gt=1).values_list('course_id', 'item_id', 'team_id')
+    )
+    for course_id, item_id, team_id in teams:
+        duplicates = list(
+            active.filter(course_id=course_id, item_id=item_id, team_id=team_id).order_by(
+                '-submitted_at', '-id',
+            ).values_list('id', 'uuid')[1:]
+        )
+        logger.warning(
+            "Soft-deleting duplicate active team submissions %s of team %s for course %s, item %s",
+            ", ".join(str(uuid) for _, uuid in duplicates), team_id, course_id, item_id,
+        )
+        duplicate_ids = [id_ for id_, _ in duplicates]
+        TeamSubmission.objects.filter(id__in=duplicate_ids).update(status='D')
+        Submission.objects.filter(team_submission_id__in=duplicate_ids).update(status='D')
+        TeamSubmissionMembership.objects.filter(team_submission_id__in=duplicate_ids).delete()
+
+
+def backfill_active_team_keys(apps, schema_editor):
+    TeamSubmission = apps.get_model('submissions', 'TeamSubmission')
+    TeamSubmission.objects.filter(status='A').update(active_team_key=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0007_teamsubmissionmembership'),
+    ]
+
+    operations = [
+        migrations.RunPython(soft_delete_duplicate_team_submissions, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='teamsubmission',
+            name='active_team_key',
+            field=models.BooleanField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_active_team_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='teamsubmission',
+            constraint=models.UniqueConstraint(
+                fields=('course_id', 'item_id', 'team_id', 'active_team_key'),
+                name='unique_active_team_submission',
+            ),
+        ),
+    ]
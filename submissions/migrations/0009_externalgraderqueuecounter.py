@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:38
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    """
+    Count the external grader records that already exist.
+    """
+    ExternalGraderDetail = apps.get_model('submissions', 'ExternalGraderDetail')
+    ExternalGraderQueueCounter = apps.get_model('submissions', 'ExternalGraderQueueCounter')
+    ExternalGraderQueueCounter.objects.bulk_create([
+        ExternalGraderQueueCounter(queue_name=row['queue_name'], status=row['status'], count=row['total'])
+        for row in ExternalGraderDetail.objects.order_by().values('queue_name', 'status').annotate(
+            total=models.Count('id')
+        )
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0008_unique_active_team_submission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalGraderQueueCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queue_name', models.CharField(max_length=128)),
+                ('status', models.CharField(
+                    choices=[
+                        ('pending', 'Pending'), ('pulled', 'Pulled'), ('retired', 'Retired'), ('failed', 'Failed'),
+                    ],
+                    max_length=20,
+                )),
+                ('slot', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='externalgraderqueuecounter',
+            constraint=models.UniqueConstraint(
+                fields=('queue_name', 'status', 'slot'),
+                name='unique_external_grader_queue_counter',
+            ),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
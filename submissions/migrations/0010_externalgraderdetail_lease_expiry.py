@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:42
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_leases(apps, schema_editor):
+    """
+    Give the submissions that are already pulled a lease from the time they were pulled.
+    """
+    ExternalGraderDetail = apps.get_model('submissions', 'ExternalGraderDetail')
+    ExternalGraderDetail.objects.filter(status='pulled', lease_expiry__isnull=True).update(
+        lease_expiry=models.F('status_time') + timedelta(minutes=getattr(settings, 'SUBMISSION_LEASE_DURATION', 60))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0009_externalgraderqueuecounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='externalgraderdetail',
+            name='lease_expiry',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='externalgraderdetail',
+            index=models.Index(fields=['status', 'lease_expiry'], name='submissions_status_70fb73_idx'),
+        ),
+        migrations.RunPython(backfill_leases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:38
+
+import itertools
+
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_latest_scores(apps, schema_editor):
+    """
+    Copy the item id and the latest score of the score summaries that already exist onto them.
+    """
+    ScoreSummary = apps.get_model('submissions', 'ScoreSummary')
+    rows = ScoreSummary.objects.order_by('id').values_list(
+        'id',
+        'student_item__item_id',
+        'latest__points_earned',
+        'latest__points_possible',
+    ).iterator(chunk_size=BACKFILL_BATCH_SIZE)
+    while True:
+        batch = list(itertools.islice(rows, BACKFILL_BATCH_SIZE))
+        if not batch:
+            break
+        ScoreSummary.objects.bulk_update(
+            [
+                ScoreSummary(
+                    id=id_,
+                    item_id=item_id,
+                    latest_normalized_score=float(points_earned) / points_possible if points_possible else None,
+                    latest_points_earned=points_earned,
+                )
+                for id_, item_id, points_earned, points_possible in batch
+            ],
+            ['item_id', 'latest_normalized_score', 'latest_points_earned'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0010_externalgraderdetail_lease_expiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scoresummary',
+            name='item_id',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='scoresummary',
+            name='latest_normalized_score',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='scoresummary',
+            name='latest_points_earned',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_latest_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='scoresummary',
+            index=models.Index(
+                fields=['item_id', 'latest_normalized_score', 'latest_points_earned'],
+                name='submissions_item_id_42a3fe_idx',
+            ),
+        ),
+    ]
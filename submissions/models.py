@@ -10,13 +10,20 @@ need to then generate a matching migration for it using:
 """
 
 import logging
+import operator
+import secrets
+import threading
+from collections import defaultdict, namedtuple
 from datetime import timedelta
+from functools import reduce
 from uuid import uuid4
 
 from django.conf import settings
 from django.contrib import auth
-from django.db import DatabaseError, models, transaction
-from django.db.models.signals import post_save, pre_save
+from django.db import DatabaseError, IntegrityError, connections, models, router, transaction
+from django.db.models import Case, Count, Exists, ExpressionWrapper, F, FloatField, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.db.models.signals import post_save
 from django.dispatch import Signal, receiver
 from django.utils.timezone import now
 from jsonfield import JSONField
@@ -140,6 +147,11 @@ class TeamSubmission(TimeStampedModel):
 
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=ACTIVE)
 
+    # True for active team submissions and NULL otherwise, kept in sync by save().  Unique
+    # indexes allow repeated NULLs, so a unique constraint that includes it only applies
+    # to active team submissions, also on databases without partial indexes (MySQL).
+    active_team_key = models.BooleanField(null=True, editable=False)
+
     # Override the default Manager with our custom one to filter out soft-deleted items
     class SoftDeletedManager(models.Manager):
         def get_queryset(self):
@@ -152,6 +164,20 @@ class TeamSubmission(TimeStampedModel):
     def get_cache_key(sub_uuid):
         return f"submissions.team_submission.{sub_uuid}"
 
+    @staticmethod
+    def get_team_cache_key(course_id, item_id, team_id):
+        """
+        Key under which the uuid of the active team submission of a team is cached.
+        """
+        return f"submissions.team_submission.team.{course_id}.{item_id}.{team_id}"
+
+    @staticmethod
+    def get_individual_submission_cache_key(submission_uuid):
+        """
+        Key under which the uuid of the team submission of an individual submission is cached.
+        """
+        return f"submissions.team_submission.individual.{submission_uuid}"
+
     @staticmethod
     def get_team_submission_by_uuid(team_submission_uuid):
         """
@@ -224,7 +250,11 @@ class TeamSubmission(TimeStampedModel):
 
         """
         try:
-            return TeamSubmission.objects.prefetch_related('submissions').get(submissions__student_item=student_item)
+            return TeamSubmission.objects.prefetch_related('submissions').get(
+                memberships__course_id=student_item.course_id,
+                memberships__item_id=student_item.item_id,
+                memberships__student_id=student_item.student_id,
+            )
         except TeamSubmission.DoesNotExist as error:
             logger.error("Team submission for %s not found.", student_item)
             raise TeamSubmissionNotFoundError(
@@ -260,6 +290,44 @@ class TeamSubmission(TimeStampedModel):
             logger.error(err_msg)
             raise TeamSubmissionInternalError(err_msg) from exc
 
+    def save(self, *args, **kwargs):
+        """
+        Save the team submission, raising DuplicateTeamSubmissionsError if the team already has an active one.
+
+        Only one active team submission per (course, item, team) is allowed.  The
+        database enforces it with a unique constraint on `active_team_key`;
+        saving an active team submission is wrapped in a savepoint, so that a
+        violation can be told apart from other integrity errors without aborting
+        the surrounding transaction.  Saving a deleted team submission needs neither.
+        """
+        self.active_team_key = True if self.status == ACTIVE else None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'active_team_key'}
+
+        if self.status != ACTIVE:
+            super().save(*args, **kwargs)
+            return
+
+        using = kwargs.get('using') or router.db_for_write(TeamSubmission, instance=self)
+        try:
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs)
+        except IntegrityError as error:
+            if self._other_active_team_submissions(using).exists():
+                raise DuplicateTeamSubmissionsError('Can only have one submission per team.') from error
+            raise
+
+    def _other_active_team_submissions(self, using):
+        """
+        Return the other active team submissions of this team for this course and item.
+        """
+        return TeamSubmission.objects.using(using).filter(
+            course_id=self.course_id,
+            item_id=self.item_id,
+            team_id=self.team_id,
+        ).exclude(id=self.id)
+
     def __repr__(self):
         return repr({
             "uuid": self.uuid,
@@ -276,21 +344,12 @@ class TeamSubmission(TimeStampedModel):
     class Meta:
         app_label = "submissions"
         ordering = ["-submitted_at", "-id"]
-
-
-@receiver(pre_save, sender=TeamSubmission)
-def validate_only_one_submission_per_team(sender, **kwargs):  # pylint:disable=unused-argument
-    """
-    Ensures that there is only one active submission per team.
-    """
-    ts = kwargs['instance']
-    if TeamSubmission.objects.filter(
-            course_id=ts.course_id,
-            item_id=ts.item_id,
-            team_id=ts.team_id,
-            status='A'
-    ).exclude(id=ts.id).exists():
-        raise DuplicateTeamSubmissionsError('Can only have one submission per team.')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['course_id', 'item_id', 'team_id', 'active_team_key'],
+                name='unique_active_team_submission',
+            ),
+        ]
 
 
 class Submission(models.Model):
@@ -371,6 +430,74 @@ class Submission(models.Model):
         ordering = ["-submitted_at", "-id"]
 
 
+class TeamSubmissionMembership(models.Model):
+    """
+    Index of the students who have an active individual submission in a team submission.
+
+    Answers "which team submission does this learner belong to" for a (course,
+    item, student) with a single indexed lookup, instead of joining Submission,
+    StudentItem and TeamSubmission.  A row is added when a team-based
+    submission is created, and removed when that submission is soft-deleted.
+
+    .. no_pii:
+    """
+    course_id = models.CharField(max_length=255)
+    item_id = models.CharField(max_length=255)
+    # The anonymized Student ID, as in StudentItem.  Indexed along with the course and item.
+    student_id = models.CharField(max_length=255)
+    team_submission = models.ForeignKey(TeamSubmission, related_name='memberships', on_delete=models.CASCADE)
+    # Copied from the team submission, so that teammates can be matched without a join
+    team_id = models.CharField(max_length=255)
+
+    @classmethod
+    def for_submissions(cls, submissions):
+        """
+        Return the (unsaved) memberships of team-based submissions, whose student items and team submissions are loaded.
+        """
+        return [
+            cls(
+                course_id=submission.student_item.course_id,
+                item_id=submission.student_item.item_id,
+                student_id=submission.student_item.student_id,
+                team_submission=submission.team_submission,
+                team_id=submission.team_submission.team_id,
+            )
+            for submission in submissions
+            if submission.team_submission_id is not None
+        ]
+
+    @classmethod
+    def remove_for_student_items(cls, student_items):
+        """
+        Remove the memberships of the given student items, whose submissions were soft-deleted.
+        """
+        student_ids = defaultdict(list)
+        for student_item in student_items:
+            student_ids[(student_item.course_id, student_item.item_id)].append(student_item.student_id)
+        if student_ids:
+            cls.objects.filter(reduce(operator.or_, (
+                Q(course_id=course_id, item_id=item_id, student_id__in=ids)
+                for (course_id, item_id), ids in student_ids.items()
+            ))).delete()
+
+    class Meta:
+        app_label = "submissions"
+        indexes = [
+            models.Index(fields=['course_id', 'item_id', 'student_id']),
+        ]
+
+
+@receiver(post_save, sender=Submission)
+def add_team_submission_membership(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
+    """
+    Index the team submission of a newly created team-based submission.
+
+    Submissions created in bulk do not trigger this receiver, and are indexed by their creator.
+    """
+    if created and instance.status == ACTIVE:
+        TeamSubmissionMembership.objects.bulk_create(TeamSubmissionMembership.for_submissions([instance]))
+
+
 class Score(models.Model):
     """
     What the user scored for a given StudentItem at a given time.
@@ -391,9 +518,32 @@ class Score(models.Model):
     # Flag to indicate that this score should reset the current "highest" score
     reset = models.BooleanField(default=False)
 
+    # points_earned / points_possible, stored so that scores can be compared in SQL.
+    # Null for hidden scores, and for scores written before this field existed
+    # until the backfill_normalized_scores command has been run.  Not indexed:
+    # rankings and statistics of an item read the ratio of the latest scores,
+    # which ScoreSummary stores and indexes.
+    normalized_score = models.FloatField(null=True, blank=True)
+
     class Meta:
         app_label = "submissions"
 
+    def save(self, *args, **kwargs):
+        self.normalized_score = self.to_float()
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def normalized_score_expression(prefix=''):
+        """
+        Build the SQL expression for the normalized score of the Score at ``prefix`` (e.g. ``'latest__'``).
+
+        Rows that have not been backfilled yet get their ratio computed on the fly.
+        """
+        return Coalesce(
+            F(f'{prefix}normalized_score'),
+            Cast(f'{prefix}points_earned', FloatField()) / NullIf(F(f'{prefix}points_possible'), Value(0)),
+        )
+
     @property
     def submission_uuid(self):
         """
@@ -474,10 +624,42 @@ class Score(models.Model):
             reset=True,
         )
 
+    @classmethod
+    def archivable(cls, cutoff):
+        """
+        Return the scores created before ``cutoff`` that can be moved to the archive.
+
+        A score is kept if a score summary points at it, if it is the latest
+        score for its submission (as read by ``get_latest_score_for_submission``),
+        or if it has annotations.
+
+        Args:
+            cutoff (datetime): Only scores created before this time are considered.
+
+        Returns:
+            QuerySet
+        """
+        newer_for_submission = cls.objects.filter(submission_id=OuterRef('submission_id'), id__gt=OuterRef('id'))
+        referenced = ScoreSummary.objects.filter(Q(highest=OuterRef('pk')) | Q(latest=OuterRef('pk')))
+        return cls.objects.filter(
+            Q(submission__isnull=True) | Exists(newer_for_submission),
+            created_at__lt=cutoff,
+        ).exclude(
+            Exists(referenced)
+        ).exclude(
+            Exists(ScoreAnnotation.objects.filter(score=OuterRef('pk')))
+        )
+
     def __str__(self):
         return f"{self.points_earned}/{self.points_possible}"
 
 
+# The fields of a Score (or ArchivedScore) needed to replay it in ScoreSummary.rebuild.
+_ReplayedScore = namedtuple(
+    '_ReplayedScore', ['id', 'student_item_id', 'points_earned', 'points_possible', 'reset', 'archived']
+)
+
+
 class ScoreSummary(models.Model):
     """
     Running store of the highest and most recent Scores for a StudentItem.
@@ -489,15 +671,271 @@ class ScoreSummary(models.Model):
     highest = models.ForeignKey(Score, related_name="+", on_delete=models.CASCADE)
     latest = models.ForeignKey(Score, related_name="+", on_delete=models.CASCADE)
 
+    # Denormalized from the student item and the latest score, so that the rankings and
+    # statistics of an item (see api.get_top_submissions) are read from an index.  The
+    # normalized score is null for hidden scores.
+    item_id = models.CharField(max_length=255, default='', editable=False)
+    latest_normalized_score = models.FloatField(null=True, editable=False)
+    latest_points_earned = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         app_label = "submissions"
         verbose_name_plural = "Score Summaries"
+        indexes = [
+            models.Index(fields=['item_id', 'latest_normalized_score', 'latest_points_earned']),
+        ]
+
+    @staticmethod
+    def latest_fields(score):
+        """
+        Return the fields of a summary whose latest score is ``score``, other than ``latest`` itself.
+        """
+        return {
+            'latest_normalized_score': score.to_float(),
+            'latest_points_earned': score.points_earned,
+        }
+
+    @staticmethod
+    def highest_after(score):
+        """
+        Build the SQL expression for a summary's ``highest`` score once ``score`` has been added.
+
+        A "reset" score always replaces the current highest score.  A hidden
+        score (zero points possible) never does.  Otherwise, ``score`` replaces
+        the current highest score if that one is hidden or has a lower
+        earned/possible ratio.  The ratios are compared by cross-multiplying,
+        so the comparison is exact and runs entirely in the database.
+        """
+        if score.reset:
+            return Value(score.pk)
+        if score.points_possible == 0:
+            return F('highest')
+        beaten = Score.objects.filter(pk=OuterRef('highest')).annotate(
+            scaled_earned=ExpressionWrapper(
+                F('points_earned') * score.points_possible, output_field=models.BigIntegerField()
+            ),
+            scaled_new_earned=ExpressionWrapper(
+                F('points_possible') * score.points_earned, output_field=models.BigIntegerField()
+            ),
+        ).filter(
+            Q(points_possible=0) | Q(scaled_earned__lt=F('scaled_new_earned'))
+        )
+        return Case(
+            When(Exists(beaten), then=Value(score.pk)),
+            default=F('highest'),
+            output_field=models.IntegerField(),
+        )
+
+    @staticmethod
+    def apply_score(score):
+        """
+        Point the summary for the score's student item at ``score``, in a single UPDATE.
+
+        Returns:
+            bool: False if the student item has no summary yet.
+        """
+        return bool(
+            ScoreSummary.objects.filter(student_item_id=score.student_item_id).update(
+                latest=score,
+                highest=ScoreSummary.highest_after(score),
+                **ScoreSummary.latest_fields(score)
+            )
+        )
+
+    @staticmethod
+    def replaces_highest(score, highest):
+        """
+        In-memory counterpart of ``highest_after``: does ``score`` replace ``highest``?
+        """
+        if score.reset:
+            return True
+        if score.points_possible == 0:
+            return False
+        if highest.points_possible == 0:
+            return True
+        return highest.points_earned * score.points_possible < score.points_earned * highest.points_possible
+
+    @classmethod
+    def update_for_scores(cls, scores):
+        """
+        Update the summaries for a batch of saved scores, set-wise.
+
+        Used by bulk writes, which bypass the post_save receiver.  Scores for
+        the same student item are applied in the given order.  Should be called
+        inside a transaction, so that the summary rows stay locked until it
+        commits.
+        """
+        scores_by_item = {}
+        for score in scores:
+            scores_by_item.setdefault(score.student_item_id, []).append(score)
+
+        summaries = {
+            summary.student_item_id: summary
+            for summary in cls.objects.select_for_update().filter(student_item_id__in=list(scores_by_item))
+        }
+        highest_scores = Score.objects.in_bulk([summary.highest_id for summary in summaries.values()])
+
+        to_update = []
+        to_create = []
+        for student_item_id, item_scores in scores_by_item.items():
+            summary = summaries.get(student_item_id)
+            if summary is None:
+                highest = item_scores[0]
+                summary = cls(student_item_id=student_item_id, item_id=highest.student_item.item_id)
+                to_create.append(summary)
+            else:
+                highest = highest_scores[summary.highest_id]
+                to_update.append(summary)
+            for score in item_scores:
+                if cls.replaces_highest(score, highest):
+                    highest = score
+            summary.highest = highest
+            summary.latest = item_scores[-1]
+            for field, value in cls.latest_fields(summary.latest).items():
+                setattr(summary, field, value)
+
+        if to_update:
+            cls.objects.bulk_update(to_update, ['highest', 'latest', 'latest_normalized_score', 'latest_points_earned'])
+        if to_create:
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create(to_create)
+            except IntegrityError:
+                # Another writer created some of these summaries in the meantime
+                for summary in to_create:
+                    for score in scores_by_item[summary.student_item_id]:
+                        if not cls.apply_score(score):
+                            cls.create_for_score(score)
+
+    @classmethod
+    def create_for_score(cls, score):
+        """
+        Create the summary of the score's student item, with ``score`` as its highest and latest score.
+        """
+        return cls.objects.create(
+            student_item_id=score.student_item_id,
+            item_id=score.student_item.item_id,
+            highest=score,
+            latest=score,
+            **cls.latest_fields(score)
+        )
+
+    @classmethod
+    def rebuild(cls, student_item_ids, dry_run=False):
+        """
+        Recompute the summaries of the given student items from their score history.
+
+        Scores are replayed in id order with the same rules as
+        ``update_score_summary``: ``latest`` is the last score, and ``highest``
+        starts at the first score and is then replaced according to
+        ``replaces_highest``, so a "reset" score restarts it.  Archived scores
+        are replayed too, since an archived reset score still matters.
+
+        The summaries are locked while they are recomputed, so this should be
+        called for a bounded number of student items at a time.
+
+        Args:
+            student_item_ids (list of int): The student items to rebuild the summaries of.
+            dry_run (bool): If True, only report the differences.
+
+        Returns:
+            list of dict: One entry per summary that differs from the score
+                history, with the "student_item_id", and the current and
+                expected "highest" and "latest" score ids as (current, expected)
+                pairs.  The current ids are None for a missing summary.  A
+                summary whose ids are right but whose denormalized item id or
+                latest score fields are stale is reported, and fixed, too.
+
+        Raises:
+            DatabaseError: An error occurred while rebuilding the summaries.
+        """
+        student_item_ids = list(student_item_ids)
+        with transaction.atomic():
+            summaries = {
+                summary.student_item_id: summary
+                for summary in cls.objects.select_for_update().filter(student_item_id__in=student_item_ids)
+            }
+            history = sorted(
+                [
+                    _ReplayedScore(*values, archived=False)
+                    for values in Score.objects.filter(student_item_id__in=student_item_ids).values_list(
+                        'id', 'student_item_id', 'points_earned', 'points_possible', 'reset'
+                    )
+                ] + [
+                    _ReplayedScore(*values, archived=True)
+                    for values in ArchivedScore.objects.filter(student_item_id__in=student_item_ids).values_list(
+                        'score_id', 'student_item_id', 'points_earned', 'points_possible', 'reset'
+                    )
+                ],
+                key=lambda score: score.id,
+            )
+
+            expected = {}
+            for score in history:
+                if score.student_item_id not in expected:
+                    expected[score.student_item_id] = [score, score]
+                elif cls.replaces_highest(score, expected[score.student_item_id][0]):
+                    expected[score.student_item_id][0] = score
+                expected[score.student_item_id][1] = score
+
+            item_ids = dict(StudentItem.objects.filter(id__in=list(expected)).values_list('id', 'item_id'))
+
+            differences = []
+            to_update = []
+            to_create = []
+            for student_item_id, (highest, latest) in sorted(expected.items()):
+                summary = summaries.get(student_item_id)
+                current = (summary.highest_id, summary.latest_id) if summary is not None else (None, None)
+                denormalized = {
+                    'item_id': item_ids[student_item_id],
+                    'latest_normalized_score': (
+                        float(latest.points_earned) / latest.points_possible if latest.points_possible else None
+                    ),
+                    'latest_points_earned': latest.points_earned,
+                }
+                if current == (highest.id, latest.id) and all(
+                    getattr(summary, field) == value for field, value in denormalized.items()
+                ):
+                    continue
+                if highest.archived or latest.archived:
+                    logger.warning(
+                        "Cannot rebuild the score summary of student item %(item)s: it should point at archived "
+                        "score %(score)s",
+                        {'item': student_item_id, 'score': highest.id if highest.archived else latest.id},
+                    )
+                    continue
+                differences.append({
+                    'student_item_id': student_item_id,
+                    'highest': (current[0], highest.id),
+                    'latest': (current[1], latest.id),
+                })
+                if summary is None:
+                    to_create.append(cls(
+                        student_item_id=student_item_id, highest_id=highest.id, latest_id=latest.id, **denormalized
+                    ))
+                else:
+                    summary.highest_id = highest.id
+                    summary.latest_id = latest.id
+                    for field, value in denormalized.items():
+                        setattr(summary, field, value)
+                    to_update.append(summary)
+
+            if not dry_run:
+                if to_update:
+                    cls.objects.bulk_update(to_update, ['highest', 'latest', *denormalized])
+                if to_create:
+                    cls.objects.bulk_create(to_create)
+        return differences
 
     @receiver(post_save, sender=Score)
     def update_score_summary(sender, **kwargs):  # pylint: disable=no-self-argument
         """
         Listen for new Scores and update the relevant ScoreSummary.
 
+        The comparison with the current highest score and the update of both
+        ``highest`` and ``latest`` happen in one statement, so concurrent
+        graders do not race between reading and writing the summary.
+
         Args:
             sender: not used
 
@@ -506,33 +944,13 @@ class ScoreSummary(models.Model):
         """
         score = kwargs['instance']
         try:
-            score_summary = ScoreSummary.objects.get(
-                student_item=score.student_item
-            )
-            score_summary.latest = score
-
-            # A score with the "reset" flag set will always replace the current highest score
-            if score.reset:
-                score_summary.highest = score
-            # The conversion to a float may return None if points possible is zero
-            elif score_summary.highest.to_float() is None and score.to_float() is not None:
-                # Any score with non-null points possible will take precedence if the current
-                # highest score is None
-                score_summary.highest = score
-            elif (
-                score.to_float() is not None and
-                score_summary.highest.to_float() is not None and
-                score.to_float() > score_summary.highest.to_float()
-            ):
-                # If both scores are non-null we can do a normal comparison
-                score_summary.highest = score
-            score_summary.save()
-        except ScoreSummary.DoesNotExist:
-            ScoreSummary.objects.create(
-                student_item=score.student_item,
-                highest=score,
-                latest=score,
-            )
+            if not ScoreSummary.apply_score(score):
+                try:
+                    with transaction.atomic():
+                        ScoreSummary.create_for_score(score)
+                except IntegrityError:
+                    # Another writer created the summary in the meantime
+                    ScoreSummary.apply_score(score)
         except DatabaseError:
             logger.exception(
                 "Error while updating score summary for student item %(item)s",
@@ -561,13 +979,99 @@ class ScoreAnnotation(models.Model):
     reason = models.TextField()
 
 
+class ArchivedScore(models.Model):
+    """
+    A superseded Score, moved out of the Score table by the archive_scores command.
+
+    No score summary points at an archived score, and a newer score exists for
+    its submission, so archived scores are only read to reconstruct the full
+    history of a student item (see ``api.get_score_history``).
+
+    .. no_pii:
+    """
+    # The id the score had in the Score table
+    score_id = models.IntegerField(unique=True)
+    student_item = models.ForeignKey(StudentItem, on_delete=models.CASCADE)
+    submission = models.ForeignKey(Submission, null=True, on_delete=models.CASCADE)
+    points_earned = models.PositiveIntegerField(default=0)
+    points_possible = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(editable=False, default=now)
+    reset = models.BooleanField(default=False)
+    normalized_score = models.FloatField(null=True, blank=True)
+    archived_at = models.DateTimeField(editable=False, default=now)
+
+    class Meta:
+        app_label = "submissions"
+
+    @property
+    def submission_uuid(self):
+        """
+        Retrieve the submission UUID associated with this score, or None.
+        """
+        if self.submission is not None:
+            return str(self.submission.uuid)
+        else:
+            return None
+
+    @classmethod
+    def archive_scores(cls, cutoff, after_id=0, limit=1000):
+        """
+        Move up to ``limit`` archivable scores with an id greater than ``after_id`` into the archive.
+
+        The scores are copied and deleted in one transaction, with the Score
+        rows locked in between.
+
+        Args:
+            cutoff (datetime): Only scores created before this time are archived.
+            after_id (int): Only scores with a greater id are archived.
+            limit (int): The maximum number of scores to archive.
+
+        Returns:
+            list of int: The ids of the archived scores, in increasing order.
+
+        Raises:
+            DatabaseError: An error occurred while archiving the scores.
+        """
+        with transaction.atomic():
+            scores = list(
+                Score.archivable(cutoff).filter(id__gt=after_id).order_by('id').select_for_update()[:limit]
+            )
+            score_ids = [score.id for score in scores]
+            if scores:
+                cls.objects.bulk_create([
+                    cls(
+                        score_id=score.id,
+                        student_item_id=score.student_item_id,
+                        submission_id=score.submission_id,
+                        points_earned=score.points_earned,
+                        points_possible=score.points_possible,
+                        created_at=score.created_at,
+                        reset=score.reset,
+                        normalized_score=score.normalized_score,
+                    )
+                    for score in scores
+                ])
+                Score.objects.filter(id__in=score_ids).delete()
+        return score_ids
+
+
 class ExternalGraderDetailManager(models.Manager):
     """
     Manager for handling queue-related operations on Submissions.
     """
 
-    def get_queue_length(self, queue_name):
-        """Count pending submissions in a specific queue"""
+    def get_queue_length(self, queue_name, approximate=False):
+        """
+        Count pending submissions in a specific queue.
+
+        By default, only the pending submissions that can be processed now are
+        counted, from the records themselves.  With ``approximate``, the count
+        is read from the queue counters instead, without counting any record:
+        it also includes the pending submissions that are still within the
+        processing delay, and may drift until the counters are reconciled.
+        """
+        if approximate:
+            return ExternalGraderQueueCounter.get_count(queue_name, ExternalGraderDetail.Status.PENDING)
         return self.time_filter().filter(
             queue_name=queue_name,
             status='pending'
@@ -582,15 +1086,157 @@ class ExternalGraderDetailManager(models.Manager):
             'created_at'
         ).select_for_update().first()
 
+    def dequeue(self, queue_name):
+        """
+        Claim the next processable submission of a queue for a grader.
+
+        See ``pull_submissions``.
+
+        Returns:
+            ExternalGraderDetail: The claimed record, or None if the queue is empty.
+        """
+        details = self.pull_submissions(queue_name, 1)
+        return details[0] if details else None
+
+    def pull_submissions(self, queue_name, max_items):
+        """
+        Claim up to ``max_items`` processable submissions of a queue for a grader.
+
+        The claimed records are moved to 'pulled', each with a fresh pullkey,
+        before they are returned, so concurrent graders never get the same
+        submission.  On backends that support it, the head of the queue is
+        locked with SKIP LOCKED, so that concurrent graders claim different
+        records instead of waiting on the same ones.  Other backends (sqlite)
+        claim the records with an UPDATE conditioned on their status, and try
+        again with the next records when other graders claimed all of them
+        first.
+
+        Returns:
+            list of ExternalGraderDetail: The claimed records, oldest first, with
+                their submission loaded.  Empty if the queue is empty.
+        """
+        using = router.db_for_write(self.model)
+        features = connections[using].features
+        pending = self.time_filter().using(using).filter(
+            queue_name=queue_name,
+            status=ExternalGraderDetail.Status.PENDING
+        ).select_related('submission').order_by('created_at')
+
+        if features.has_select_for_update_skip_locked:
+            lock_of = ('self',) if features.has_select_for_update_of else ()
+            with transaction.atomic(using=using):
+                details = list(pending.select_for_update(skip_locked=True, of=lock_of)[:max_items])
+                return self._claim(details, using)
+
+        while True:
+            details = list(pending[:max_items])
+            if not details:
+                return []
+            claimed = self._claim(details, using)
+            if claimed:
+                return claimed
+
+    def _claim(self, details, using):
+        """
+        Move the pending records among ``details`` to 'pulled' with a single UPDATE.
+
+        Returns:
+            list of ExternalGraderDetail: The records of ``details`` that were
+                still pending, updated with their new status and pullkey.
+        """
+        if not details:
+            return []
+        status_time = now()
+        lease_expiry = status_time + ExternalGraderDetail.get_lease_duration()
+        for detail in details:
+            detail.status = ExternalGraderDetail.Status.PULLED
+            detail.status_time = status_time
+            detail.lease_expiry = lease_expiry
+            detail.pullkey = secrets.token_hex(32)
+        detail_ids = [detail.id for detail in details]
+        with transaction.atomic(using=using, savepoint=False):
+            claimed_count = self.using(using).filter(
+                id__in=detail_ids,
+                status=ExternalGraderDetail.Status.PENDING
+            ).update(
+                status=ExternalGraderDetail.Status.PULLED,
+                status_time=status_time,
+                lease_expiry=lease_expiry,
+                pullkey=Case(*[When(id=detail.id, then=Value(detail.pullkey)) for detail in details]),
+            )
+            ExternalGraderQueueCounter.adjust(details[0].queue_name, {
+                ExternalGraderDetail.Status.PENDING: -claimed_count,
+                ExternalGraderDetail.Status.PULLED: claimed_count,
+            }, using=using)
+        if claimed_count == len(details):
+            return details
+
+        # Other graders claimed some of the records between the SELECT and the UPDATE
+        claimed_ids = set(self.using(using).filter(
+            id__in=detail_ids,
+            pullkey__in=[detail.pullkey for detail in details]
+        ).order_by().values_list('id', flat=True))
+        return [detail for detail in details if detail.id in claimed_ids]
+
+    def expired_leases(self, cutoff=None):
+        """
+        Pulled submissions whose lease expired at ``cutoff`` (now by default).
+        """
+        return self.filter(
+            status=ExternalGraderDetail.Status.PULLED,
+            lease_expiry__lte=cutoff or now()
+        )
+
+    def reap_expired_leases(self, limit=1000):
+        """
+        Return up to ``limit`` pulled submissions whose lease expired to their queue.
+
+        Graders that crash or give up leave their submissions pulled; once
+        the lease expires, the submissions go back to 'pending', with their
+        pullkey cleared, so that another grader can pull them.  Their status
+        time is set back by the processing delay (see ``time_filter``), so
+        that they can be pulled right away rather than after another delay.
+        The records are moved with one UPDATE per queue, so their counters
+        stay exact.
+
+        Returns:
+            int: The number of submissions returned to 'pending'.
+        """
+        using = router.db_for_write(self.model)
+        cutoff = now()
+        expired = self.expired_leases(cutoff).using(using)
+        reaped = 0
+        with transaction.atomic(using=using):
+            detail_ids = defaultdict(list)
+            for detail_id, queue_name in expired.order_by('lease_expiry').values_list('id', 'queue_name')[:limit]:
+                detail_ids[queue_name].append(detail_id)
+            for queue_name, ids in sorted(detail_ids.items()):
+                count = expired.filter(id__in=ids).update(
+                    status=ExternalGraderDetail.Status.PENDING,
+                    status_time=self.processing_window_start(cutoff),
+                    lease_expiry=None,
+                    pullkey=None,
+                )
+                ExternalGraderQueueCounter.adjust(queue_name, {
+                    ExternalGraderDetail.Status.PULLED: -count,
+                    ExternalGraderDetail.Status.PENDING: count,
+                }, using=using)
+                reaped += count
+        return reaped
+
     def time_filter(self):
         """
         Filter submissions based on processing delay window.
         Ensures we don't process submissions that were recently updated.
         """
-        processing_window = now() - timedelta(
-            minutes=getattr(settings, 'SUBMISSION_PROCESSING_DELAY', 60)
-        )
-        return self.filter(status_time__lte=processing_window)
+        return self.filter(status_time__lte=self.processing_window_start(now()))
+
+    @staticmethod
+    def processing_window_start(at):
+        """
+        Return the latest status time of the submissions that can be processed at ``at``.
+        """
+        return at - timedelta(minutes=getattr(settings, 'SUBMISSION_PROCESSING_DELAY', 60))
 
 
 class ExternalGraderDetail(models.Model):
@@ -642,11 +1288,16 @@ class ExternalGraderDetail(models.Model):
 
     num_failures = models.PositiveIntegerField(default=0)
 
+    # When a pulled submission is considered abandoned by its grader, and can
+    # be returned to its queue.  Graders that need more time renew the lease.
+    lease_expiry = models.DateTimeField(null=True, blank=True)
+
     objects = ExternalGraderDetailManager()
 
     class Meta:
         indexes = [
             models.Index(fields=['queue_name', 'status', 'status_time']),
+            models.Index(fields=['status', 'lease_expiry']),
         ]
         ordering = ['-created_at']
 
@@ -664,6 +1315,46 @@ class ExternalGraderDetail(models.Model):
         )
         return self.status_time <= processing_window
 
+    def save(self, *args, **kwargs):
+        """
+        Save the record, counting new records in the counters of their queue.
+        """
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            ExternalGraderQueueCounter.adjust(self.queue_name, {self.status: 1}, using=using)
+
+    @staticmethod
+    def get_lease_duration():
+        """
+        How long a grader may hold a pulled submission before it is returned to the queue.
+        """
+        return timedelta(minutes=getattr(settings, 'SUBMISSION_LEASE_DURATION', 60))
+
+    def renew_lease(self, duration=None):
+        """
+        Extend the lease of a pulled submission, for graders that need more time.
+
+        The lease is only renewed while the submission is still pulled with
+        the same pullkey, so a grader can't renew a submission that was
+        returned to the queue and pulled by another grader.
+
+        Returns:
+            bool: Whether the lease was renewed.
+        """
+        lease_expiry = now() + (duration or self.get_lease_duration())
+        renewed = type(self).objects.filter(
+            id=self.id,
+            status=self.Status.PULLED,
+            pullkey=self.pullkey
+        ).update(lease_expiry=lease_expiry)
+        if renewed:
+            self.lease_expiry = lease_expiry
+        return bool(renewed)
+
     def can_transition_to(self, new_status, current_status=None):
         """Check if the transition to new_status is valid."""
         from_status = current_status if current_status is not None else self.status
@@ -673,6 +1364,24 @@ class ExternalGraderDetail(models.Model):
     def update_status(self, new_status):
         """
         Update status and timestamp atomically
+
+        The record is only updated if it is still in the status this instance
+        was read with, so that the queue counters follow the transitions that
+        actually happened.  A pulled record must also still have the pullkey of
+        this instance: a grader whose lease expired can't retire or fail a
+        submission that was returned to the queue, or pulled by another grader.
+
+        Args:
+            new_status (str): The status to move the record to.
+
+        Raises:
+            ValueError: The transition is not valid from the status of this
+                instance, or the record is no longer in that status (or no
+                longer has this instance's pullkey) in the database, as
+                another process changed it since this instance was read.  In
+                the second case, the record and this instance are left as
+                they were; callers that may hold a stale instance should
+                reload it before retrying.
         """
         if not self.can_transition_to(new_status):
             raise ValueError(
@@ -680,16 +1389,151 @@ class ExternalGraderDetail(models.Model):
                 f"ExternalGraderDetail(id={self.id}, "
                 f"submission_uuid={self.submission.uuid})")
 
-        self.status = new_status
-        self.status_time = now()
+        status_time = now()
+        fields = {'status': new_status, 'status_time': status_time}
+        if new_status == 'failed':
+            fields['num_failures'] = F('num_failures') + 1
+        elif new_status == 'pulled':
+            fields['lease_expiry'] = status_time + self.get_lease_duration()
+
+        current = type(self).objects.filter(id=self.id, status=self.status)
+        if self.status == self.Status.PULLED:
+            current = current.filter(pullkey=self.pullkey)
+        if not current.update(**fields):
+            raise ValueError(
+                f"ExternalGraderDetail(id={self.id}) is no longer {self.status} "
+                f"as read, it can't transition to {new_status}")
+        ExternalGraderQueueCounter.adjust(self.queue_name, {self.status: -1, new_status: 1})
 
+        self.status = new_status
+        self.status_time = status_time
         if new_status == 'failed':
             self.num_failures += 1
-            self.save(update_fields=['status', 'status_time', 'num_failures'])
-        else:
-            self.save(update_fields=['status', 'status_time'])
+        elif new_status == 'pulled':
+            self.lease_expiry = fields['lease_expiry']
 
     @classmethod
     def create_from_uuid(cls, submission_uuid, **kwargs):
         submission = Submission.objects.get(uuid=submission_uuid)
         return cls.objects.create(submission=submission, **kwargs)
+
+
+# Per-thread seed of the queue counter slot, see ExternalGraderQueueCounter.get_slot()
+_counter_slots = threading.local()
+
+
+class ExternalGraderQueueCounter(models.Model):
+    """
+    Number of ExternalGraderDetail records of a queue in a given status.
+
+    Counters are updated in the same transaction as the record creations and
+    status changes made through ``ExternalGraderDetail.update_status`` and
+    the pull methods of its manager, so that the approximate length of a queue
+    (``get_queue_length(approximate=True)``) is read without counting its
+    records.  Other writes, such as saving a new status
+    directly or deleting submissions, are not counted: ``reconcile`` corrects
+    the drift.
+
+    Each count is spread over ``SUBMISSION_QUEUE_COUNTER_SLOTS`` rows (16 by
+    default), which are summed on read.  Every thread writes to its own slot,
+    so that graders and submitters don't wait on each other's counter row
+    until their transactions commit.
+
+    .. no_pii:
+    """
+    queue_name = models.CharField(max_length=128)
+    status = models.CharField(max_length=20, choices=ExternalGraderDetail.Status.choices)
+    slot = models.PositiveSmallIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = "submissions"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['queue_name', 'status', 'slot'], name='unique_external_grader_queue_counter'
+            ),
+        ]
+
+    @staticmethod
+    def get_slot():
+        """
+        Return the counter slot written by the current thread.
+        """
+        if not hasattr(_counter_slots, 'seed'):
+            _counter_slots.seed = secrets.randbelow(2 ** 16)
+        return _counter_slots.seed % max(getattr(settings, 'SUBMISSION_QUEUE_COUNTER_SLOTS', 16), 1)
+
+    @classmethod
+    def adjust(cls, queue_name, deltas, using=None):
+        """
+        Add ``deltas``, a dict of status to the change of its count, to the counters of a queue.
+
+        Counters are updated in the slot of the current thread, in status
+        order, so that concurrent transitions lock them in the same order.
+        """
+        using = using or router.db_for_write(cls)
+        slot = cls.get_slot()
+        for status, delta in sorted(deltas.items()):
+            if not delta:
+                continue
+            counter = cls.objects.using(using).filter(queue_name=queue_name, status=status, slot=slot)
+            if counter.update(count=F('count') + delta):
+                continue
+            _, created = cls.objects.using(using).get_or_create(
+                queue_name=queue_name, status=status, slot=slot, defaults={'count': delta}
+            )
+            if not created:
+                counter.update(count=F('count') + delta)
+
+    @classmethod
+    def get_count(cls, queue_name, status):
+        """
+        Return the counted number of records of a queue in a status.
+        """
+        count = cls.objects.filter(queue_name=queue_name, status=status).aggregate(total=Sum('count'))['total']
+        return max(count or 0, 0)
+
+    @classmethod
+    def reconcile(cls, dry_run=False):
+        """
+        Count the records of every queue and status, and correct the counters that drifted.
+
+        The counters are locked while the records are counted, so that
+        concurrent status changes wait for the reconciliation.  A drifted
+        count is corrected in its first slot.
+
+        Returns:
+            list of dict: The corrected counters, with their ``queue_name``,
+                ``status`` and ``count`` as an (old, new) tuple.
+        """
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            counters = defaultdict(list)
+            for counter in cls.objects.using(using).select_for_update().order_by('queue_name', 'status', 'slot'):
+                counters[(counter.queue_name, counter.status)].append(counter)
+            counts = {
+                (row['queue_name'], row['status']): row['total']
+                for row in ExternalGraderDetail.objects.using(using).order_by().values(
+                    'queue_name', 'status'
+                ).annotate(total=Count('id'))
+            }
+
+            differences = []
+            changed, missing = [], []
+            for queue_name, status in sorted(set(counters) | set(counts)):
+                slots = counters.get((queue_name, status), [])
+                old_count = sum(counter.count for counter in slots)
+                new_count = counts.get((queue_name, status), 0)
+                if old_count == new_count:
+                    continue
+                differences.append({'queue_name': queue_name, 'status': status, 'count': (old_count, new_count)})
+                if slots:
+                    slots[0].count += new_count - old_count
+                    changed.append(slots[0])
+                else:
+                    missing.append(cls(queue_name=queue_name, status=status, count=new_count))
+
+            if not dry_run:
+                cls.objects.using(using).bulk_update(changed, ['count'])
+                cls.objects.using(using).bulk_create(missing)
+        return differences
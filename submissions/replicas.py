@@ -0,0 +1,331 @@
+"""
+Read replica selection for the submissions app.
+
+The API functions that accept ``read_replica=True`` ask the router configured
+here which database alias to read from.  The default router spreads reads over
+the replicas listed in ``settings.SUBMISSIONS_READ_REPLICAS`` and skips any
+replica whose lag, as reported by the configured lag probe, is above
+``settings.SUBMISSIONS_READ_REPLICA_MAX_LAG`` seconds.  When no replica is
+usable, reads go to the primary ("default") database.
+
+Settings:
+
+    SUBMISSIONS_READ_REPLICAS: Either a list of database aliases, or a dict
+        mapping aliases to integer weights.  Defaults to ``["read_replica"]``
+        when that alias exists in ``settings.DATABASES``.
+    SUBMISSIONS_READ_REPLICA_STRATEGY: "round_robin" (default) or "weighted".
+    SUBMISSIONS_READ_REPLICA_MAX_LAG: Maximum tolerated lag, in seconds.
+        Defaults to 30.
+    SUBMISSIONS_READ_REPLICA_LAG_PROBE: Dotted path to a ``ReplicaLagProbe``
+        subclass.  Defaults to ``NullLagProbe``, which never reports lag.
+    SUBMISSIONS_READ_REPLICA_LAG_CACHE_SECONDS: How long a probed lag value is
+        reused before probing the replica again.  Defaults to 5.
+    SUBMISSIONS_READ_REPLICA_ROUTER: Dotted path to a ``ReadReplicaRouter``
+        subclass, for deployments that need their own selection logic.
+    SUBMISSIONS_READ_YOUR_WRITES_WINDOW: Number of seconds after a write to a
+        student item (or submission) during which reads about it are served by
+        the primary.  Defaults to 10; 0 disables the mechanism.
+"""
+
+import itertools
+import logging
+import random
+import threading
+import time
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = 'round_robin'
+WEIGHTED = 'weighted'
+
+DEFAULT_MAX_LAG = 30
+DEFAULT_LAG_CACHE_SECONDS = 5
+DEFAULT_READ_YOUR_WRITES_WINDOW = 10
+
+
+class ReplicaLagProbe:
+    """
+    Reports how far behind the primary a replica database is.
+
+    Subclasses implement ``get_lag``.  The router caches the returned values,
+    so implementations may issue a query on every call.
+    """
+
+    def get_lag(self, alias):
+        """
+        Return the replication lag of the database ``alias`` in seconds,
+        or None if the lag cannot be determined.
+        """
+        raise NotImplementedError
+
+
+class NullLagProbe(ReplicaLagProbe):
+    """
+    Lag probe that always reports an up-to-date replica.
+    """
+
+    def get_lag(self, alias):
+        return 0
+
+
+class StaticLagProbe(ReplicaLagProbe):
+    """
+    Lag probe returning fixed, settable values.
+
+    Intended as a stand-in for tests and local development, where there is no
+    real replication to measure.  Aliases without a configured value report
+    no lag.
+    """
+
+    def __init__(self, lags=None):
+        self.lags = dict(lags or {})
+
+    def set_lag(self, alias, lag):
+        self.lags[alias] = lag
+
+    def get_lag(self, alias):
+        return self.lags.get(alias, 0)
+
+
+class MySQLReplicaLagProbe(ReplicaLagProbe):
+    """
+    Lag probe reading ``Seconds_Behind_Source`` from ``SHOW REPLICA STATUS``.
+    """
+
+    def get_lag(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SHOW REPLICA STATUS")
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                columns = [col[0] for col in cursor.description]
+        except DatabaseError:
+            logger.exception("Could not read replication status for database %s", alias)
+            return None
+        status = dict(zip(columns, row))
+        return status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+
+
+class ReadReplicaRouter:
+    """
+    Chooses a database alias for reads that tolerate replication lag.
+    """
+
+    def __init__(self, replicas, *, strategy=ROUND_ROBIN, lag_probe=None,
+                 max_lag=DEFAULT_MAX_LAG, lag_cache_seconds=DEFAULT_LAG_CACHE_SECONDS):
+        if isinstance(replicas, dict):
+            self.weights = {alias: weight for alias, weight in replicas.items() if weight > 0}
+        else:
+            self.weights = {alias: 1 for alias in replicas}
+        if strategy not in (ROUND_ROBIN, WEIGHTED):
+            raise ValueError(f"Unknown read replica strategy: {strategy}")
+        self.strategy = strategy
+        self.lag_probe = lag_probe or NullLagProbe()
+        self.max_lag = max_lag
+        self.lag_cache_seconds = lag_cache_seconds
+
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(list(self.weights))
+        self._lag_cache = {}
+
+    @property
+    def replicas(self):
+        return list(self.weights)
+
+    def lag(self, alias):
+        """
+        Return the (possibly cached) lag for ``alias``.
+        """
+        current_time = time.monotonic()
+        cached = self._lag_cache.get(alias)
+        if cached is not None and cached[1] > current_time:
+            return cached[0]
+        lag = self.lag_probe.get_lag(alias)
+        self._lag_cache[alias] = (lag, current_time + self.lag_cache_seconds)
+        return lag
+
+    def is_healthy(self, alias):
+        """
+        A replica is usable if it is configured and its lag is known and within the threshold.
+        """
+        if alias not in settings.DATABASES:
+            return False
+        lag = self.lag(alias)
+        return lag is not None and lag <= self.max_lag
+
+    def healthy_replicas(self):
+        return [alias for alias in self.weights if self.is_healthy(alias)]
+
+    def db_for_read(self):
+        """
+        Return the alias to read from, falling back to the primary database.
+        """
+        healthy = self.healthy_replicas()
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        if self.strategy == WEIGHTED:
+            return random.choices(healthy, weights=[self.weights[alias] for alias in healthy])[0]
+        with self._lock:
+            for _ in range(len(self.weights)):
+                alias = next(self._cycle)
+                if alias in healthy:
+                    return alias
+        return DEFAULT_DB_ALIAS
+
+
+_router = None
+
+
+def _configured_replicas():
+    replicas = getattr(settings, 'SUBMISSIONS_READ_REPLICAS', None)
+    if replicas is None:
+        replicas = ['read_replica'] if 'read_replica' in settings.DATABASES else []
+    return replicas
+
+
+def get_router():
+    """
+    Return the process-wide read replica router, building it from settings on first use.
+    """
+    global _router  # pylint: disable=global-statement
+    if _router is None:
+        router_class = import_string(
+            getattr(settings, 'SUBMISSIONS_READ_REPLICA_ROUTER', 'submissions.replicas.ReadReplicaRouter')
+        )
+        probe_class = import_string(
+            getattr(settings, 'SUBMISSIONS_READ_REPLICA_LAG_PROBE', 'submissions.replicas.NullLagProbe')
+        )
+        _router = router_class(
+            _configured_replicas(),
+            strategy=getattr(settings, 'SUBMISSIONS_READ_REPLICA_STRATEGY', ROUND_ROBIN),
+            lag_probe=probe_class(),
+            max_lag=getattr(settings, 'SUBMISSIONS_READ_REPLICA_MAX_LAG', DEFAULT_MAX_LAG),
+            lag_cache_seconds=getattr(
+                settings, 'SUBMISSIONS_READ_REPLICA_LAG_CACHE_SECONDS', DEFAULT_LAG_CACHE_SECONDS
+            ),
+        )
+    return _router
+
+
+def set_router(router):
+    """
+    Replace the process-wide router (or pass None to rebuild it from settings).
+    """
+    global _router  # pylint: disable=global-statement
+    _router = router
+
+
+def _read_your_writes_window():
+    return getattr(settings, 'SUBMISSIONS_READ_YOUR_WRITES_WINDOW', DEFAULT_READ_YOUR_WRITES_WINDOW)
+
+
+def _normalize_uuid(submission_uuid):
+    """
+    Submission uuids are stored both with and without hyphens (EDUCATOR-1090),
+    so markers are keyed on the canonical hex form.
+    """
+    try:
+        return UUID(str(submission_uuid)).hex
+    except ValueError:
+        return str(submission_uuid)
+
+
+def _recent_write_keys(student_item_ids=(), submission_uuids=()):
+    keys = [f"submissions.recent_write.submission.{_normalize_uuid(uuid)}" for uuid in submission_uuids]
+    keys.extend(f"submissions.recent_write.student_item.{student_item_id}" for student_item_id in student_item_ids)
+    return keys
+
+
+def mark_recent_write(student_item_id=None, submission_uuids=()):
+    """
+    Record that a student item, and optionally some of its submissions, were just written.
+
+    For the read-your-writes window that follows, ``has_recent_write`` reports
+    True for them so that replica reads are sent to the primary instead.
+    """
+    mark_recent_writes([student_item_id] if student_item_id is not None else [], submission_uuids)
+
+
+def mark_recent_writes(student_item_ids=(), submission_uuids=()):
+    """
+    Batch form of ``mark_recent_write``, recording all the markers in one cache call.
+    """
+    window = _read_your_writes_window()
+    keys = _recent_write_keys(student_item_ids, submission_uuids)
+    if not window or not keys:
+        return
+    try:
+        cache.set_many(dict.fromkeys(keys, True), window)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Error occurred while recording a recent write in the cache")
+
+
+def has_recent_write(student_item_id=None, submission_uuid=None):
+    """
+    Return True if the student item or submission was written within the read-your-writes window.
+    """
+    if not _read_your_writes_window():
+        return False
+    keys = _recent_write_keys(
+        [student_item_id] if student_item_id is not None else [],
+        [submission_uuid] if submission_uuid is not None else [],
+    )
+    if not keys:
+        return False
+    try:
+        return bool(cache.get_many(keys))
+    except Exception:  # pylint: disable=broad-except
+        # Err on the side of consistency if we cannot tell
+        logger.exception("Error occurred while checking for a recent write in the cache")
+        return True
+
+
+def _recent_item_write_keys(items):
+    return [
+        f"submissions.recent_write.item.{course_id}.{item_id}.{item_type}"
+        for course_id, item_id, item_type in items
+    ]
+
+
+def mark_recent_item_writes(items):
+    """
+    Record that scores were just written for the given (course_id, item_id, item_type) items.
+
+    Item-wide aggregates are cached for much longer than a replica can lag, so
+    unlike the read-your-writes markers these are kept for the maximum
+    tolerated replica lag: until then, ``has_recent_item_write`` reports True.
+    """
+    keys = _recent_item_write_keys(items)
+    if not keys:
+        return
+    try:
+        cache.set_many(dict.fromkeys(keys, True), get_router().max_lag)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Error occurred while recording a recent write in the cache")
+
+
+def has_recent_item_write(course_id, item_id, item_type):
+    """
+    Return True if scores were written for the item within the maximum tolerated replica lag.
+    """
+    try:
+        return bool(cache.get_many(_recent_item_write_keys([(course_id, item_id, item_type)])))
+    except Exception:  # pylint: disable=broad-except
+        # Err on the side of consistency if we cannot tell
+        logger.exception("Error occurred while checking for a recent write in the cache")
+        return True
+
+
+@receiver(setting_changed)
+def _reset_router(sender, setting, **kwargs):  # pylint: disable=unused-argument
+    if setting == 'DATABASES' or setting.startswith('SUBMISSIONS_READ_REPLICA'):
+        set_router(None)
@@ -8,7 +8,7 @@ import json
 from rest_framework import serializers
 from rest_framework.fields import DateTimeField, Field, IntegerField
 
-from submissions.models import Score, ScoreAnnotation, StudentItem, Submission, TeamSubmission
+from submissions.models import ArchivedScore, Score, ScoreAnnotation, StudentItem, Submission, TeamSubmission
 
 
 class RawField(Field):
@@ -66,11 +66,22 @@ class TeamSubmissionSerializer(serializers.ModelSerializer):
         Regular submissions are created after a team submission. In this case, the answer is passed as part of context
         otherwise, get the answer from its related submission. All individual submissions are identical except for
         student data. Therefore, get the answer of the first submitter
+
+        If the submissions of a batch of team submissions were loaded up front (with
+        ``prefetch_related('submissions')``), the answer is read from the prefetch
+        cache instead of being queried once per team submission.
         """
         answer = self.context.get("answer")
-        if answer is None and obj.submissions is not None:
+        if answer is None:
             #  retrieve answer submissions from the linked submission model. There are n identical submissions
-            answer = obj.submissions.first().answer
+            if 'submissions' in getattr(obj, '_prefetched_objects_cache', {}):
+                # Prefetched submissions follow the model ordering, so this is the same submission as first()
+                submissions = obj.submissions.all()
+                submission = submissions[0] if submissions else None
+            else:
+                submission = obj.submissions.first()
+            if submission is not None:
+                answer = submission.answer
         return answer
 
     def validate_answer(self, value):
@@ -105,6 +116,20 @@ class TeamSubmissionSerializer(serializers.ModelSerializer):
         )
 
 
+class UnansweredTeamSubmissionSerializer(TeamSubmissionSerializer):
+    """
+    Serializer for TeamSubmissions without their answer, for listings that do not need it.
+
+    Only the uuids of the individual submissions are read, so they can be
+    prefetched without their answers.
+    """
+
+    answer = None
+
+    class Meta(TeamSubmissionSerializer.Meta):
+        fields = tuple(field for field in TeamSubmissionSerializer.Meta.fields if field != 'answer')
+
+
 class SubmissionSerializer(serializers.ModelSerializer):
     """ Submission Serializer. """
 
@@ -192,6 +217,17 @@ class UnannotatedScoreSerializer(serializers.ModelSerializer):
         )
 
 
+class ArchivedScoreSerializer(serializers.ModelSerializer):
+    """ Serializer for archived scores, with the same fields as UnannotatedScoreSerializer. """
+
+    # Ensure that the created_at datetime is not converted to a string.
+    created_at = DateTimeField(format=None, required=False)
+
+    class Meta:
+        model = ArchivedScore
+        fields = UnannotatedScoreSerializer.Meta.fields
+
+
 class ScoreSerializer(serializers.ModelSerializer):
     """ Submissions score serializer class. """
     # Ensure that the created_at datetime is not converted to a string.
@@ -201,8 +237,15 @@ class ScoreSerializer(serializers.ModelSerializer):
     def get_annotations(self, obj):
         """
         Inspect ScoreAnnotations to attach all relevant annotations.
+
+        If the annotations of a batch of scores were loaded up front (with
+        ``prefetch_related('scoreannotation_set')``), they are read from the
+        prefetch cache instead of being queried once per score.
         """
-        annotations = ScoreAnnotation.objects.filter(score_id=obj.id)
+        if 'scoreannotation_set' in getattr(obj, '_prefetched_objects_cache', {}):
+            annotations = obj.scoreannotation_set.all()
+        else:
+            annotations = ScoreAnnotation.objects.filter(score_id=obj.id)
         return [
             ScoreAnnotationSerializer(instance=annotation).data
             for annotation in annotations
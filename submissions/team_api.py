@@ -3,21 +3,29 @@ Public interface for team submissions API.
 """
 
 import logging
+from uuid import UUID
 
 from django.db import DatabaseError, transaction
+from django.db.models import Prefetch
 
 from submissions import api as _api
+from submissions import caching
 from submissions.errors import (
     SubmissionInternalError,
+    SubmissionNotFoundError,
     TeamSubmissionInternalError,
     TeamSubmissionNotFoundError,
     TeamSubmissionRequestError
 )
-from submissions.models import DELETED, Submission, TeamSubmission
-from submissions.serializers import TeamSubmissionSerializer
+from submissions.models import DELETED, Submission, TeamSubmission, TeamSubmissionMembership
+from submissions.serializers import TeamSubmissionSerializer, UnansweredTeamSubmissionSerializer
 
 logger = logging.getLogger(__name__)
 
+# Default number of team submissions per page of get_team_submissions_page,
+# and per query of iter_all_team_submissions.
+TEAM_SUBMISSIONS_PAGE_SIZE = 100
+
 
 @transaction.atomic
 # pylint: disable=too-many-positional-arguments
@@ -152,8 +160,8 @@ def create_submission_for_team(
     }
     logger.info("[%s] Students with submissions from other teams: %s", log_string, students_with_team_submissions)
 
+    new_member_ids = []
     for team_member_id in team_member_ids:
-        logger.info("[%s] Creating individual submission for team member %s", log_string, team_member_id)
         if team_member_id in students_with_team_submissions:
             logger.info(
                 "[%s] Team member %s already has a submission for team %s. Skipping.",
@@ -161,26 +169,36 @@ def create_submission_for_team(
                 team_member_id,
                 students_with_team_submissions[team_member_id]
             )
-            continue
-        team_member_student_item_dict = dict(base_student_item_dict)
-        team_member_student_item_dict['student_id'] = team_member_id
+        else:
+            new_member_ids.append(team_member_id)
+
+    if new_member_ids:
+        logger.info("[%s] Creating individual submissions for team members %s", log_string, new_member_ids)
         try:
-            individual_submission = _api.create_submission(
-                team_member_student_item_dict,
+            individual_submissions = _api.create_team_member_submissions(
+                base_student_item_dict,
+                new_member_ids,
                 answer,
-                submitted_at=submitted_at,
+                team_submission,
+                submitted_at=team_submission.submitted_at if submitted_at else None,
                 attempt_number=attempt_number,
-                team_submission=team_submission
             )
         except Exception as exc:
             logger.error(
-                "[%s] Unable to create individual submission for %s: %s",
+                "[%s] Unable to create individual submissions for %s: %s",
                 log_string,
-                team_member_id,
+                new_member_ids,
                 str(exc)
             )
             raise exc
-        logger.info("[%s] Created individual submission %s", log_string, individual_submission['uuid'])
+        logger.info(
+            "[%s] Created individual submissions %s",
+            log_string,
+            [individual_submission['uuid'] for individual_submission in individual_submissions]
+        )
+
+    # A team submission previously looked up for this team can no longer be served from the cache
+    caching.delete_many([TeamSubmission.get_team_cache_key(course_id, item_id, team_id)])
 
     model_kwargs = {
         "answer": answer,
@@ -233,20 +251,18 @@ def get_teammates_with_submissions_from_other_teams(
     Returns:
         list(dict): [{ 'student_id', 'team_id' }]
     """
-    submissions = Submission.objects.filter(
-        student_item__student_id__in=team_member_ids,
-        student_item__course_id=course_id,
-        student_item__item_id=item_id,
+    memberships = TeamSubmissionMembership.objects.filter(
+        course_id=course_id,
+        item_id=item_id,
+        student_id__in=team_member_ids,
     ).exclude(
-        team_submission__isnull=True,
-    ).exclude(
-        team_submission__team_id=team_id,
-    ).values("student_item__student_id", "team_submission__team_id")
+        team_id=team_id,
+    ).values("student_id", "team_id")
 
     return [{
-        'student_id': submission['student_item__student_id'],
-        'team_id': submission['team_submission__team_id']
-    } for submission in submissions]
+        'student_id': membership['student_id'],
+        'team_id': membership['team_id']
+    } for membership in memberships]
 
 
 def get_team_submission(team_submission_uuid):
@@ -257,8 +273,12 @@ def get_team_submission(team_submission_uuid):
         - TeamSubmissionNotFoundError when no such team submission exists.
         - TeamSubmissionInternalError if there is some other error looking up the team submission.
     """
+    cached_team_submission_data = _get_cached_team_submission(team_submission_uuid)
+    if cached_team_submission_data:
+        return cached_team_submission_data
+
     team_submission = TeamSubmission.get_team_submission_by_uuid(team_submission_uuid)
-    return TeamSubmissionSerializer(team_submission).data
+    return _cache_team_submission(TeamSubmissionSerializer(team_submission).data)
 
 
 def get_team_submission_from_individual_submission(individual_submission_uuid):
@@ -269,11 +289,20 @@ def get_team_submission_from_individual_submission(individual_submission_uuid):
         - TeamSubmissionNotFoundError when no such team submission exists.
         - TeamSubmissionInternalError if there is some other error looking up the team submission.
     """
-    team_submission = TeamSubmission.objects.filter(submissions__uuid=individual_submission_uuid).first()
+    lookup_key = TeamSubmission.get_individual_submission_cache_key(individual_submission_uuid)
+    cached_team_submission_data = _get_cached_team_submission_from_lookup(lookup_key)
+    if cached_team_submission_data:
+        return cached_team_submission_data
+
+    team_submission = TeamSubmission.objects.prefetch_related(
+        'submissions'
+    ).filter(
+        submissions__uuid=individual_submission_uuid
+    ).first()
     if not team_submission:
         raise TeamSubmissionNotFoundError
 
-    return TeamSubmissionSerializer(team_submission).data
+    return _cache_team_submission(TeamSubmissionSerializer(team_submission).data, lookup_key)
 
 
 def get_team_submission_for_team(course_id, item_id, team_id):
@@ -284,8 +313,76 @@ def get_team_submission_for_team(course_id, item_id, team_id):
         - TeamSubmissionNotFoundError when no such team submission exists.
         - TeamSubmissionInternalError if there is some other error looking up the team submission.
     """
+    lookup_key = TeamSubmission.get_team_cache_key(course_id, item_id, team_id)
+    cached_team_submission_data = _get_cached_team_submission_from_lookup(lookup_key)
+    if cached_team_submission_data:
+        return cached_team_submission_data
+
     team_submission = TeamSubmission.get_team_submission_by_course_item_team(course_id, item_id, team_id)
-    return TeamSubmissionSerializer(team_submission).data
+    return _cache_team_submission(TeamSubmissionSerializer(team_submission).data, lookup_key)
+
+
+def _get_cached_team_submission(team_submission_uuid):
+    """
+    Return the serialized team submission cached for the given uuid, or None.
+    """
+    try:
+        return caching.get(TeamSubmission.get_cache_key(team_submission_uuid), codec=caching.TEAM_SUBMISSION_CODEC)
+    except Exception:  # pylint: disable=broad-except
+        # The cache backend could raise an exception
+        # (for example, memcache keys that contain spaces)
+        logger.exception("Error occurred while retrieving team submission from the cache")
+        return None
+
+
+def _get_cached_team_submission_from_lookup(lookup_key):
+    """
+    Return the serialized team submission whose uuid is cached under the secondary key ``lookup_key``, or None.
+    """
+    try:
+        team_submission_uuid = caching.get(lookup_key)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Error occurred while retrieving team submission from the cache")
+        return None
+    if team_submission_uuid is None:
+        return None
+    return _get_cached_team_submission(team_submission_uuid)
+
+
+def _cache_team_submission(team_submission_data, *lookup_keys):
+    """
+    Cache a serialized team submission, and its uuid under each of the secondary ``lookup_keys``.
+
+    Returns:
+        dict: ``team_submission_data``
+    """
+    team_submission_uuid = team_submission_data['team_submission_uuid']
+    try:
+        caching.set(
+            TeamSubmission.get_cache_key(team_submission_uuid),
+            team_submission_data,
+            codec=caching.TEAM_SUBMISSION_CODEC,
+        )
+        for lookup_key in lookup_keys:
+            caching.set(lookup_key, team_submission_uuid)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Error occurred while caching team submission %s", team_submission_uuid)
+    return team_submission_data
+
+
+def _invalidate_team_submission_cache(team_submission, submission_uuids=()):
+    """
+    Remove a team submission, and the secondary keys pointing to it, from the cache.
+    """
+    team_cache_key = TeamSubmission.get_team_cache_key(
+        team_submission.course_id, team_submission.item_id, team_submission.team_id
+    )
+    caching.delete_many(
+        [TeamSubmission.get_cache_key(team_submission.uuid), team_cache_key] + [
+            TeamSubmission.get_individual_submission_cache_key(submission_uuid)
+            for submission_uuid in submission_uuids
+        ]
+    )
 
 
 def get_team_submission_for_student(student_item_dict):
@@ -315,6 +412,120 @@ def get_all_team_submissions(course_id, item_id):
     return TeamSubmissionSerializer(team_submissions, many=True).data
 
 
+def iter_all_team_submissions(
+    course_id,
+    item_id,
+    include_answer=True,
+    ids_only=False,
+    chunk_size=TEAM_SUBMISSIONS_PAGE_SIZE,
+):
+    """
+    Yields all of the (active) team submissions (serialized) in the given (course, item).
+
+    Unlike `get_all_team_submissions`, the team submissions are read `chunk_size`
+    at a time, so that only one chunk is held in memory.
+
+    Args:
+        course_id (str): The course of the team submissions.
+        item_id (str): The item of the team submissions.
+        include_answer (bool): If False, the team submissions are serialized without
+            their answer, which is then not loaded from the database.
+        ids_only (bool): If True, only yield the `team_submission_uuid` and `team_id`
+            of each team submission.
+        chunk_size (int): The number of team submissions read per query.
+
+    Yields:
+        dict: The serialized team submissions, in creation order.
+
+    Raises:
+        - TeamSubmissionInternalError if there is an error looking up the team submissions.
+    """
+    after_id = 0
+    while after_id is not None:
+        page = get_team_submissions_page(
+            course_id,
+            item_id,
+            after_id=after_id,
+            page_size=chunk_size,
+            include_answer=include_answer,
+            ids_only=ids_only,
+        )
+        yield from page['team_submissions']
+        after_id = page['next_after_id']
+
+
+def get_team_submissions_page(
+    course_id,
+    item_id,
+    after_id=0,
+    page_size=TEAM_SUBMISSIONS_PAGE_SIZE,
+    include_answer=True,
+    ids_only=False,
+):  # pylint: disable=too-many-positional-arguments
+    """
+    Returns a page of the (active) team submissions (serialized) in the given (course, item).
+
+    Pages are ordered by team submission id and addressed by the id of the
+    last team submission of the previous page, so fetching a page costs the
+    same whatever its position.
+
+    Args:
+        course_id (str): The course of the team submissions.
+        item_id (str): The item of the team submissions.
+        after_id (int): The `next_after_id` of the previous page, or 0 for the first page.
+        page_size (int): The maximum number of team submissions in the page.
+        include_answer (bool): If False, the team submissions are serialized without
+            their answer, which is then not loaded from the database.
+        ids_only (bool): If True, only return the `team_submission_uuid` and `team_id`
+            of each team submission.
+
+    Returns:
+        dict: with the keys
+          'team_submissions' The list of serialized team submissions.
+          'next_after_id' The `after_id` of the next page, or None if this is the last page.
+
+    Raises:
+        - TeamSubmissionInternalError if there is an error looking up the team submissions.
+    """
+    team_submissions = TeamSubmission.objects.filter(
+        course_id=course_id,
+        item_id=item_id,
+        id__gt=after_id,
+    ).order_by('id')
+    try:
+        if ids_only:
+            rows = list(team_submissions.values_list('id', 'uuid', 'team_id')[:page_size])
+            last_id = rows[-1][0] if rows else None
+            serialized = [
+                {'team_submission_uuid': str(team_submission_uuid), 'team_id': team_id}
+                for _, team_submission_uuid, team_id in rows
+            ]
+        else:
+            if include_answer:
+                serializer_class = TeamSubmissionSerializer
+                team_submissions = team_submissions.prefetch_related('submissions')
+            else:
+                serializer_class = UnansweredTeamSubmissionSerializer
+                team_submissions = team_submissions.prefetch_related(
+                    Prefetch('submissions', queryset=Submission.objects.only('uuid', 'team_submission'))
+                )
+            page = list(team_submissions[:page_size])
+            last_id = page[-1].id if page else None
+            serialized = serializer_class(page, many=True).data
+    except DatabaseError as exc:
+        err_msg = (
+            f"Attempt to get team submissions for course_id={course_id} item_id={item_id} "
+            f"after id {after_id} caused error: {exc}"
+        )
+        logger.error(err_msg)
+        raise TeamSubmissionInternalError(err_msg) from exc
+
+    return {
+        'team_submissions': serialized,
+        'next_after_id': last_id if len(serialized) == page_size else None,
+    }
+
+
 def get_team_submission_student_ids(team_submission_uuid):
     """
     Returns a list of student_ids for a specific team submission.
@@ -363,8 +574,10 @@ def get_team_ids_by_team_submission_uuid(team_submission_uuids):
 def set_score(team_submission_uuid, points_earned, points_possible,  # pylint: disable=too-many-positional-arguments
               annotation_creator=None, annotation_type=None, annotation_reason=None):
     """Set a score for a particular team submission.  This score is calculated
-    externally to the API.  Should call _api.set_score(...) for each child submission
-    of the TeamSubmission.
+    externally to the API.  The same score is set for each child submission of
+    the TeamSubmission, with one insert for all of the scores (and one for their
+    annotations).  The `score_set` signal is sent for each child submission once
+    the scores are committed.
 
     Args:
         team_submission_uuid (str): UUID for the team submission (must exist).
@@ -383,8 +596,7 @@ def set_score(team_submission_uuid, points_earned, points_possible,  # pylint: d
         TeamSubmissionNotFoundError if the specified team submission does not exist
         TeamSubmissionInternalError if there was an internal error when looking up the submission
         SubmissionNotFoundError if a child submission could not be found
-        SubmissionRequestError if there is an error looking up a child submission
-        SubmissionInternalError if there is an error saving an individual error
+        SubmissionInternalError if there is an error saving the scores
 
     """
     team_submission_dict = get_team_submission(team_submission_uuid)
@@ -399,15 +611,23 @@ def set_score(team_submission_uuid, points_earned, points_possible,  # pylint: d
         }
     )
 
-    with transaction.atomic():
-        for individual_submission_uuid in team_submission_dict['submission_uuids']:
-            _api.set_score(
-                individual_submission_uuid,
-                points_earned, points_possible,
-                annotation_creator,
-                annotation_type,
-                annotation_reason
-            )
+    submissions = _api.get_submission_models_by_uuid(team_submission_dict['submission_uuids'])
+    missing_uuids = [
+        individual_submission_uuid
+        for individual_submission_uuid in team_submission_dict['submission_uuids']
+        if UUID(str(individual_submission_uuid)) not in submissions
+    ]
+    if missing_uuids:
+        raise SubmissionNotFoundError(f"No submission matching uuids {missing_uuids}")
+
+    _api.set_score_for_submissions(
+        list(submissions.values()),
+        points_earned,
+        points_possible,
+        annotation_creator,
+        annotation_type,
+        annotation_reason,
+    )
 
 
 @transaction.atomic
@@ -417,7 +637,9 @@ def reset_scores(team_submission_uuid, clear_state=False):
 
     Note: this does *not* delete `Score` models from the database,
     since these are immutable.  It simply creates a new score with
-    the "reset" flag set to True.
+    the "reset" flag set to True.  The team members are reset together,
+    and the `score_reset` signal is sent for each of them once the reset
+    is committed.
 
     Args:
         team_submission_uuid (str): The uuid for the team submission for which to reset scores.
@@ -434,17 +656,23 @@ def reset_scores(team_submission_uuid, clear_state=False):
     # Get the team submission
     try:
         team_submission = TeamSubmission.get_team_submission_by_uuid(team_submission_uuid)
-        for submission in team_submission.submissions.select_related('student_item').all():
-            _api.reset_score(
-                submission.student_item.student_id,
-                submission.student_item.course_id,
-                submission.student_item.item_id,
-                clear_state=clear_state,
-            )
+        submissions = list(team_submission.submissions.select_related('student_item').all())
+        student_items = list({
+            submission.student_item_id: submission.student_item for submission in submissions
+        }.values())
+        # Reset all of the team members at once: one insert for the reset scores,
+        # and (with clear_state) one update to soft-delete their submissions
+        _api.reset_student_items(student_items, clear_state, emit_signal=True)
         if clear_state:
             # soft-delete the TeamSubmission
             team_submission.status = DELETED
             team_submission.save(update_fields=["status"])
+            _invalidate_team_submission_cache(team_submission, [submission.uuid for submission in submissions])
+            _api.invalidate_top_submissions(
+                team_submission.course_id,
+                team_submission.item_id,
+                {student_item.item_type for student_item in student_items},
+            )
     except (DatabaseError, SubmissionInternalError) as error:
         msg = (
             f"Error occurred while reseting scores for team submission {team_submission_uuid}"
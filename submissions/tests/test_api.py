@@ -12,13 +12,23 @@ import pytz
 from django.core.cache import cache
 from django.db import DatabaseError, IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from freezegun import freeze_time
 
 # Local imports
 from submissions import api
 from submissions.errors import ExternalGraderQueueEmptyError, SubmissionInternalError
-from submissions.models import ExternalGraderDetail, ScoreAnnotation, ScoreSummary, StudentItem, Submission, score_set
+from submissions.models import (
+    ArchivedScore,
+    ExternalGraderDetail,
+    Score,
+    ScoreAnnotation,
+    ScoreSummary,
+    StudentItem,
+    Submission,
+    score_set
+)
 from submissions.serializers import StudentItemSerializer
 
 STUDENT_ITEM = {
@@ -153,6 +163,26 @@ class TestSubmissionsApi(TestCase):
             self.assertEqual(submissions_and_scores[0][2], {})
             self.assertEqual(submissions_and_scores[2][2], {})
 
+    def test_get_course_submissions_prefetches_annotations(self):
+        for student_id in ('Tim', 'Bob', 'Li'):
+            submission = api.create_submission(dict(STUDENT_ITEM, student_id=student_id), ANSWER_ONE)
+            api.set_score(submission['uuid'], 1, 4, 'staff', 'staff_override', 'regrade')
+
+        # One query for the submissions and one for the annotations of their latest scores,
+        # however many rows there are.
+        with self.assertNumQueries(2):
+            submissions_and_scores = list(api.get_all_course_submission_information(
+                STUDENT_ITEM['course_id'],
+                STUDENT_ITEM['item_type'],
+                read_replica=False,
+            ))
+
+        self.assertEqual(len(submissions_and_scores), 3)
+        for _, _, score in submissions_and_scores:
+            self.assertEqual(score['annotations'], [
+                {'creator': 'staff', 'annotation_type': 'staff_override', 'reason': 'regrade'},
+            ])
+
     def test_get_submission(self):
         # Test base case that we can create a submission and get it back
         sub_dict1 = api.create_submission(STUDENT_ITEM, ANSWER_ONE)
@@ -397,6 +427,24 @@ class TestSubmissionsApi(TestCase):
         student_item['student_id'] = None
         self.assertIs(api.get_score(student_item), None)
 
+    def test_get_score_history(self):
+        self.assertEqual(api.get_score_history(STUDENT_ITEM), [])
+
+        submission = api.create_submission(STUDENT_ITEM, ANSWER_ONE)
+        api.set_score(submission["uuid"], 1, 4)
+        api.reset_score(STUDENT_ITEM["student_id"], STUDENT_ITEM["course_id"], STUDENT_ITEM["item_id"])
+        api.set_score(submission["uuid"], 3, 4)
+
+        # Archived scores are merged back into the history in order
+        ArchivedScore.archive_scores(now() + datetime.timedelta(seconds=1))
+        self.assertEqual(ArchivedScore.objects.count(), 2)
+
+        history = api.get_score_history(STUDENT_ITEM)
+        self.assertEqual(
+            [(score["points_earned"], score["points_possible"], score["submission_uuid"]) for score in history],
+            [(1, 4, submission["uuid"]), (0, 0, None), (3, 4, submission["uuid"])],
+        )
+
     @freeze_time(now())
     def test_get_scores(self):
         student_item = copy.deepcopy(STUDENT_ITEM)
@@ -591,6 +639,44 @@ class TestSubmissionsApi(TestCase):
                 ]
             )
 
+    def test_get_top_submissions_ranks_by_ratio(self):
+        for student_id, points_earned, points_possible in (('Tim', 8, 20), ('Bob', 4, 5), ('Li', 6, 10)):
+            submission = api.create_submission(dict(STUDENT_ITEM, student_id=student_id), student_id)
+            api.set_score(submission['uuid'], points_earned, points_possible)
+
+        # The ratios are read from the score summaries, whether or not the scores have been backfilled
+        Score.objects.filter(points_earned=6).update(normalized_score=None)
+
+        top_scores = api.get_top_submissions(
+            STUDENT_ITEM["course_id"],
+            STUDENT_ITEM["item_id"],
+            STUDENT_ITEM["item_type"], 3,
+            use_cache=False,
+            read_replica=False,
+        )
+        self.assertEqual(top_scores, [
+            {"content": "Bob", "score": 4},
+            {"content": "Li", "score": 6},
+            {"content": "Tim", "score": 8},
+        ])
+
+    def test_get_top_submissions_ordered_by_summary_columns(self):
+        submission = api.create_submission(STUDENT_ITEM, ANSWER_ONE)
+        api.set_score(submission['uuid'], 1, 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            api.get_top_submissions(
+                STUDENT_ITEM["course_id"],
+                STUDENT_ITEM["item_id"],
+                STUDENT_ITEM["item_type"], 3,
+                use_cache=False,
+                read_replica=False,
+            )
+        order_by = queries[0]['sql'].split('ORDER BY')[1]
+        self.assertIn('"submissions_scoresummary"."latest_normalized_score" DESC', order_by)
+        self.assertIn('"submissions_scoresummary"."latest_points_earned" DESC', order_by)
+        self.assertNotIn('submissions_score"', order_by)
+
     def test_get_top_submissions_from_cache(self):
         student_item_1 = copy.deepcopy(STUDENT_ITEM)
         student_item_1['student_id'] = 'Tim'
@@ -923,3 +1009,338 @@ class TestSubmissionsApi(TestCase):
         self.assertEqual(submission2.answer, ANSWER_TWO)
 
         self.assertNotEqual(external_grader_detail1.submission.uuid, external_grader_detail2.submission.uuid)
+
+
+class TestSetScoresBulk(TestCase):
+    """
+    Test setting scores in bulk.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.first = api.create_submission(STUDENT_ITEM, ANSWER_ONE)
+        self.second = api.create_submission(SECOND_STUDENT_ITEM, ANSWER_TWO)
+
+    def test_set_scores_bulk(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            results = api.set_scores_bulk([
+                {"submission_uuid": self.first["uuid"], "points_earned": 3, "points_possible": 4},
+                {"submission_uuid": self.second["uuid"], "points_earned": 1, "points_possible": 4},
+            ])
+        self.assertEqual(results, [
+            {"submission_uuid": self.first["uuid"], "success": True, "error": None},
+            {"submission_uuid": self.second["uuid"], "success": True, "error": None},
+        ])
+
+        score = api.get_score(STUDENT_ITEM)
+        self.assertEqual((score["points_earned"], score["points_possible"]), (3, 4))
+        self.assertEqual(score["submission_uuid"], self.first["uuid"])
+        score = api.get_latest_score_for_submission(self.second["uuid"])
+        self.assertEqual((score["points_earned"], score["points_possible"]), (1, 4))
+
+    def test_normalized_scores_are_stored(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            api.set_scores_bulk([
+                {"submission_uuid": self.first["uuid"], "points_earned": 3, "points_possible": 4},
+                {"submission_uuid": self.second["uuid"], "points_earned": 0, "points_possible": 0},
+            ])
+        self.assertEqual(
+            sorted(Score.objects.values_list('normalized_score', flat=True), key=lambda ratio: ratio or 0),
+            [None, 0.75],
+        )
+
+    def test_summaries_follow_set_score_semantics(self):
+        api.set_score(self.first["uuid"], 3, 4)
+        reset_and_more = [
+            {"submission_uuid": self.first["uuid"], "points_earned": 1, "points_possible": 4},
+            {"submission_uuid": self.first["uuid"], "points_earned": 2, "points_possible": 4},
+            {"submission_uuid": self.second["uuid"], "points_earned": 0, "points_possible": 0},
+            {"submission_uuid": self.second["uuid"], "points_earned": 2, "points_possible": 5},
+            {"submission_uuid": self.second["uuid"], "points_earned": 1, "points_possible": 5},
+        ]
+        api.set_scores_bulk(reset_and_more)
+
+        summary = ScoreSummary.objects.get(student_item__student_id=STUDENT_ITEM["student_id"])
+        self.assertEqual((summary.highest.points_earned, summary.latest.points_earned), (3, 2))
+        summary = ScoreSummary.objects.get(student_item__student_id=SECOND_STUDENT_ITEM["student_id"])
+        self.assertEqual((summary.highest.points_earned, summary.latest.points_earned), (2, 1))
+
+    def test_partial_failure(self):
+        results = api.set_scores_bulk([
+            {"submission_uuid": "deadbeef-1234-5678-9100-1234deadbeef", "points_earned": 1, "points_possible": 2},
+            {"submission_uuid": "not-a-uuid", "points_earned": 1, "points_possible": 2},
+            {"submission_uuid": self.first["uuid"], "points_earned": -1, "points_possible": 2},
+            {"submission_uuid": self.second["uuid"], "points_earned": 1, "points_possible": 2},
+        ])
+        self.assertEqual([result["success"] for result in results], [False, False, False, True])
+        self.assertIn("No submission matching uuid", results[0]["error"])
+        self.assertIn("No submission matching uuid", results[1]["error"])
+        self.assertIn("Invalid points", results[2]["error"])
+        self.assertIsNone(api.get_score(STUDENT_ITEM))
+        self.assertIsNotNone(api.get_score(SECOND_STUDENT_ITEM))
+
+    def test_annotations(self):
+        api.set_scores_bulk([
+            {
+                "submission_uuid": self.first["uuid"],
+                "points_earned": 3,
+                "points_possible": 4,
+                "annotation_creator": "staff",
+                "annotation_type": "staff_override",
+                "annotation_reason": "regrade",
+            },
+            {"submission_uuid": self.second["uuid"], "points_earned": 1, "points_possible": 4},
+        ])
+        annotation = ScoreAnnotation.objects.get()
+        self.assertEqual(annotation.score.submission.uuid.hex, self.first["uuid"].replace("-", ""))
+        self.assertEqual(annotation.annotation_type, "staff_override")
+        self.assertEqual(annotation.reason, "regrade")
+
+    def test_signals_sent_after_commit(self):
+        with mock.patch('submissions.api.score_set.send') as mock_send:
+            with self.captureOnCommitCallbacks() as callbacks:
+                api.set_scores_bulk([
+                    {"submission_uuid": self.first["uuid"], "points_earned": 3, "points_possible": 4},
+                    {"submission_uuid": self.second["uuid"], "points_earned": 1, "points_possible": 4},
+                ])
+            mock_send.assert_not_called()
+            for callback in callbacks:
+                callback()
+        self.assertEqual(mock_send.call_count, 2)
+        self.assertEqual(mock_send.call_args_list[0][1]["anonymous_user_id"], STUDENT_ITEM["student_id"])
+        self.assertEqual(mock_send.call_args_list[1][1]["points_earned"], 1)
+
+    def test_query_count_is_constant(self):
+        more_students = [dict(STUDENT_ITEM, student_id=f"student_{index}") for index in range(10)]
+        submissions = [api.create_submission(student_item, ANSWER_ONE) for student_item in more_students]
+        scores = [
+            {"submission_uuid": submission["uuid"], "points_earned": 1, "points_possible": 2}
+            for submission in submissions
+        ]
+        # Submission lookup, savepoint, score insert, summary lookup, and the
+        # summary insert in its own savepoint, whatever the size of the batch
+        with self.assertNumQueries(8):
+            api.set_scores_bulk(scores[:5])
+        with self.assertNumQueries(8):
+            api.set_scores_bulk(scores[5:])
+
+        # Rescoring: submission lookup, savepoint, score insert, summary and
+        # highest score lookups and a single summary update
+        with self.assertNumQueries(7):
+            api.set_scores_bulk(scores)
+
+    def test_database_error(self):
+        with mock.patch('submissions.api.ScoreAnnotation.objects.bulk_create', side_effect=DatabaseError):
+            results = api.set_scores_bulk([
+                {"submission_uuid": self.first["uuid"], "points_earned": 3, "points_possible": 4},
+            ])
+        self.assertFalse(results[0]["success"])
+        self.assertIn("Could not save score", results[0]["error"])
+        self.assertIsNone(api.get_score(STUDENT_ITEM))
+
+    def test_batch_error_isolated_to_failing_items(self):
+        original_bulk_create = ScoreAnnotation.objects.bulk_create
+
+        def fail_with_annotations(annotations):
+            if annotations:
+                raise DatabaseError("annotation rejected")
+            return original_bulk_create(annotations)
+
+        with mock.patch('submissions.api.ScoreAnnotation.objects.bulk_create', side_effect=fail_with_annotations):
+            results = api.set_scores_bulk([
+                {
+                    "submission_uuid": self.first["uuid"],
+                    "points_earned": 3,
+                    "points_possible": 4,
+                    "annotation_creator": "staff",
+                },
+                {"submission_uuid": self.second["uuid"], "points_earned": 1, "points_possible": 4},
+            ])
+        self.assertEqual([result["success"] for result in results], [False, True])
+        self.assertEqual(results[0]["error"], "Could not save score: annotation rejected")
+        self.assertIsNone(api.get_score(STUDENT_ITEM))
+        self.assertEqual(api.get_score(SECOND_STUDENT_ITEM)["points_earned"], 1)
+        self.assertEqual(Score.objects.count(), 1)
+
+    def test_missing_submission_uuid(self):
+        results = api.set_scores_bulk([
+            {"points_earned": 1, "points_possible": 2},
+            {"submission_uuid": self.second["uuid"], "points_earned": 1, "points_possible": 2},
+        ])
+        self.assertEqual(results[0], {"submission_uuid": None, "success": False, "error": "Missing submission_uuid"})
+        self.assertTrue(results[1]["success"])
+
+    def test_without_bulk_insert_returning(self):
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            # Submission lookup, savepoint, score insert, score ids lookup,
+            # summary lookup, summary insert in its own savepoint, annotation insert
+            with self.assertNumQueries(10):
+                results = api.set_scores_bulk([
+                    {"submission_uuid": self.first["uuid"], "points_earned": 3, "points_possible": 4},
+                    {"submission_uuid": self.second["uuid"], "points_earned": 2, "points_possible": 4},
+                    {
+                        "submission_uuid": self.first["uuid"],
+                        "points_earned": 1,
+                        "points_possible": 4,
+                        "annotation_creator": "staff",
+                        "annotation_type": "staff_override",
+                        "annotation_reason": "regrade",
+                    },
+                ])
+        self.assertTrue(all(result["success"] for result in results))
+        summary = ScoreSummary.objects.get(student_item__student_id=STUDENT_ITEM["student_id"])
+        self.assertEqual((summary.highest.points_earned, summary.latest.points_earned), (3, 1))
+        summary = ScoreSummary.objects.get(student_item__student_id=SECOND_STUDENT_ITEM["student_id"])
+        self.assertEqual((summary.highest.points_earned, summary.latest.points_earned), (2, 2))
+        self.assertEqual(ScoreAnnotation.objects.get().score.points_earned, 1)
+
+    def test_ids_read_back_for_scored_and_reset_rows(self):
+        submission = Submission.objects.get(uuid=self.first["uuid"])
+        second_submission = Submission.objects.get(uuid=self.second["uuid"])
+        score_models = [
+            Score(student_item=submission.student_item, submission=submission, points_earned=3, points_possible=4),
+            Score(student_item=second_submission.student_item, reset=True),
+            Score(student_item=submission.student_item, reset=True),
+        ]
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            api._create_scores(score_models)  # pylint: disable=protected-access
+        for score_model in score_models:
+            saved = Score.objects.get(id=score_model.id)
+            self.assertEqual(
+                (saved.student_item_id, saved.submission_id, saved.reset),
+                (score_model.student_item_id, score_model.submission_id, score_model.reset),
+            )
+
+    def test_ids_not_read_back(self):
+        submission = Submission.objects.get(uuid=self.first["uuid"])
+        score_model = Score(student_item=submission.student_item, submission=submission, points_earned=3,
+                            points_possible=4)
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            # The inserted rows can't be found
+            with mock.patch('django.db.models.query.QuerySet.bulk_create'):
+                with self.assertRaises(DatabaseError):
+                    api._create_scores([score_model])  # pylint: disable=protected-access
+
+
+@ddt.ddt
+class TestScoreStatistics(TestCase):
+    """
+    Test the score statistics of an item.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.submissions = {}
+        for student_id, points_earned, points_possible in (('Tim', 1, 5), ('Bob', 3, 5), ('Li', 10, 10)):
+            student_item = dict(STUDENT_ITEM, student_id=student_id)
+            self.submissions[student_id] = api.create_submission(student_item, ANSWER_ONE)
+            api.set_score(self.submissions[student_id]['uuid'], points_earned, points_possible)
+
+    def _get_statistics(self, **kwargs):
+        kwargs.setdefault('read_replica', False)
+        return api.get_score_statistics(
+            STUDENT_ITEM['course_id'], STUDENT_ITEM['item_id'], STUDENT_ITEM['item_type'], **kwargs
+        )
+
+    def test_statistics(self):
+        with self.assertNumQueries(1):
+            statistics = self._get_statistics(buckets=2, percentiles=[0, 50, 100])
+        self.assertEqual(statistics['count'], 3)
+        self.assertAlmostEqual(statistics['mean'], 0.6)
+        self.assertAlmostEqual(statistics['min'], 0.2)
+        self.assertAlmostEqual(statistics['max'], 1.0)
+        self.assertEqual(statistics['histogram'], [
+            {'lower': 0.0, 'upper': 0.5, 'count': 1},
+            {'lower': 0.5, 'upper': 1.0, 'count': 2},
+        ])
+        self.assertEqual(list(statistics['percentiles']), [0, 50, 100])
+        self.assertAlmostEqual(statistics['percentiles'][0], 0.2)
+        self.assertAlmostEqual(statistics['percentiles'][50], 0.625)
+        self.assertAlmostEqual(statistics['percentiles'][100], 1.0)
+
+    def test_custom_buckets(self):
+        statistics = self._get_statistics(buckets=[0, 0.5, 0.6, 0.9])
+        self.assertEqual([bucket['count'] for bucket in statistics['histogram']], [1, 0, 2])
+        self.assertNotIn('percentiles', statistics)
+
+    def test_buckets_cover_ratios_outside_the_edges(self):
+        # 0.2 and 0.6 are below the first edge, 1.0 is above the last one
+        statistics = self._get_statistics(buckets=[0.7, 0.8, 0.9], percentiles=[0, 50, 100])
+        self.assertEqual(statistics['histogram'], [
+            {'lower': 0.7, 'upper': 0.8, 'count': 2},
+            {'lower': 0.8, 'upper': 0.9, 'count': 1},
+        ])
+        self.assertEqual(sum(bucket['count'] for bucket in statistics['histogram']), statistics['count'])
+        self.assertAlmostEqual(statistics['percentiles'][0], 0.2)
+        self.assertAlmostEqual(statistics['percentiles'][100], 1.0)
+
+    def test_hidden_and_other_items_are_excluded(self):
+        api.reset_score('Tim', STUDENT_ITEM['course_id'], STUDENT_ITEM['item_id'])
+        other = api.create_submission(dict(STUDENT_ITEM, item_id='other_item'), ANSWER_ONE)
+        api.set_score(other['uuid'], 0, 5)
+        statistics = self._get_statistics(percentiles=[50])
+        self.assertEqual(statistics['count'], 2)
+        self.assertAlmostEqual(statistics['min'], 0.6)
+
+    def test_no_scores(self):
+        statistics = api.get_score_statistics(
+            'other_course', 'item', 'type', buckets=1, percentiles=[50], read_replica=False
+        )
+        self.assertEqual(statistics, {
+            'count': 0,
+            'mean': None,
+            'min': None,
+            'max': None,
+            'histogram': [{'lower': 0.0, 'upper': 1.0, 'count': 0}],
+            'percentiles': {50: None},
+        })
+
+    def test_cached_until_score_write(self):
+        self._get_statistics()
+        self._get_statistics(buckets=4)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._get_statistics()['count'], 3)
+            self.assertEqual(self._get_statistics(buckets=4)['count'], 3)
+
+        api.set_score(self.submissions['Tim']['uuid'], 5, 5)
+        self.assertAlmostEqual(self._get_statistics()['min'], 0.6)
+
+        api.reset_score('Li', STUDENT_ITEM['course_id'], STUDENT_ITEM['item_id'])
+        self.assertEqual(self._get_statistics(buckets=4)['count'], 2)
+
+        api.set_scores_bulk([{"submission_uuid": self.submissions['Bob']['uuid'], "points_earned": 0,
+                              "points_possible": 5}])
+        self.assertAlmostEqual(self._get_statistics()['min'], 0.0)
+
+        api.reset_scores_for_item(STUDENT_ITEM['course_id'], STUDENT_ITEM['item_id'])
+        self.assertEqual(self._get_statistics()['count'], 0)
+
+    def test_read_replica(self):
+        cache.clear()  # Past the replica lag window of the scores set in setUp
+        with mock.patch('submissions.api._use_read_replica', side_effect=lambda queryset: queryset) as mock_replica:
+            self._get_statistics(read_replica=True)
+        mock_replica.assert_called_once()
+
+    def test_primary_after_score_write(self):
+        # Statistics read from a replica that has not caught up yet would stay cached
+        api.set_score(self.submissions['Tim']['uuid'], 5, 5)
+        with mock.patch('submissions.api._use_read_replica', side_effect=lambda queryset: queryset) as mock_replica:
+            self.assertAlmostEqual(self._get_statistics(read_replica=True)['min'], 0.6)
+        mock_replica.assert_not_called()
+
+    @ddt.data(
+        {'buckets': 0},
+        {'buckets': [0.5]},
+        {'buckets': [0.5, 0.2]},
+        {'percentiles': [101]},
+    )
+    def test_invalid_arguments(self, kwargs):
+        with self.assertRaises(api.SubmissionRequestError):
+            self._get_statistics(**kwargs)
+
+    def test_database_error(self):
+        with mock.patch.object(ScoreSummary.objects, 'filter', side_effect=DatabaseError):
+            with self.assertRaises(SubmissionInternalError):
+                self._get_statistics()
@@ -0,0 +1,290 @@
+"""
+Tests for the submissions cache helpers.
+"""
+
+import datetime
+import pickle
+from unittest import mock
+from uuid import UUID, uuid4
+
+import ddt
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from submissions import api, caching
+from submissions.caching import LocalLRUCache
+from submissions.models import Submission
+
+STUDENT_ITEM = {
+    "student_id": "Tim",
+    "course_id": "Demo_Course",
+    "item_id": "item_one",
+    "item_type": "Peer_Submission",
+}
+
+
+class TestLocalLRUCache(TestCase):
+    """ Test the in-process LRU tier on its own. """
+
+    def test_hit_and_miss(self):
+        local_cache = LocalLRUCache(2)
+        self.assertIsNone(local_cache.get('a'))
+        local_cache.set('a', {'value': 1})
+        self.assertEqual(local_cache.get('a'), {'value': 1})
+        self.assertEqual(local_cache.stats(), {
+            'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 0, 'size': 1,
+        })
+
+    def test_returns_copies(self):
+        local_cache = LocalLRUCache(2)
+        value = {'value': 1, 'nested': {'parts': [1]}}
+        local_cache.set('a', value)
+        value['nested']['parts'].append(2)
+        local_cache.get('a')['value'] = 2
+        local_cache.get('a')['nested']['parts'][0] = 3
+        self.assertEqual(local_cache.get('a'), {'value': 1, 'nested': {'parts': [1]}})
+
+    def test_hits_are_not_unpickled(self):
+        local_cache = LocalLRUCache(2)
+        submitted_at = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        value = {
+            'uuid': uuid4(),
+            'submitted_at': submitted_at,
+            'answer': {'parts': [{'text': 'answer'}], 'edges': (0.0, 0.5)},
+        }
+        local_cache.set('a', value)
+        with mock.patch('submissions.caching.pickle.loads') as mock_loads:
+            cached = local_cache.get('a')
+        mock_loads.assert_not_called()
+        self.assertEqual(cached, value)
+        self.assertIsInstance(cached['answer']['parts'], list)
+        self.assertIsInstance(cached['answer']['edges'], tuple)
+        # Immutable values are shared rather than copied
+        self.assertIs(cached['submitted_at'], submitted_at)
+
+    def test_other_types_are_copied(self):
+        local_cache = LocalLRUCache(2)
+        local_cache.set('a', {'tags': {'a'}})
+        local_cache.get('a')['tags'].add('b')
+        self.assertEqual(local_cache.get('a'), {'tags': {'a'}})
+
+    def test_evicts_least_recently_used(self):
+        local_cache = LocalLRUCache(2)
+        local_cache.set('a', 1)
+        local_cache.set('b', 2)
+        local_cache.get('a')
+        local_cache.set('c', 3)
+        self.assertIsNone(local_cache.get('b'))
+        self.assertEqual(local_cache.get('a'), 1)
+        self.assertEqual(local_cache.get('c'), 3)
+        self.assertEqual(local_cache.stats()['evictions'], 1)
+
+    def test_expires(self):
+        local_cache = LocalLRUCache(2, ttl=10)
+        with mock.patch('submissions.caching.time.monotonic', return_value=100):
+            local_cache.set('a', 1)
+        with mock.patch('submissions.caching.time.monotonic', return_value=105):
+            self.assertEqual(local_cache.get('a'), 1)
+        with mock.patch('submissions.caching.time.monotonic', return_value=111):
+            self.assertIsNone(local_cache.get('a'))
+        self.assertEqual(local_cache.stats()['expirations'], 1)
+
+    def test_delete_many(self):
+        local_cache = LocalLRUCache(3)
+        local_cache.set('a', 1)
+        local_cache.set('b', 2)
+        local_cache.delete_many(['a', 'missing'])
+        self.assertIsNone(local_cache.get('a'))
+        self.assertEqual(local_cache.get('b'), 2)
+
+
+class TestGenerations(TestCase):
+    """ Test the generations that invalidate families of cache keys. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_generation(self):
+        generation = caching.get_generation('generation')
+        self.assertEqual(caching.get_generation('generation'), generation)
+        caching.bump_generation('generation')
+        self.assertNotEqual(caching.get_generation('generation'), generation)
+
+    def test_evicted_generation_is_not_reused(self):
+        generation = caching.get_generation('generation')
+        cache.delete('generation')
+        self.assertNotEqual(caching.get_generation('generation'), generation)
+
+
+class TestLocalCacheTier(TestCase):
+    """ Test the local tier in front of the shared cache. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(caching.get_local_cache())
+        self.assertIsNone(caching.local_cache_stats())
+
+    @override_settings(SUBMISSIONS_LOCAL_CACHE_SIZE=10)
+    def test_get_submission_uses_local_tier(self):
+        submission = api.create_submission(STUDENT_ITEM, "answer")
+        api.get_submission_and_student(submission['uuid'])
+
+        # The shared cache is not consulted again once the local tier has the payload
+        with mock.patch('submissions.caching.cache.get') as mock_get:
+            with self.assertNumQueries(0):
+                retrieved = api.get_submission_and_student(submission['uuid'])
+            mock_get.assert_not_called()
+        self.assertEqual(retrieved['student_item'], STUDENT_ITEM)
+
+        # The student item replaced in the returned dict does not leak into the cached submission
+        self.assertEqual(api.get_submission(submission['uuid'])['student_item'], submission['student_item'])
+        self.assertEqual(caching.local_cache_stats()['hits'], 3)
+
+    @override_settings(SUBMISSIONS_LOCAL_CACHE_SIZE=10)
+    def test_nested_answer_mutations_do_not_leak(self):
+        answer = {'parts': [{'text': 'original'}]}
+        submission = api.create_submission(STUDENT_ITEM, answer)
+        api.get_submission(submission['uuid'])['answer']['parts'][0]['text'] = 'mutated'
+        self.assertEqual(api.get_submission(submission['uuid'])['answer'], answer)
+        self.assertEqual(caching.local_cache_stats()['hits'], 1)
+
+    @override_settings(SUBMISSIONS_LOCAL_CACHE_SIZE=10)
+    def test_shared_cache_hit_populates_local_tier(self):
+        submission = api.create_submission(STUDENT_ITEM, "answer")
+        api.get_submission(submission['uuid'])
+        caching.get_local_cache().clear()
+
+        api.get_submission(submission['uuid'])
+        self.assertEqual(caching.local_cache_stats()['size'], 1)
+
+    @override_settings(SUBMISSIONS_LOCAL_CACHE_SIZE=10)
+    def test_reset_score_invalidates_local_tier(self):
+        submission = api.create_submission(STUDENT_ITEM, "answer")
+        api.get_submission(submission['uuid'])
+
+        api.reset_score(
+            STUDENT_ITEM['student_id'], STUDENT_ITEM['course_id'], STUDENT_ITEM['item_id'], clear_state=True
+        )
+        self.assertIsNone(caching.get_local_cache().get(Submission.get_cache_key(submission['uuid'])))
+        with self.assertRaises(api.SubmissionNotFoundError):
+            api.get_submission(submission['uuid'])
+
+
+@ddt.ddt
+class TestCacheCodecs(TestCase):
+    """ Test the compact encoding of cached payloads. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    @ddt.data("answer", {"text": "answer", "files": ["a", "b"]})
+    def test_submission_round_trip(self, answer):
+        submission = api.create_submission(STUDENT_ITEM, answer)
+        expected = api.get_submission(submission['uuid'])
+        self.assertEqual(caching.SUBMISSION_CODEC.decode(caching.SUBMISSION_CODEC.encode(expected)), expected)
+
+    def test_team_submission_uuid_round_trip(self):
+        payload = {
+            'uuid': str(uuid4()),
+            'student_item': 1,
+            'attempt_number': 1,
+            'submitted_at': datetime.datetime(2020, 1, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'created_at': datetime.datetime(2020, 1, 1, 12, 30, 16, tzinfo=datetime.timezone.utc),
+            'answer': 'answer',
+            'team_submission_uuid': uuid4(),
+        }
+        decoded = caching.SUBMISSION_CODEC.decode(caching.SUBMISSION_CODEC.encode(payload))
+        self.assertEqual(decoded, payload)
+        self.assertIsInstance(decoded['team_submission_uuid'], UUID)
+        self.assertIsInstance(decoded['uuid'], str)
+
+    def test_team_submission_round_trip(self):
+        payload = {
+            'team_submission_uuid': str(uuid4()),
+            'attempt_number': 1,
+            'submitted_at': datetime.datetime(2020, 1, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'course_id': STUDENT_ITEM['course_id'],
+            'item_id': STUDENT_ITEM['item_id'],
+            'team_id': 'team',
+            'submitted_by': None,
+            'created_at': datetime.datetime(2020, 1, 1, 12, 30, 16, tzinfo=datetime.timezone.utc),
+            'answer': {'text': 'answer'},
+            'submission_uuids': [uuid4(), uuid4()],
+        }
+        self.assertEqual(
+            caching.TEAM_SUBMISSION_CODEC.decode(caching.TEAM_SUBMISSION_CODEC.encode(payload)),
+            payload,
+        )
+
+    def test_encoding_is_smaller(self):
+        submission = api.create_submission(STUDENT_ITEM, {"text": "answer"})
+        payload = api.get_submission(submission['uuid'])
+        self.assertLess(len(caching.SUBMISSION_CODEC.encode(payload)), len(pickle.dumps(dict(payload))))
+
+    def test_student_item_round_trip(self):
+        encoded = caching.STUDENT_ITEM_CODEC.encode(STUDENT_ITEM)
+        self.assertEqual(caching.STUDENT_ITEM_CODEC.decode(encoded), STUDENT_ITEM)
+
+    def test_top_submissions_round_trip(self):
+        payload = [{'score': 10, 'content': 'first'}, {'score': 5, 'content': {'text': 'second'}}]
+        encoded = caching.TOP_SUBMISSIONS_CODEC.encode(payload)
+        self.assertEqual(caching.TOP_SUBMISSIONS_CODEC.decode(encoded), payload)
+        self.assertEqual(caching.TOP_SUBMISSIONS_CODEC.decode(caching.TOP_SUBMISSIONS_CODEC.encode([])), [])
+
+    @override_settings(SUBMISSIONS_CACHE_COMPRESSION_THRESHOLD=100)
+    def test_compression(self):
+        payload = [{'score': 10, 'content': 'x' * 1000}]
+        encoded = caching.TOP_SUBMISSIONS_CODEC.encode(payload)
+        self.assertEqual(encoded[:1], b'\x01')
+        self.assertLess(len(encoded), 200)
+        self.assertEqual(caching.TOP_SUBMISSIONS_CODEC.decode(encoded), payload)
+
+    @override_settings(SUBMISSIONS_CACHE_COMPRESSION_THRESHOLD=None)
+    def test_compression_disabled(self):
+        encoded = caching.TOP_SUBMISSIONS_CODEC.encode([{'score': 10, 'content': 'x' * 10000}])
+        self.assertEqual(encoded[:1], b'\x00')
+
+    def test_unencoded_values_pass_through(self):
+        self.assertEqual(caching.STUDENT_ITEM_CODEC.decode(STUDENT_ITEM), STUDENT_ITEM)
+        self.assertIsNone(caching.STUDENT_ITEM_CODEC.decode(None))
+
+    def test_unknown_version_is_a_miss(self):
+        encoded = caching.STUDENT_ITEM_CODEC.encode(STUDENT_ITEM)
+        with mock.patch('submissions.caching.CODEC_SCHEMA_VERSION', 2):
+            self.assertIsNone(caching.STUDENT_ITEM_CODEC.decode(encoded))
+        self.assertIsNone(caching.STUDENT_ITEM_CODEC.decode(b'\x07garbage'))
+        self.assertIsNone(caching.STUDENT_ITEM_CODEC.decode(b'\x01garbage'))
+
+    def test_get_submission_stores_encoded_payload(self):
+        submission = api.create_submission(STUDENT_ITEM, "answer")
+        expected = api.get_submission(submission['uuid'])
+
+        cache_key = Submission.get_cache_key(submission['uuid'])
+        self.assertIsNone(cache.get(cache_key))
+        self.assertIsInstance(cache.get(f"{cache_key}.v{caching.CODEC_SCHEMA_VERSION}"), bytes)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(api.get_submission(submission['uuid']), expected)
+
+        caching.delete_many([cache_key])
+        self.assertIsNone(caching.get(cache_key, codec=caching.SUBMISSION_CODEC))
+
+    @override_settings(SUBMISSIONS_CACHE_COMPACT_ENCODING=False)
+    def test_encoding_disabled(self):
+        submission = api.create_submission(STUDENT_ITEM, "answer")
+        expected = api.get_submission(submission['uuid'])
+        self.assertEqual(cache.get(Submission.get_cache_key(submission['uuid'])), expected)
+
+    def test_top_submissions_cached_encoded(self):
+        submission = api.create_submission(STUDENT_ITEM, "answer")
+        api.set_score(submission['uuid'], 3, 4)
+        args = (STUDENT_ITEM['course_id'], STUDENT_ITEM['item_id'], STUDENT_ITEM['item_type'], 5)
+        expected = api.get_top_submissions(*args, read_replica=False)
+        self.assertEqual(expected, [{'score': 3, 'content': 'answer'}])
+        with self.assertNumQueries(0):
+            self.assertEqual(api.get_top_submissions(*args, read_replica=False), expected)
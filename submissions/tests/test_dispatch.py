@@ -0,0 +1,230 @@
+"""
+Tests for deferred score signal dispatch.
+"""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from submissions import api as sub_api
+from submissions.dispatch import (
+    DEFERRED,
+    InlineExecutor,
+    SignalDispatcher,
+    _flush_at_exit,
+    get_dispatcher,
+    send_score_signal,
+    set_dispatcher
+)
+from submissions.models import score_reset, score_set
+
+STUDENT_ITEM = {
+    "student_id": "Tim",
+    "course_id": "Demo_Course",
+    "item_id": "item_one",
+    "item_type": "Peer_Submission",
+}
+
+
+class RecordingExecutor:
+    """ Executor that holds submitted batches until run() is called. """
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append((fn, args))
+
+    def run(self):
+        for fn, args in self.submitted:
+            fn(*args)
+        self.submitted = []
+
+
+class SignalDispatcherTest(TestCase):
+    """ Test the signal dispatcher on its own. """
+
+    def setUp(self):
+        super().setUp()
+        self.received = []
+        score_set.connect(self._receiver)
+        score_reset.connect(self._receiver)
+        self.addCleanup(score_set.disconnect, self._receiver)
+        self.addCleanup(score_reset.disconnect, self._receiver)
+
+    def _receiver(self, signal, **kwargs):
+        self.received.append((signal, kwargs['anonymous_user_id'], kwargs.get('points_earned')))
+
+    def _send_score(self, student_id, points_earned):
+        send_score_signal(
+            score_set,
+            points_earned=points_earned,
+            points_possible=10,
+            anonymous_user_id=student_id,
+            course_id='course',
+            item_id='item',
+        )
+
+    def test_sync_by_default(self):
+        set_dispatcher(None)
+        self.addCleanup(set_dispatcher, None)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self._send_score('Tim', 1)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.received, [(score_set, 'Tim', 1)])
+
+    def test_deferred_until_commit(self):
+        set_dispatcher(SignalDispatcher(DEFERRED, executor=InlineExecutor()))
+        self.addCleanup(set_dispatcher, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._send_score('Tim', 1)
+            self.assertEqual(self.received, [])
+        self.assertEqual(self.received, [(score_set, 'Tim', 1)])
+
+    def test_rolled_back_signals_are_not_sent(self):
+        set_dispatcher(SignalDispatcher(DEFERRED, executor=InlineExecutor()))
+        self.addCleanup(set_dispatcher, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self._send_score('Tim', 1)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(self.received, [])
+
+    def test_coalesced_and_batched(self):
+        executor = RecordingExecutor()
+        dispatcher = SignalDispatcher(DEFERRED, executor=executor, window=60)
+        set_dispatcher(dispatcher)
+        self.addCleanup(set_dispatcher, None)
+
+        with mock.patch('submissions.dispatch.threading.Timer') as mock_timer:
+            with self.captureOnCommitCallbacks(execute=True):
+                self._send_score('Tim', 1)
+                self._send_score('Bob', 2)
+                self._send_score('Tim', 3)
+                send_score_signal(score_reset, anonymous_user_id='Tim', course_id='course', item_id='item')
+        mock_timer.assert_called_once_with(60, dispatcher.flush)
+        self.assertEqual(dispatcher.pending_count(), 3)
+        self.assertEqual(executor.submitted, [])
+
+        dispatcher.flush()
+        self.assertEqual(len(executor.submitted), 1)
+        executor.run()
+        self.assertEqual(self.received, [
+            (score_set, 'Bob', 2),
+            (score_set, 'Tim', 3),
+            (score_reset, 'Tim', None),
+        ])
+
+    def test_batch_size(self):
+        executor = RecordingExecutor()
+        set_dispatcher(SignalDispatcher(DEFERRED, executor=executor, window=60, batch_size=2))
+        self.addCleanup(set_dispatcher, None)
+        with mock.patch('submissions.dispatch.threading.Timer'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self._send_score('Tim', 1)
+                self._send_score('Bob', 2)
+        self.assertEqual(len(executor.submitted), 1)
+        self.assertEqual(get_dispatcher().pending_count(), 0)
+
+    def test_receiver_errors_are_logged(self):
+        set_dispatcher(SignalDispatcher(DEFERRED, executor=InlineExecutor()))
+        self.addCleanup(set_dispatcher, None)
+
+        def failing_receiver(**kwargs):
+            raise ValueError('boom')
+
+        score_set.connect(failing_receiver)
+        self.addCleanup(score_set.disconnect, failing_receiver)
+        with mock.patch('submissions.dispatch.logger') as mock_logger:
+            with self.captureOnCommitCallbacks(execute=True):
+                self._send_score('Tim', 1)
+        mock_logger.error.assert_called_once()
+        self.assertEqual(self.received, [(score_set, 'Tim', 1)])
+
+    def test_connections_recycled_around_delivery(self):
+        set_dispatcher(SignalDispatcher(DEFERRED, executor=InlineExecutor()))
+        self.addCleanup(set_dispatcher, None)
+        idle_connection = mock.Mock(in_atomic_block=False)
+        busy_connection = mock.Mock(in_atomic_block=True)
+        with mock.patch('submissions.dispatch.connections') as mock_connections:
+            mock_connections.all.return_value = [idle_connection, busy_connection]
+            with self.captureOnCommitCallbacks(execute=True):
+                self._send_score('Tim', 1)
+        mock_connections.all.assert_called_with(initialized_only=True)
+        self.assertEqual(idle_connection.close_if_unusable_or_obsolete.call_count, 2)
+        busy_connection.close_if_unusable_or_obsolete.assert_not_called()
+        self.assertEqual(self.received, [(score_set, 'Tim', 1)])
+
+    def test_flush_at_exit(self):
+        executor = RecordingExecutor()
+        set_dispatcher(SignalDispatcher(DEFERRED, executor=executor, window=60))
+        self.addCleanup(set_dispatcher, None)
+        with mock.patch('submissions.dispatch.threading.Timer'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self._send_score('Tim', 1)
+        self.assertEqual(self.received, [])
+
+        _flush_at_exit()
+        self.assertEqual(self.received, [(score_set, 'Tim', 1)])
+        self.assertEqual(executor.submitted, [])
+        self.assertEqual(get_dispatcher().pending_count(), 0)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            SignalDispatcher('eventually')
+
+    @override_settings(
+        SUBMISSIONS_SIGNAL_DISPATCH=DEFERRED,
+        SUBMISSIONS_SIGNAL_COALESCE_WINDOW=5,
+        SUBMISSIONS_SIGNAL_EXECUTOR='submissions.dispatch.InlineExecutor',
+    )
+    def test_settings(self):
+        dispatcher = get_dispatcher()
+        self.assertEqual(dispatcher.mode, DEFERRED)
+        self.assertEqual(dispatcher.window, 5)
+        self.assertIsInstance(dispatcher._get_executor(), InlineExecutor)  # pylint: disable=protected-access
+
+
+@override_settings(
+    SUBMISSIONS_SIGNAL_DISPATCH=DEFERRED,
+    SUBMISSIONS_SIGNAL_EXECUTOR='submissions.dispatch.InlineExecutor',
+)
+class DeferredApiSignalsTest(TestCase):
+    """ Test the API with deferred signal dispatch. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.submission = sub_api.create_submission(STUDENT_ITEM, "answer")
+
+    @override_settings(SUBMISSIONS_SIGNAL_COALESCE_WINDOW=60)
+    def test_set_score_coalesced(self):
+        with mock.patch('submissions.api.score_set') as mock_signal, mock.patch('submissions.dispatch.threading.Timer'):
+            mock_signal.send_robust.return_value = []
+            with self.captureOnCommitCallbacks(execute=True):
+                sub_api.set_score(self.submission['uuid'], 1, 4)
+                sub_api.set_score(self.submission['uuid'], 3, 4)
+            mock_signal.send_robust.assert_not_called()
+            get_dispatcher().flush()
+        mock_signal.send.assert_not_called()
+        mock_signal.send_robust.assert_called_once()
+        self.assertEqual(mock_signal.send_robust.call_args.kwargs['points_earned'], 3)
+
+    def test_reset_score_deferred(self):
+        with mock.patch('submissions.api.score_reset') as mock_signal:
+            mock_signal.send_robust.return_value = []
+            with self.captureOnCommitCallbacks(execute=True):
+                sub_api.reset_score(STUDENT_ITEM['student_id'], STUDENT_ITEM['course_id'], STUDENT_ITEM['item_id'])
+                mock_signal.send_robust.assert_not_called()
+        mock_signal.send_robust.assert_called_once_with(
+            sender=None,
+            anonymous_user_id=STUDENT_ITEM['student_id'],
+            course_id=STUDENT_ITEM['course_id'],
+            item_id=STUDENT_ITEM['item_id'],
+            created_at=mock.ANY,
+        )
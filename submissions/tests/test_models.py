@@ -1,26 +1,37 @@
 """
 Tests for submission models.
 """
+import threading
 import time
 from datetime import datetime, timedelta
+from importlib import import_module
 from unittest import mock
 
 import pytest
+from django.apps import apps
 from django.contrib import auth
-from django.test import TestCase
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.db.models.query import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.utils.timezone import now
+from freezegun import freeze_time
 from pytz import UTC
 
 from submissions.errors import TeamSubmissionInternalError, TeamSubmissionNotFoundError
 from submissions.models import (
+    ACTIVE,
     DELETED,
+    ArchivedScore,
     DuplicateTeamSubmissionsError,
     ExternalGraderDetail,
+    ExternalGraderQueueCounter,
     Score,
     ScoreSummary,
     StudentItem,
     Submission,
-    TeamSubmission
+    TeamSubmission,
+    TeamSubmissionMembership
 )
 
 User = auth.get_user_model()
@@ -184,6 +195,187 @@ class TestScoreSummary(TestCase):
         self.assertEqual(highest.points_earned, 1)
         self.assertEqual(highest.points_possible, 2)
 
+    def test_highest_compares_ratios(self):
+        item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/special_presentation"
+        )
+        first = Score.objects.create(student_item=item, points_earned=2, points_possible=3)
+
+        # 3/5 is lower than 2/3, even though more points were earned
+        Score.objects.create(student_item=item, points_earned=3, points_possible=5)
+        self.assertEqual(ScoreSummary.objects.get(student_item=item).highest, first)
+
+        # An equal ratio does not replace the current highest score
+        Score.objects.create(student_item=item, points_earned=4, points_possible=6)
+        self.assertEqual(ScoreSummary.objects.get(student_item=item).highest, first)
+
+        best = Score.objects.create(student_item=item, points_earned=7, points_possible=10)
+        self.assertEqual(ScoreSummary.objects.get(student_item=item).highest, best)
+
+    def test_update_is_a_single_query(self):
+        item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/special_presentation"
+        )
+        # Creating the summary takes an (empty) update and an insert inside a savepoint
+        with self.assertNumQueries(5):
+            Score.objects.create(student_item=item, points_earned=1, points_possible=2)
+
+        # Once it exists, each new score costs its own insert plus one update
+        with self.assertNumQueries(2):
+            Score.objects.create(student_item=item, points_earned=2, points_possible=2)
+        with self.assertNumQueries(2):
+            Score.create_reset_score(item)
+
+    def test_concurrent_summary_creation(self):
+        item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/special_presentation"
+        )
+        first = Score.objects.create(student_item=item, points_earned=1, points_possible=2)
+
+        # Simulate another writer creating the summary after our update found nothing to update
+        with mock.patch.object(ScoreSummary, 'apply_score', side_effect=[False, True]) as mock_apply:
+            second = Score.objects.create(student_item=item, points_earned=2, points_possible=2)
+        self.assertEqual(mock_apply.call_count, 2)
+        mock_apply.assert_called_with(second)
+        self.assertEqual(ScoreSummary.objects.get(student_item=item).latest, first)
+
+    def test_rebuild_replays_archived_scores(self):
+        item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/special_presentation"
+        )
+        submission = Submission.objects.create(student_item=item, attempt_number=1)
+        Score.objects.create(student_item=item, submission=submission, points_earned=4, points_possible=4)
+        Score.create_reset_score(item)
+        expected = Score.objects.create(student_item=item, points_earned=1, points_possible=4)
+        ArchivedScore.archive_scores(now() + timedelta(seconds=1))
+        self.assertTrue(ArchivedScore.objects.filter(reset=True).exists())
+
+        # The archived reset score still keeps the 4/4 score from being the highest
+        ScoreSummary.objects.filter(student_item=item).delete()
+        with self.assertNumQueries(7):
+            differences = ScoreSummary.rebuild([item.id])
+        self.assertEqual(differences, [
+            {'student_item_id': item.id, 'highest': (None, expected.id), 'latest': (None, expected.id)},
+        ])
+        summary = ScoreSummary.objects.get(student_item=item)
+        self.assertEqual((summary.highest, summary.latest), (expected, expected))
+        self.assertEqual(ScoreSummary.rebuild([item.id]), [])
+
+    def test_latest_score_is_denormalized(self):
+        item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/special_presentation"
+        )
+        Score.objects.create(student_item=item, points_earned=1, points_possible=4)
+        self.assertEqual(
+            ScoreSummary.objects.values_list('item_id', 'latest_normalized_score', 'latest_points_earned').get(),
+            ("i4x://mycourse/special_presentation", 0.25, 1),
+        )
+
+        Score.objects.create(student_item=item, points_earned=3, points_possible=4)
+        self.assertEqual(
+            ScoreSummary.objects.values_list('latest_normalized_score', 'latest_points_earned').get(), (0.75, 3)
+        )
+
+        Score.create_reset_score(item)
+        self.assertEqual(
+            ScoreSummary.objects.values_list('latest_normalized_score', 'latest_points_earned').get(), (None, 0)
+        )
+
+    def test_rebuild_fixes_denormalized_fields(self):
+        item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/special_presentation"
+        )
+        score = Score.objects.create(student_item=item, points_earned=1, points_possible=2)
+        ScoreSummary.objects.update(item_id='', latest_normalized_score=None, latest_points_earned=0)
+
+        self.assertEqual(ScoreSummary.rebuild([item.id]), [
+            {'student_item_id': item.id, 'highest': (score.id, score.id), 'latest': (score.id, score.id)},
+        ])
+        self.assertEqual(
+            ScoreSummary.objects.values_list('item_id', 'latest_normalized_score', 'latest_points_earned').get(),
+            ("i4x://mycourse/special_presentation", 0.5, 1),
+        )
+        self.assertEqual(ScoreSummary.rebuild([item.id]), [])
+
+    def test_migration_backfills_denormalized_fields(self):
+        migration = import_module('submissions.migrations.0011_scoresummary_latest_normalized_score')
+        item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/special_presentation"
+        )
+        Score.objects.create(student_item=item, points_earned=3, points_possible=4)
+        hidden_item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/hidden"
+        )
+        Score.create_reset_score(hidden_item)
+        ScoreSummary.objects.update(item_id='', latest_normalized_score=None, latest_points_earned=0)
+
+        migration.backfill_latest_scores(apps, None)
+
+        self.assertEqual(
+            list(ScoreSummary.objects.order_by('id').values_list(
+                'item_id', 'latest_normalized_score', 'latest_points_earned'
+            )),
+            [("i4x://mycourse/special_presentation", 0.75, 3), ("i4x://mycourse/hidden", None, 0)],
+        )
+
+    def test_database_error_is_logged(self):
+        item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/special_presentation"
+        )
+        with mock.patch.object(ScoreSummary, 'apply_score', side_effect=DatabaseError):
+            with mock.patch('submissions.models.logger') as mock_logger:
+                Score.objects.create(student_item=item, points_earned=1, points_possible=2)
+        mock_logger.exception.assert_called_once()
+
+
+class TestScore(TestCase):
+    """
+    Test the Score model.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.item = StudentItem.objects.create(
+            student_id="score_test_student",
+            course_id="score_test_course",
+            item_id="i4x://mycourse/special_presentation"
+        )
+
+    def test_normalized_score(self):
+        score = Score.objects.create(student_item=self.item, points_earned=3, points_possible=4)
+        self.assertEqual(Score.objects.get(pk=score.pk).normalized_score, 0.75)
+
+        reset = Score.create_reset_score(self.item)
+        self.assertIsNone(Score.objects.get(pk=reset.pk).normalized_score)
+
+    def test_normalized_score_expression_falls_back_to_ratio(self):
+        score = Score.objects.create(student_item=self.item, points_earned=1, points_possible=4)
+        hidden = Score.create_reset_score(self.item)
+        Score.objects.update(normalized_score=None)
+
+        ratios = dict(
+            Score.objects.annotate(ratio=Score.normalized_score_expression()).values_list('pk', 'ratio')
+        )
+        self.assertEqual(ratios, {score.pk: 0.25, hidden.pk: None})
+
 
 class TestTeamSubmission(TestCase):
     """
@@ -231,6 +423,74 @@ class TestTeamSubmission(TestCase):
         with pytest.raises(DuplicateTeamSubmissionsError):
             TestTeamSubmission.create_team_submission(user=self.user)
 
+    def test_duplicate_leaves_transaction_usable(self):
+        with transaction.atomic():
+            with pytest.raises(DuplicateTeamSubmissionsError):
+                TestTeamSubmission.create_team_submission(user=self.user)
+            self.assertEqual(TeamSubmission.objects.count(), 1)
+
+    def test_deleted_team_submissions_are_not_duplicates(self):
+        self.default_submission.status = DELETED
+        with self.assertNumQueries(1):
+            self.default_submission.save(update_fields=['status'])
+        team_submission = TestTeamSubmission.create_team_submission(user=self.user)
+        self.assertNotEqual(team_submission.id, self.default_submission.id)
+        with pytest.raises(DuplicateTeamSubmissionsError):
+            self.default_submission.status = ACTIVE
+            self.default_submission.save()
+
+    def test_other_integrity_errors_are_raised(self):
+        with pytest.raises(IntegrityError):
+            TeamSubmission.objects.create(
+                team_id='team2', course_id='c1', item_id='i1', attempt_number=-1
+            )
+
+    def test_constraint_without_partial_indexes(self):
+        # The constraint does not depend on partial indexes, so MySQL enforces it as well
+        with mock.patch.object(connection.features, 'supports_partial_indexes', False):
+            with pytest.raises(DuplicateTeamSubmissionsError):
+                TestTeamSubmission.create_team_submission(user=self.user)
+        self.assertEqual(TeamSubmission.objects.count(), 1)
+
+    def test_active_team_key_follows_status(self):
+        self.default_submission.refresh_from_db()
+        self.assertTrue(self.default_submission.active_team_key)
+        self.default_submission.status = DELETED
+        self.default_submission.save(update_fields=['status'])
+        self.default_submission.refresh_from_db()
+        self.assertIsNone(self.default_submission.active_team_key)
+
+    def test_migration_soft_deletes_duplicates(self):
+        migration = import_module('submissions.migrations.0008_unique_active_team_submission')
+        # Duplicates that existed before the constraint
+        TeamSubmission.objects.filter(id=self.default_submission.id).update(active_team_key=None)
+        latest = TestTeamSubmission.create_team_submission(user=self.user)
+        other_team = TestTeamSubmission.create_team_submission(user=self.user, team_id='team2')
+        member_submissions = {}
+        for team_submission, student_id in ((self.default_submission, 'Tim'), (latest, 'Bob')):
+            student_item = StudentItem.objects.create(student_id=student_id, course_id='c1', item_id='i1')
+            member_submissions[student_id] = Submission.objects.create(
+                student_item=student_item, attempt_number=1, answer='team', team_submission=team_submission
+            )
+
+        with self.assertLogs('submissions.migrations.0008_unique_active_team_submission', 'WARNING') as logs:
+            migration.soft_delete_duplicate_team_submissions(apps, None)
+
+        self.assertIn(str(self.default_submission.uuid), logs.output[0])
+        self.assertEqual(
+            set(TeamSubmission.objects.values_list('id', flat=True)), {latest.id, other_team.id}
+        )
+        self.default_submission.refresh_from_db()
+        self.assertEqual(self.default_submission.status, DELETED)
+        # The members' submissions and memberships follow their team submission
+        self.assertEqual(
+            list(Submission.objects.values_list('id', flat=True)), [member_submissions['Bob'].id]
+        )
+        self.assertEqual(
+            list(TeamSubmissionMembership.objects.values_list('student_id', 'team_submission_id')),
+            [('Bob', latest.id)],
+        )
+
     def test_get_team_submission_by_uuid(self):
         team_submission = TeamSubmission.get_team_submission_by_uuid(self.default_submission.uuid)
         self.assertEqual(team_submission.id, self.default_submission.id)
@@ -299,6 +559,67 @@ class TestTeamSubmission(TestCase):
             )
 
 
+class TestTeamSubmissionMembership(TestCase):
+    """
+    Test the index of team submission members
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.team_submission = TeamSubmission.objects.create(
+            team_id='team1', course_id='c1', item_id='i1', attempt_number=1
+        )
+        self.student_item = StudentItem.objects.create(
+            student_id='Tim', course_id='c1', item_id='i1', item_type='openassessment'
+        )
+
+    def test_created_with_submission(self):
+        other_item = StudentItem.objects.create(student_id='Tim', course_id='c1', item_id='i2')
+        Submission.objects.create(student_item=other_item, attempt_number=1, answer='individual')
+        with self.assertNumQueries(2):
+            Submission.objects.create(
+                student_item=self.student_item, attempt_number=1, answer='team', team_submission=self.team_submission
+            )
+        self.assertEqual(
+            list(TeamSubmissionMembership.objects.values_list('course_id', 'item_id', 'student_id', 'team_id')),
+            [('c1', 'i1', 'Tim', 'team1')],
+        )
+        with self.assertNumQueries(2):
+            team_submission = TeamSubmission.get_team_submission_by_student_item(self.student_item)
+        self.assertEqual(team_submission, self.team_submission)
+        with self.assertRaises(TeamSubmissionNotFoundError):
+            TeamSubmission.get_team_submission_by_student_item(other_item)
+
+    def test_remove_for_student_items(self):
+        bob_item = StudentItem.objects.create(student_id='Bob', course_id='c1', item_id='i1')
+        for student_item in (self.student_item, bob_item):
+            Submission.objects.create(
+                student_item=student_item, attempt_number=1, answer='team', team_submission=self.team_submission
+            )
+        with self.assertNumQueries(1):
+            TeamSubmissionMembership.remove_for_student_items([self.student_item])
+        self.assertEqual(list(TeamSubmissionMembership.objects.values_list('student_id', flat=True)), ['Bob'])
+
+    def test_backfill(self):
+        migration = import_module('submissions.migrations.0007_teamsubmissionmembership')
+        Submission.objects.create(
+            student_item=self.student_item, attempt_number=1, answer='team', team_submission=self.team_submission
+        )
+        deleted_item = StudentItem.objects.create(student_id='Bob', course_id='c1', item_id='i1')
+        Submission.objects.create(
+            student_item=deleted_item, attempt_number=1, answer='team', team_submission=self.team_submission,
+            status=DELETED,
+        )
+        TeamSubmissionMembership.objects.all().delete()
+
+        migration.backfill_memberships(apps, None)
+
+        self.assertEqual(
+            list(TeamSubmissionMembership.objects.values_list('student_id', 'team_submission_id', 'team_id')),
+            [('Tim', self.team_submission.id, 'team1')],
+        )
+
+
 class TestExternalGraderDetail(TestCase):
     """
     Test the ExternalGraderDetail model functionality.
@@ -320,6 +641,10 @@ class TestExternalGraderDetail(TestCase):
             submission=self.submission,
             queue_name="test_queue"
         )
+        # As in a queue that has been pulled from before
+        ExternalGraderQueueCounter.objects.create(
+            queue_name="test_queue", status="pulled", slot=ExternalGraderQueueCounter.get_slot()
+        )
 
     def test_default_status(self):
         """Test that new queue records are created with 'pending' status."""
@@ -505,6 +830,120 @@ class TestExternalGraderDetail(TestCase):
         result_wrong_queue = ExternalGraderDetail.objects.get_next_submission("wrong_queue")
         self.assertIsNone(result_wrong_queue)
 
+    def _create_pending_detail(self, student_id, queue_name="test_queue", minutes_ago=61):
+        """Create a pending record that is past the processing window."""
+        student_item = StudentItem.objects.create(
+            student_id=student_id,
+            course_id="test_course",
+            item_id="test_item"
+        )
+        return ExternalGraderDetail.objects.create(
+            submission=Submission.objects.create(
+                student_item=student_item,
+                answer=f"answer of {student_id}",
+                attempt_number=1
+            ),
+            queue_name=queue_name,
+            status_time=now() - timedelta(minutes=minutes_ago),
+            created_at=now() - timedelta(minutes=minutes_ago),
+        )
+
+    def test_dequeue(self):
+        """Test that dequeue claims the oldest processable record of the queue."""
+        newest = self._create_pending_detail("newest", minutes_ago=61)
+        oldest = self._create_pending_detail("oldest", minutes_ago=90)
+        self._create_pending_detail("other_queue", queue_name="other_queue", minutes_ago=120)
+
+        # SELECT, UPDATE of the records, UPDATE of the pending and pulled counters
+        with self.assertNumQueries(4):
+            first = ExternalGraderDetail.objects.dequeue("test_queue")
+            self.assertEqual(first.submission.answer, "answer of oldest")
+        second = ExternalGraderDetail.objects.dequeue("test_queue")
+
+        self.assertEqual([first, second], [oldest, newest])
+        for detail in (first, second):
+            detail.refresh_from_db()
+            self.assertEqual(detail.status, 'pulled')
+            self.assertEqual(len(detail.pullkey), 64)
+        self.assertNotEqual(first.pullkey, second.pullkey)
+        # The record created in setUp is still within the processing window
+        self.assertIsNone(ExternalGraderDetail.objects.dequeue("test_queue"))
+
+    def test_dequeue_claimed_by_another_grader(self):
+        """Test that dequeue moves on when another grader claims the record first."""
+        first = self._create_pending_detail("first", minutes_ago=90)
+        second = self._create_pending_detail("second", minutes_ago=61)
+        original_update = QuerySet.update
+        claims = []
+
+        def claimed_by_another_grader(queryset, **kwargs):
+            if not claims:
+                claims.append(first)
+                # Another grader claims the record between the SELECT and the UPDATE
+                first.update_status('pulled')
+            return original_update(queryset, **kwargs)
+
+        with mock.patch('django.db.models.query.QuerySet.update', autospec=True, side_effect=claimed_by_another_grader):
+            self.assertEqual(ExternalGraderDetail.objects.dequeue("test_queue"), second)
+
+    def test_dequeue_skip_locked(self):
+        """Test the SKIP LOCKED path, which sqlite ignores."""
+        detail = self._create_pending_detail("locked", minutes_ago=90)
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True):
+            # Savepoint, SELECT ... FOR UPDATE SKIP LOCKED, UPDATE of the records and counters, release
+            with self.assertNumQueries(6):
+                claimed = ExternalGraderDetail.objects.dequeue("test_queue")
+                self.assertEqual(claimed.submission.answer, "answer of locked")
+            self.assertIsNone(ExternalGraderDetail.objects.dequeue("test_queue"))
+        self.assertEqual(claimed, detail)
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, 'pulled')
+        self.assertIsNotNone(claimed.pullkey)
+
+    def test_pull_submissions(self):
+        """Test that pull_submissions claims the oldest records with one SELECT and one UPDATE of the records."""
+        details = [self._create_pending_detail(f"student_{minutes}", minutes_ago=minutes) for minutes in (61, 70, 80)]
+
+        with self.assertNumQueries(4):
+            pulled = ExternalGraderDetail.objects.pull_submissions("test_queue", 2)
+            self.assertEqual(
+                [detail.submission.answer for detail in pulled],
+                ["answer of student_80", "answer of student_70"]
+            )
+
+        self.assertEqual(pulled, [details[2], details[1]])
+        stored = ExternalGraderDetail.objects.in_bulk([detail.id for detail in details])
+        for detail in pulled:
+            self.assertEqual(stored[detail.id].status, 'pulled')
+            self.assertEqual(stored[detail.id].pullkey, detail.pullkey)
+            self.assertEqual(stored[detail.id].status_time, detail.status_time)
+        self.assertNotEqual(pulled[0].pullkey, pulled[1].pullkey)
+        self.assertEqual(stored[details[0].id].status, 'pending')
+        self.assertIsNone(stored[details[0].id].pullkey)
+
+        self.assertEqual(ExternalGraderDetail.objects.pull_submissions("test_queue", 10), [details[0]])
+        self.assertEqual(ExternalGraderDetail.objects.pull_submissions("test_queue", 10), [])
+
+    def test_pull_submissions_partially_claimed(self):
+        """Test that pull_submissions only returns the records it claimed."""
+        first = self._create_pending_detail("first", minutes_ago=90)
+        second = self._create_pending_detail("second", minutes_ago=61)
+        original_update = QuerySet.update
+        claims = []
+
+        def claimed_by_another_grader(queryset, **kwargs):
+            if not claims:
+                claims.append(first)
+                first.update_status('pulled')
+            return original_update(queryset, **kwargs)
+
+        with mock.patch('django.db.models.query.QuerySet.update', autospec=True, side_effect=claimed_by_another_grader):
+            pulled = ExternalGraderDetail.objects.pull_submissions("test_queue", 2)
+
+        self.assertEqual(pulled, [second])
+        first.refresh_from_db()
+        self.assertIsNone(first.pullkey)
+
     def test_clean_valid_transitions(self):
         """Test that clean method allows all valid status transitions"""
 
@@ -557,6 +996,362 @@ class TestExternalGraderDetail(TestCase):
         self.assertEqual(record.status, 'retired', "Status should transition from 'pulled' to 'retired'")
 
 
+class TestExternalGraderQueueCounter(TestCase):
+    """
+    Test the queue counters maintained along with the ExternalGraderDetail records.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.student_item = StudentItem.objects.create(
+            student_id="test_student",
+            course_id="test_course",
+            item_id="test_item"
+        )
+        self.details = [self._create_detail(attempt_number) for attempt_number in (1, 2, 3)]
+
+    def _create_detail(self, attempt_number, queue_name="test_queue"):
+        return ExternalGraderDetail.objects.create(
+            submission=Submission.objects.create(
+                student_item=self.student_item,
+                answer=f"answer {attempt_number}",
+                attempt_number=attempt_number
+            ),
+            queue_name=queue_name,
+            status_time=now() - timedelta(minutes=61)
+        )
+
+    def _counts(self):
+        return {
+            (row['queue_name'], row['status']): row['total']
+            for row in ExternalGraderQueueCounter.objects.order_by().values('queue_name', 'status').annotate(
+                total=Sum('count')
+            )
+        }
+
+    def test_counted_on_creation(self):
+        self._create_detail(4, queue_name="other_queue")
+        self.assertEqual(self._counts(), {("test_queue", "pending"): 3, ("other_queue", "pending"): 1})
+
+    def test_counted_on_status_changes(self):
+        self.details[0].update_status('failed')
+        ExternalGraderDetail.objects.pull_submissions("test_queue", 10)
+        self.details[1].refresh_from_db()
+        self.details[1].update_status('retired')
+
+        self.assertEqual(self._counts(), {
+            ("test_queue", "pending"): 0,
+            ("test_queue", "pulled"): 1,
+            ("test_queue", "retired"): 1,
+            ("test_queue", "failed"): 1,
+        })
+
+    def test_get_queue_length(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue", approximate=True), 3)
+        self.details[0].update_status('pulled')
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue", approximate=True), 2)
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("other_queue", approximate=True), 0)
+
+    @override_settings(SUBMISSION_QUEUE_COUNTER_SLOTS=4)
+    def test_threads_count_in_their_own_slot(self):
+        slots = []
+
+        def get_slots():
+            slots.extend(ExternalGraderQueueCounter.get_slot() for _ in range(2))
+
+        with mock.patch('submissions.models.secrets.randbelow', side_effect=[5, 6]):
+            for _ in range(2):
+                thread = threading.Thread(target=get_slots)
+                thread.start()
+                thread.join()
+        self.assertEqual(slots, [1, 1, 2, 2])
+
+        # Counts are summed over the slots
+        for slot, attempt_number in ((1, 4), (2, 5)):
+            with mock.patch.object(ExternalGraderQueueCounter, 'get_slot', return_value=slot):
+                self._create_detail(attempt_number)
+        with self.assertNumQueries(1):
+            self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue", approximate=True), 5)
+
+    def test_stale_status_change_is_not_counted(self):
+        stale = ExternalGraderDetail.objects.get(id=self.details[0].id)
+        self.details[0].update_status('failed')
+        with self.assertRaises(ValueError):
+            stale.update_status('pulled')
+        self.assertEqual(stale.status, 'pending')
+        self.details[0].refresh_from_db()
+        self.assertEqual(self.details[0].status, 'failed')
+        self.assertEqual(self._counts(), {("test_queue", "pending"): 2, ("test_queue", "failed"): 1})
+
+    def test_get_queue_length_never_negative(self):
+        ExternalGraderQueueCounter.objects.filter(status="pending").update(count=-1)
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue", approximate=True), 0)
+
+    def test_rolled_back_with_the_status_change(self):
+        with mock.patch.object(ExternalGraderQueueCounter, 'adjust', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.details[0].update_status('pulled')
+        self.details[0].refresh_from_db()
+        self.assertEqual(self.details[0].status, 'pending')
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue", approximate=True), 3)
+
+    def test_reconcile(self):
+        # Left over from a larger SUBMISSION_QUEUE_COUNTER_SLOTS
+        ExternalGraderQueueCounter.objects.create(queue_name="test_queue", status="pending", slot=16, count=2)
+        # Writes that bypass the counters
+        self.details[0].submission.delete()
+        self.details[1].status = 'pulled'
+        self.details[1].save()
+        expected = [
+            {'queue_name': 'test_queue', 'status': 'pending', 'count': (5, 1)},
+            {'queue_name': 'test_queue', 'status': 'pulled', 'count': (0, 1)},
+        ]
+
+        self.assertEqual(ExternalGraderQueueCounter.reconcile(dry_run=True), expected)
+        self.assertEqual(self._counts(), {("test_queue", "pending"): 5})
+
+        self.assertEqual(ExternalGraderQueueCounter.reconcile(), expected)
+        self.assertEqual(self._counts(), {("test_queue", "pending"): 1, ("test_queue", "pulled"): 1})
+        self.assertEqual(ExternalGraderQueueCounter.reconcile(), [])
+
+    def test_backfill(self):
+        migration = import_module('submissions.migrations.0009_externalgraderqueuecounter')
+        self.details[0].update_status('pulled')
+        ExternalGraderQueueCounter.objects.all().delete()
+
+        migration.backfill_counters(apps, None)
+
+        self.assertEqual(self._counts(), {("test_queue", "pending"): 2, ("test_queue", "pulled"): 1})
+
+
+class TestExternalGraderLease(TestCase):
+    """
+    Test the leases of pulled ExternalGraderDetail records.
+    """
+
+    def setUp(self):
+        super().setUp()
+        student_item = StudentItem.objects.create(
+            student_id="test_student",
+            course_id="test_course",
+            item_id="test_item"
+        )
+        for attempt_number, queue_name in ((1, "test_queue"), (2, "test_queue"), (3, "other_queue")):
+            ExternalGraderDetail.objects.create(
+                submission=Submission.objects.create(
+                    student_item=student_item,
+                    answer=f"answer {attempt_number}",
+                    attempt_number=attempt_number
+                ),
+                queue_name=queue_name,
+                status_time=now() - timedelta(minutes=61)
+            )
+
+    def _pull_all(self):
+        return (
+            ExternalGraderDetail.objects.pull_submissions("test_queue", 10) +
+            ExternalGraderDetail.objects.pull_submissions("other_queue", 10)
+        )
+
+    def test_lease_on_pull(self):
+        pulled = self._pull_all()
+        for detail in pulled:
+            self.assertEqual(detail.lease_expiry, detail.status_time + timedelta(minutes=60))
+            detail.refresh_from_db()
+            self.assertEqual(detail.lease_expiry, detail.status_time + timedelta(minutes=60))
+
+    def test_lease_on_update_status(self):
+        detail = ExternalGraderDetail.objects.get_next_submission("test_queue")
+        with self.settings(SUBMISSION_LEASE_DURATION=5):
+            detail.update_status('pulled')
+        detail.refresh_from_db()
+        self.assertEqual(detail.lease_expiry, detail.status_time + timedelta(minutes=5))
+
+    def test_reap_expired_leases(self):
+        expired, renewed, other_queue = self._pull_all()
+        renewed.update_status('retired')
+        ExternalGraderDetail.objects.filter(id=expired.id).update(lease_expiry=now() - timedelta(seconds=1))
+        ExternalGraderDetail.objects.filter(id__in=[renewed.id, other_queue.id]).update(
+            lease_expiry=now() - timedelta(minutes=1)
+        )
+
+        # SAVEPOINT, SELECT of the expired records, then for each of the two queues
+        # an UPDATE of the records and of the pending and pulled counters, RELEASE
+        with self.assertNumQueries(9):
+            self.assertEqual(ExternalGraderDetail.objects.reap_expired_leases(), 2)
+
+        for detail in (expired, other_queue):
+            detail.refresh_from_db()
+            self.assertEqual(detail.status, 'pending')
+            self.assertIsNone(detail.pullkey)
+            self.assertIsNone(detail.lease_expiry)
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue", approximate=True), 1)
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("other_queue", approximate=True), 1)
+        self.assertEqual(ExternalGraderQueueCounter.get_count("test_queue", "pulled"), 0)
+        self.assertEqual(ExternalGraderDetail.objects.reap_expired_leases(), 0)
+
+        # The reaped submissions can be pulled again right away
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue"), 1)
+        self.assertEqual(ExternalGraderDetail.objects.dequeue("other_queue"), other_queue)
+
+    def test_reap_oldest_leases_first(self):
+        pulled = self._pull_all()
+        for minutes, detail in enumerate(pulled, start=1):
+            ExternalGraderDetail.objects.filter(id=detail.id).update(lease_expiry=now() - timedelta(minutes=minutes))
+
+        self.assertEqual(ExternalGraderDetail.objects.reap_expired_leases(limit=2), 2)
+        # The lease that expired last is left for the next batch
+        self.assertEqual(ExternalGraderDetail.objects.get(id=pulled[0].id).status, 'pulled')
+        self.assertEqual(ExternalGraderDetail.objects.reap_expired_leases(limit=2), 1)
+
+    def test_not_expired(self):
+        self._pull_all()
+        self.assertEqual(ExternalGraderDetail.objects.reap_expired_leases(), 0)
+
+    def test_renew_lease(self):
+        detail = ExternalGraderDetail.objects.dequeue("test_queue")
+        with freeze_time(now() + timedelta(minutes=59)):
+            self.assertTrue(detail.renew_lease(duration=timedelta(minutes=30)))
+            expected_expiry = now() + timedelta(minutes=30)
+        self.assertEqual(detail.lease_expiry, expected_expiry)
+        detail.refresh_from_db()
+        self.assertEqual(detail.lease_expiry, expected_expiry)
+
+        with freeze_time(now() + timedelta(minutes=61)):
+            self.assertEqual(ExternalGraderDetail.objects.reap_expired_leases(), 0)
+
+    def test_renew_reaped_lease(self):
+        detail = ExternalGraderDetail.objects.dequeue("test_queue")
+        with freeze_time(now() + timedelta(minutes=61)):
+            self.assertEqual(ExternalGraderDetail.objects.reap_expired_leases(), 1)
+            self.assertFalse(detail.renew_lease())
+
+            # Pulled again by another grader
+            self.assertEqual(ExternalGraderDetail.objects.dequeue("test_queue"), detail)
+            self.assertFalse(detail.renew_lease())
+
+    def test_stale_grader_is_fenced(self):
+        stale = ExternalGraderDetail.objects.dequeue("test_queue")
+        with freeze_time(now() + timedelta(minutes=61)):
+            self.assertEqual(ExternalGraderDetail.objects.reap_expired_leases(), 1)
+
+            # The grader whose lease expired can't retire the submission returned to the queue
+            with self.assertRaises(ValueError):
+                stale.update_status('retired')
+            self.assertEqual(ExternalGraderDetail.objects.get(id=stale.id).status, 'pending')
+
+            # Nor the submission once another grader pulled it
+            current = ExternalGraderDetail.objects.dequeue("test_queue")
+            self.assertEqual(current, stale)
+            with self.assertRaises(ValueError):
+                stale.update_status('failed')
+            current.refresh_from_db()
+            self.assertEqual((current.status, current.num_failures), ('pulled', 0))
+
+            current.update_status('retired')
+        self.assertEqual(ExternalGraderQueueCounter.get_count("test_queue", "pending"), 1)
+        self.assertEqual(ExternalGraderQueueCounter.get_count("test_queue", "pulled"), 0)
+        self.assertEqual(ExternalGraderQueueCounter.get_count("test_queue", "retired"), 1)
+        self.assertEqual(ExternalGraderQueueCounter.get_count("test_queue", "failed"), 0)
+
+    def test_backfill(self):
+        migration = import_module('submissions.migrations.0010_externalgraderdetail_lease_expiry')
+        detail = ExternalGraderDetail.objects.dequeue("test_queue")
+        ExternalGraderDetail.objects.update(lease_expiry=None)
+
+        migration.backfill_leases(apps, None)
+
+        detail.refresh_from_db()
+        self.assertEqual(detail.lease_expiry, detail.status_time + timedelta(minutes=60))
+        self.assertFalse(ExternalGraderDetail.objects.filter(status='pending', lease_expiry__isnull=False).exists())
+
+
+class TestExternalGraderDequeueConcurrency(TransactionTestCase):
+    """
+    Run several graders dequeuing from the same queue at once.
+    """
+    WORKERS = 4
+    QUEUE_SIZE = 20
+
+    def setUp(self):
+        super().setUp()
+        student_item = StudentItem.objects.create(
+            student_id="test_student",
+            course_id="test_course",
+            item_id="test_item"
+        )
+        for attempt_number in range(1, self.QUEUE_SIZE + 1):
+            ExternalGraderDetail.objects.create(
+                submission=Submission.objects.create(
+                    student_item=student_item,
+                    answer=f"answer {attempt_number}",
+                    attempt_number=attempt_number
+                ),
+                queue_name="test_queue",
+                status_time=now() - timedelta(minutes=61)
+            )
+
+    def _run_graders(self, pull):
+        """
+        Pull until the queue is empty from WORKERS threads, each with its own connection.
+
+        Arguments:
+            pull (callable): Claims records of "test_queue", returning a list of them.
+
+        Returns:
+            list of lists: The ids claimed by each grader.
+        """
+        barrier = threading.Barrier(self.WORKERS)
+        claimed = [[] for _ in range(self.WORKERS)]
+        errors = []
+
+        def grader(worker):
+            try:
+                barrier.wait()
+                while True:
+                    details = pull()
+                    if not details:
+                        break
+                    claimed[worker].extend(detail.id for detail in details)
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=grader, args=(worker,)) for worker in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return claimed
+
+    def _assert_each_submission_claimed_once(self, claimed):
+        """Check that the graders claimed every record exactly once, with distinct pullkeys."""
+        claimed_ids = [detail_id for ids in claimed for detail_id in ids]
+
+        self.assertEqual(len(claimed_ids), self.QUEUE_SIZE)
+        self.assertEqual(set(claimed_ids), set(ExternalGraderDetail.objects.values_list('id', flat=True)))
+        self.assertFalse(ExternalGraderDetail.objects.filter(status='pending').exists())
+        pullkeys = ExternalGraderDetail.objects.values_list('pullkey', flat=True)
+        self.assertEqual(len(set(pullkeys)), self.QUEUE_SIZE)
+        self.assertEqual(ExternalGraderDetail.objects.get_queue_length("test_queue", approximate=True), 0)
+        self.assertEqual(ExternalGraderQueueCounter.get_count("test_queue", "pulled"), self.QUEUE_SIZE)
+
+    def test_dequeue(self):
+        def pull():
+            detail = ExternalGraderDetail.objects.dequeue("test_queue")
+            return [detail] if detail else []
+
+        self._assert_each_submission_claimed_once(self._run_graders(pull))
+
+    def test_pull_submissions(self):
+        self._assert_each_submission_claimed_once(
+            self._run_graders(lambda: ExternalGraderDetail.objects.pull_submissions("test_queue", 3))
+        )
+
+
 class TestSubmission(TestCase):
     """
     Test the Submission model functionality.
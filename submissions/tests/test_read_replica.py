@@ -11,7 +11,7 @@ from django.test import TransactionTestCase
 from submissions import api as sub_api
 
 
-def _mock_use_read_replica(queryset):
+def _mock_use_read_replica(queryset, **kwargs):
     """
     The Django DATABASES setting TEST_MIRROR isn't reliable.
     See: https://code.djangoproject.com/ticket/23718
@@ -86,6 +86,7 @@ class ReadReplicaTest(TransactionTestCase):
                 self.STUDENT_ITEM['item_type'], 2,
                 read_replica=True
             )
+            # Scores are ranked by ratio, so the 3/5 from setUp comes before 4/10
             self.assertEqual(
                 top_scores,
                 [
@@ -94,8 +95,8 @@ class ReadReplicaTest(TransactionTestCase):
                         'score': 8
                     },
                     {
-                        'content': "Hello World",
-                        'score': 4
+                        'content': "test answer",
+                        'score': 3
                     },
                 ]
             )
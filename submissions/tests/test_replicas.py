@@ -0,0 +1,190 @@
+"""
+Tests for read replica selection.
+"""
+
+from collections import Counter
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from submissions import api as sub_api
+from submissions.models import Submission
+from submissions.replicas import (
+    ReadReplicaRouter,
+    StaticLagProbe,
+    get_router,
+    has_recent_item_write,
+    has_recent_write,
+    mark_recent_item_writes,
+    mark_recent_write,
+    set_router
+)
+
+REPLICA_DATABASES = {
+    'replica_a': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'replica_a'},
+    'replica_b': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'replica_b'},
+}
+
+
+@mock.patch.dict(settings.DATABASES, REPLICA_DATABASES)
+class ReadReplicaRouterTest(TestCase):
+    """ Test the default read replica router. """
+
+    def test_round_robin(self):
+        router = ReadReplicaRouter(['replica_a', 'replica_b'])
+        chosen = [router.db_for_read() for _ in range(4)]
+        self.assertEqual(chosen, ['replica_a', 'replica_b', 'replica_a', 'replica_b'])
+
+    def test_weighted(self):
+        router = ReadReplicaRouter({'replica_a': 3, 'replica_b': 1}, strategy='weighted')
+        with mock.patch('submissions.replicas.random.choices', return_value=['replica_b']) as mock_choices:
+            self.assertEqual(router.db_for_read(), 'replica_b')
+        mock_choices.assert_called_once_with(['replica_a', 'replica_b'], weights=[3, 1])
+
+    def test_zero_weight_replica_is_ignored(self):
+        router = ReadReplicaRouter({'replica_a': 0, 'replica_b': 1}, strategy='weighted')
+        self.assertEqual(router.replicas, ['replica_b'])
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            ReadReplicaRouter(['replica_a'], strategy='fastest')
+
+    def test_lagging_replica_is_skipped(self):
+        probe = StaticLagProbe({'replica_a': 120})
+        router = ReadReplicaRouter(['replica_a', 'replica_b'], lag_probe=probe, max_lag=10)
+        self.assertEqual({router.db_for_read() for _ in range(4)}, {'replica_b'})
+
+    def test_unknown_lag_is_skipped(self):
+        probe = StaticLagProbe({'replica_a': None})
+        router = ReadReplicaRouter(['replica_a', 'replica_b'], lag_probe=probe)
+        self.assertEqual(router.healthy_replicas(), ['replica_b'])
+
+    def test_all_replicas_lagging_uses_primary(self):
+        probe = StaticLagProbe({'replica_a': 60, 'replica_b': 60})
+        router = ReadReplicaRouter(['replica_a', 'replica_b'], lag_probe=probe, max_lag=10)
+        self.assertEqual(router.db_for_read(), 'default')
+
+    def test_unconfigured_alias_is_skipped(self):
+        router = ReadReplicaRouter(['replica_c', 'replica_a'])
+        self.assertEqual(Counter(router.db_for_read() for _ in range(3)), Counter({'replica_a': 3}))
+
+    def test_lag_is_cached(self):
+        probe = StaticLagProbe()
+        router = ReadReplicaRouter(['replica_a'], lag_probe=probe, max_lag=10, lag_cache_seconds=60)
+        self.assertEqual(router.db_for_read(), 'replica_a')
+        probe.set_lag('replica_a', 100)
+        self.assertEqual(router.db_for_read(), 'replica_a')
+
+        router = ReadReplicaRouter(['replica_a'], lag_probe=probe, max_lag=10, lag_cache_seconds=0)
+        self.assertEqual(router.db_for_read(), 'default')
+
+
+class ConfiguredRouterTest(TestCase):
+    """ Test the router built from settings and its use by the API. """
+
+    def tearDown(self):
+        super().tearDown()
+        set_router(None)
+
+    def test_default_configuration(self):
+        router = get_router()
+        self.assertEqual(router.replicas, ['read_replica'])
+        self.assertIs(get_router(), router)
+
+    @override_settings(
+        SUBMISSIONS_READ_REPLICAS={'read_replica': 2},
+        SUBMISSIONS_READ_REPLICA_STRATEGY='weighted',
+        SUBMISSIONS_READ_REPLICA_LAG_PROBE='submissions.replicas.StaticLagProbe',
+        SUBMISSIONS_READ_REPLICA_MAX_LAG=5,
+    )
+    def test_settings(self):
+        router = get_router()
+        self.assertEqual(router.weights, {'read_replica': 2})
+        self.assertEqual(router.strategy, 'weighted')
+        self.assertIsInstance(router.lag_probe, StaticLagProbe)
+        self.assertEqual(router.max_lag, 5)
+
+    def test_use_read_replica(self):
+        queryset = Submission.objects.all()
+        self.assertEqual(sub_api._use_read_replica(queryset).db, 'read_replica')  # pylint: disable=protected-access
+
+        set_router(ReadReplicaRouter(['read_replica'], lag_probe=StaticLagProbe({'read_replica': 300})))
+        self.assertEqual(sub_api._use_read_replica(queryset).db, 'default')  # pylint: disable=protected-access
+
+    @override_settings(SUBMISSIONS_READ_REPLICAS=[])
+    def test_no_replicas(self):
+        queryset = Submission.objects.all()
+        self.assertEqual(sub_api._use_read_replica(queryset).db, 'default')  # pylint: disable=protected-access
+
+
+class ReadYourWritesTest(TestCase):
+    """ Test that recently written student items are read from the primary. """
+    STUDENT_ITEM = {
+        "student_id": "test_student",
+        "course_id": "test_course",
+        "item_id": "test_item",
+        "item_type": "test_type"
+    }
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def _db_for(self, **kwargs):
+        return sub_api._use_read_replica(Submission.objects.all(), **kwargs).db  # pylint: disable=protected-access
+
+    def test_create_submission_marks_write(self):
+        submission = sub_api.create_submission(self.STUDENT_ITEM, "test answer")
+        self.assertTrue(has_recent_write(submission_uuid=submission['uuid']))
+        self.assertTrue(has_recent_write(student_item_id=submission['student_item']))
+        self.assertEqual(self._db_for(submission_uuid=submission['uuid']), 'default')
+
+        # Hyphenated and non-hyphenated uuids refer to the same submission
+        self.assertTrue(has_recent_write(submission_uuid=submission['uuid'].replace('-', '')))
+
+        # Unrelated reads still go to the replica
+        self.assertEqual(self._db_for(student_item_id=submission['student_item'] + 1), 'read_replica')
+        self.assertEqual(self._db_for(), 'read_replica')
+
+    def test_set_and_reset_score_mark_write(self):
+        submission = sub_api.create_submission(self.STUDENT_ITEM, "test answer")
+
+        cache.clear()
+        sub_api.set_score(submission['uuid'], 1, 2)
+        self.assertEqual(self._db_for(student_item_id=submission['student_item']), 'default')
+
+        cache.clear()
+        sub_api.reset_score(
+            self.STUDENT_ITEM['student_id'],
+            self.STUDENT_ITEM['course_id'],
+            self.STUDENT_ITEM['item_id'],
+            clear_state=True,
+        )
+        self.assertEqual(self._db_for(student_item_id=submission['student_item']), 'default')
+        self.assertEqual(self._db_for(submission_uuid=submission['uuid']), 'default')
+
+    def test_window_expires(self):
+        submission = sub_api.create_submission(self.STUDENT_ITEM, "test answer")
+        cache.clear()
+        self.assertEqual(self._db_for(submission_uuid=submission['uuid']), 'read_replica')
+
+    @override_settings(SUBMISSIONS_READ_YOUR_WRITES_WINDOW=0)
+    def test_disabled(self):
+        mark_recent_write(1, ['abc'])
+        self.assertFalse(has_recent_write(student_item_id=1, submission_uuid='abc'))
+
+    def test_cache_error_prefers_primary(self):
+        with mock.patch('submissions.replicas.cache.get_many', side_effect=Exception('boom')):
+            self.assertEqual(self._db_for(student_item_id=1), 'default')
+
+    @override_settings(SUBMISSIONS_READ_YOUR_WRITES_WINDOW=0, SUBMISSIONS_READ_REPLICA_MAX_LAG=45)
+    def test_item_write_lasts_for_max_lag(self):
+        with mock.patch('submissions.replicas.cache.set_many') as mock_set_many:
+            mark_recent_item_writes([('course', 'item', 'type')])
+        mock_set_many.assert_called_once_with({'submissions.recent_write.item.course.item.type': True}, 45)
+
+        mark_recent_item_writes([('course', 'item', 'type')])
+        self.assertTrue(has_recent_item_write('course', 'item', 'type'))
+        self.assertFalse(has_recent_item_write('course', 'other_item', 'type'))
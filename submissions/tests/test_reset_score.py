@@ -10,12 +10,12 @@ from unittest.mock import patch
 import ddt
 import pytz
 from django.core.cache import cache
-from django.db import DatabaseError
+from django.db import DatabaseError, connection
 from django.test import TestCase
 from freezegun import freeze_time
 
 from submissions import api as sub_api
-from submissions.models import Score, score_reset
+from submissions.models import DELETED, Score, ScoreSummary, Submission, score_reset
 
 
 @ddt.ddt
@@ -196,3 +196,157 @@ class TestResetScore(TestCase):
             item_id=self.STUDENT_ITEM['item_id'],
             created_at=datetime.now().replace(tzinfo=pytz.UTC),
         )
+
+    @ddt.data(1, 3)
+    def test_clear_state_is_set_based(self, num_submissions):
+        submissions = [
+            sub_api.create_submission(self.STUDENT_ITEM, f'answer {attempt}') for attempt in range(num_submissions)
+        ]
+        sub_api.set_score(submissions[-1]['uuid'], 1, 2)
+        for submission in submissions:
+            sub_api.get_submission(submission['uuid'])
+
+        # Student item lookup, reset score insert and summary update, then one select and one update
+        with self.assertNumQueries(5):
+            sub_api.reset_score(
+                self.STUDENT_ITEM['student_id'],
+                self.STUDENT_ITEM['course_id'],
+                self.STUDENT_ITEM['item_id'],
+                clear_state=True,
+            )
+
+        for submission in submissions:
+            with self.assertRaises(sub_api.SubmissionNotFoundError):
+                sub_api.get_submission(submission['uuid'])
+        self.assertEqual(sub_api.get_submissions(self.STUDENT_ITEM), [])
+        self.assertEqual(
+            set(Submission._objects.values_list('status', flat=True)),  # pylint: disable=protected-access
+            {DELETED},
+        )
+
+    def test_clear_state_invalidates_top_submissions(self):
+        submission = sub_api.create_submission(self.STUDENT_ITEM, 'test answer')
+        sub_api.set_score(submission['uuid'], 1, 2)
+        item = (self.STUDENT_ITEM['course_id'], self.STUDENT_ITEM['item_id'], self.STUDENT_ITEM['item_type'])
+        for number_of_top_scores in (1, 10):
+            self.assertEqual(sub_api.get_top_submissions(*item, number_of_top_scores, read_replica=False), [
+                {'score': 1, 'content': 'test answer'},
+            ])
+
+        # One generation bump invalidates the leaderboards of every size
+        with patch('submissions.caching.cache.delete_many') as delete_many_mock:
+            sub_api.reset_score(
+                self.STUDENT_ITEM['student_id'],
+                self.STUDENT_ITEM['course_id'],
+                self.STUDENT_ITEM['item_id'],
+                clear_state=True,
+            )
+        self.assertLess(sum(len(call.args[0]) for call in delete_many_mock.call_args_list), 10)
+        for number_of_top_scores in (1, 10):
+            self.assertEqual(sub_api.get_top_submissions(*item, number_of_top_scores, read_replica=False), [])
+
+
+class TestResetScoresForItem(TestCase):
+    """
+    Test resetting the scores of every student on a problem.
+    """
+
+    COURSE_ID = 'test_course'
+    ITEM_ID = 'test_item'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.submissions = {}
+        for student_id in ('Tim', 'Bob', 'Li'):
+            student_item = self._student_item(student_id)
+            self.submissions[student_id] = sub_api.create_submission(student_item, f'{student_id} answer')
+            sub_api.set_score(self.submissions[student_id]['uuid'], 2, 4)
+        # Another item in the same course is left alone
+        self.other = sub_api.create_submission(self._student_item('Tim', item_id='other_item'), 'answer')
+        sub_api.set_score(self.other['uuid'], 3, 4)
+
+    def _student_item(self, student_id, item_id=ITEM_ID):
+        return {
+            'student_id': student_id,
+            'course_id': self.COURSE_ID,
+            'item_id': item_id,
+            'item_type': 'test_type',
+        }
+
+    def test_reset_all_students(self):
+        with patch.object(score_reset, 'send') as send_mock:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(sub_api.reset_scores_for_item(self.COURSE_ID, self.ITEM_ID), 3)
+
+        for student_id in self.submissions:
+            self.assertIsNone(sub_api.get_score(self._student_item(student_id)))
+            self.assertEqual(len(sub_api.get_submissions(self._student_item(student_id))), 1)
+        self.assertEqual(sub_api.get_score(self._student_item('Tim', item_id='other_item'))['points_earned'], 3)
+        self.assertEqual(
+            sorted(call.kwargs['anonymous_user_id'] for call in send_mock.call_args_list),
+            ['Bob', 'Li', 'Tim'],
+        )
+
+        # New scores count from the reset
+        sub_api.set_score(self.submissions['Tim']['uuid'], 1, 4)
+        self.assertEqual(sub_api.get_score(self._student_item('Tim'))['points_earned'], 1)
+
+    def test_reset_some_students_and_clear_state(self):
+        for submission in self.submissions.values():
+            sub_api.get_submission(submission['uuid'])
+
+        with patch.object(score_reset, 'send') as send_mock:
+            with self.captureOnCommitCallbacks(execute=True):
+                reset_count = sub_api.reset_scores_for_item(
+                    self.COURSE_ID,
+                    self.ITEM_ID,
+                    student_ids=['Tim', 'Li', 'Nobody'],
+                    clear_state=True,
+                    emit_signal=False,
+                )
+        self.assertEqual(reset_count, 2)
+        send_mock.assert_not_called()
+
+        for student_id in ('Tim', 'Li'):
+            self.assertIsNone(sub_api.get_score(self._student_item(student_id)))
+            self.assertEqual(sub_api.get_submissions(self._student_item(student_id)), [])
+            with self.assertRaises(sub_api.SubmissionNotFoundError):
+                sub_api.get_submission(self.submissions[student_id]['uuid'])
+        self.assertEqual(sub_api.get_score(self._student_item('Bob'))['points_earned'], 2)
+        self.assertEqual(len(sub_api.get_submissions(self._student_item('Bob'))), 1)
+
+    def test_chunked(self):
+        reset_student_items = sub_api.reset_student_items
+        with patch('submissions.api.RESET_SCORES_CHUNK_SIZE', 2):
+            with patch('submissions.api.reset_student_items', wraps=reset_student_items) as reset_mock:
+                self.assertEqual(sub_api.reset_scores_for_item(self.COURSE_ID, self.ITEM_ID), 3)
+        self.assertEqual([len(call.args[0]) for call in reset_mock.call_args_list], [2, 1])
+        self.assertEqual(Score.objects.filter(reset=True).count(), 3)
+
+    def test_query_count_does_not_depend_on_students(self):
+        # The chunk lookup; then, inside a savepoint, the reset score insert, the summary
+        # lock, read and update, and the submission lookup and update; then the empty last chunk
+        with self.assertNumQueries(10):
+            sub_api.reset_scores_for_item(self.COURSE_ID, self.ITEM_ID, clear_state=True)
+
+    def test_database_error(self):
+        with patch('submissions.api._create_scores', side_effect=DatabaseError("Test error")):
+            with self.assertRaises(sub_api.SubmissionInternalError):
+                sub_api.reset_scores_for_item(self.COURSE_ID, self.ITEM_ID)
+        self.assertFalse(Score.objects.filter(reset=True).exists())
+
+    def test_without_bulk_insert_returning(self):
+        with patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            with patch('submissions.api.RESET_SCORES_CHUNK_SIZE', 2):
+                self.assertEqual(sub_api.reset_scores_for_item(self.COURSE_ID, self.ITEM_ID, clear_state=True), 3)
+        for student_id in self.submissions:
+            self.assertIsNone(sub_api.get_score(self._student_item(student_id)))
+        summaries = ScoreSummary.objects.filter(student_item__item_id=self.ITEM_ID)
+        self.assertEqual(set(summaries.values_list('latest__reset', flat=True)), {True})
+
+    def test_ids_not_read_back(self):
+        with patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            with patch('django.db.models.query.QuerySet.bulk_create'):
+                with self.assertRaises(sub_api.SubmissionInternalError):
+                    sub_api.reset_scores_for_item(self.COURSE_ID, self.ITEM_ID)
@@ -5,7 +5,7 @@ Tests for submissions serializers.
 import ddt
 from django.test import TestCase
 
-from submissions.models import Score, ScoreAnnotation, StudentItem, Submission
+from submissions.models import Score, ScoreAnnotation, StudentItem, Submission, TeamSubmission
 from submissions.serializers import ScoreSerializer, TeamSubmissionSerializer
 from submissions.tests.factories import StudentItemFactory, SubmissionFactory, TeamSubmissionFactory
 
@@ -73,6 +73,39 @@ class ScoreSerializerTest(TestCase):
             ]
         )
 
+    def test_prefetched_annotations(self):
+        """
+        Ensure that prefetched annotations are serialized without further queries.
+        """
+        for test_type in ('test_annotation_1', 'test_annotation_2'):
+            ScoreAnnotation.objects.create(
+                score=self.score,
+                annotation_type=test_type,
+                creator='test_annotator',
+                reason='tests for the test god',
+            )
+        other_score = Score.objects.create(
+            student_item=self.item,
+            submission=self.submission,
+            points_earned=3,
+            points_possible=6,
+        )
+
+        with self.assertNumQueries(2):
+            scores = list(
+                Score.objects.filter(student_item=self.item)
+                .select_related('submission')
+                .prefetch_related('scoreannotation_set')
+            )
+        with self.assertNumQueries(0):
+            serialized = {score.id: ScoreSerializer(score).data for score in scores}
+
+        self.assertEqual(
+            [annotation['annotation_type'] for annotation in serialized[self.score.id]['annotations']],
+            ['test_annotation_1', 'test_annotation_2'],
+        )
+        self.assertEqual(serialized[other_score.id]['annotations'], [])
+
 
 class TeamSubmissionSerializerTest(TestCase):
     """
@@ -114,3 +147,28 @@ class TeamSubmissionSerializerTest(TestCase):
         self.assertEqual(serialized_data['created_at'], self.team_submission.created)
         self.assertEqual(serialized_data['attempt_number'], self.team_submission.attempt_number)
         self.assertEqual(serialized_data['answer'], self.answer)
+
+    def test_prefetched_answers(self):
+        """
+        Test that the answers of prefetched team submissions are serialized without further queries
+        """
+        other_team_submission = TeamSubmissionFactory.create(course_id=self.course_id, item_id='other-item-id')
+        other_submission = SubmissionFactory.create(
+            student_item=StudentItemFactory.create(course_id=self.course_id, item_id='other-item-id'),
+            answer='other answer',
+            team_submission=other_team_submission,
+        )
+        team_submissions = TeamSubmission.objects.prefetch_related('submissions').order_by('id')
+        with self.assertNumQueries(2):
+            serialized = TeamSubmissionSerializer(team_submissions, many=True).data
+        self.assertEqual([data['answer'] for data in serialized], [self.answer, 'other answer'])
+        self.assertEqual(serialized[1]['submission_uuids'], [other_submission.uuid])
+
+    def test_no_submissions(self):
+        """
+        Test that a team submission without individual submissions has no answer
+        """
+        team_submission = TeamSubmissionFactory.create(course_id=self.course_id, item_id='other-item-id')
+        self.assertIsNone(TeamSubmissionSerializer(team_submission).data['answer'])
+        team_submission = TeamSubmission.objects.prefetch_related('submissions').get(pk=team_submission.pk)
+        self.assertIsNone(TeamSubmissionSerializer(team_submission).data['answer'])
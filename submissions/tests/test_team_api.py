@@ -4,15 +4,17 @@ from unittest import mock
 
 import ddt
 from django.core.cache import cache
-from django.db import DatabaseError
+from django.db import DatabaseError, connection
 from django.test import TestCase
 from django.utils.timezone import now
 from freezegun import freeze_time
 
+from submissions import api as sub_api
 from submissions import team_api
 from submissions.errors import (
     DuplicateTeamSubmissionsError,
     SubmissionInternalError,
+    SubmissionRequestError,
     TeamSubmissionInternalError,
     TeamSubmissionNotFoundError,
     TeamSubmissionRequestError
@@ -121,6 +123,16 @@ class TestTeamSubmissionsApi(TestCase):
         )
         return student_item
 
+    @staticmethod
+    def _student_item_dict(student_id, course_id=COURSE_ID, item_id=ITEM_1_ID, item_type='openassessment'):
+        """ Convenience method to build the student item dict of a team member """
+        return {
+            'student_id': student_id,
+            'course_id': course_id,
+            'item_id': item_id,
+            'item_type': item_type,
+        }
+
     def _call_create_submission_for_team_with_default_args(self):
         """ Convenience method to call team_api.create_submission_for_team with some default arguments """
         return team_api.create_submission_for_team(
@@ -250,6 +262,43 @@ class TestTeamSubmissionsApi(TestCase):
         # student id
         self.assertEqual(len(ids), len(set(ids)))
 
+    def test_create_submission_for_team_num_queries(self):
+        """
+        Test that the individual submissions are created in bulk, whatever the size of the team
+        """
+        # One team member already has a student item
+        self._get_or_create_student_item(self.student_ids[0])
+        # Savepoints and releases, submitting user check, team submission insert and serialization,
+        # teammates lookup, student items lookup, insert and reload, submissions and memberships
+        # inserts, and the individual submission uuids
+        with self.assertNumQueries(14):
+            team_submission_data = self._call_create_submission_for_team_with_default_args()
+        self.assertEqual(len(team_submission_data['submission_uuids']), len(self.student_ids))
+        self.assertEqual(
+            set(StudentItem.objects.values_list('student_id', flat=True)),
+            set(self.student_ids),
+        )
+        self.assertEqual(
+            set(Submission.objects.values_list('team_submission__uuid', 'attempt_number')),
+            {(TeamSubmission.objects.get().uuid, 1)},
+        )
+
+    def test_create_submission_for_team_answer_too_large(self):
+        """
+        Test that an oversized answer is rejected before anything is saved
+        """
+        with self.assertRaises(SubmissionRequestError):
+            team_api.create_submission_for_team(
+                COURSE_ID,
+                ITEM_1_ID,
+                TEAM_1_ID,
+                self.user_1.id,
+                self.student_ids,
+                'x' * (Submission.MAXSIZE + 1),
+            )
+        self.assertEqual(TeamSubmission.objects.count(), 0)
+        self.assertEqual(Submission.objects.count(), 0)
+
     @mock.patch('submissions.api._log_submission')
     def test_create_submission_for_team_error_creating_individual_submission(self, mocked_log_submission):
         """
@@ -329,6 +378,24 @@ class TestTeamSubmissionsApi(TestCase):
         # Returns no one, since the submission was cancelled
         self.assertEqual(external_submissions, [])
 
+    def test_get_teammates_with_submissions_from_other_teams__individual_reset(self):
+        """
+        Test that a student whose team-based submission was cleared individually no longer counts as submitted
+        """
+        self._make_team_submission(create_submissions=True)
+        sub_api.reset_score(self.student_ids[0], COURSE_ID, ITEM_1_ID, clear_state=True)
+
+        external_submissions = team_api.get_teammates_with_submissions_from_other_teams(
+            COURSE_ID, ITEM_1_ID, TEAM_2_ID, self.student_ids
+        )
+
+        self.assertEqual(
+            sorted(submission['student_id'] for submission in external_submissions),
+            self.student_ids[1:],
+        )
+        with self.assertRaises(TeamSubmissionNotFoundError):
+            team_api.get_team_submission_for_student(self._student_item_dict(self.student_ids[0]))
+
     def test_get_team_submission(self):
         """
         Test that calling team_api.get_team_submission returns the expected team submission
@@ -347,7 +414,8 @@ class TestTeamSubmissionsApi(TestCase):
         """
         team_submission_model = self._make_team_submission(create_submissions=True)
         regular_submission_uuid = team_submission_model.submissions.first().uuid
-        team_submission_dict = team_api.get_team_submission_from_individual_submission(regular_submission_uuid)
+        with self.assertNumQueries(2):
+            team_submission_dict = team_api.get_team_submission_from_individual_submission(regular_submission_uuid)
         self.assertDictEqual(
             team_submission_dict,
             TeamSubmissionSerializer(team_submission_model).data
@@ -406,6 +474,64 @@ class TestTeamSubmissionsApi(TestCase):
         with self.assertRaisesMessage(TeamSubmissionInternalError, 'caused error: !!!error!!!'):
             team_api.get_team_submission_for_team(COURSE_ID, ITEM_1_ID, TEAM_1_ID)
 
+    def test_get_team_submission_cached(self):
+        """
+        Test that team submissions are cached, and can be looked up by uuid, team or individual submission
+        """
+        team_submission_model = self._make_team_submission(create_submissions=True)
+        individual_submission_uuid = team_submission_model.submissions.first().uuid
+        expected = TeamSubmissionSerializer(team_submission_model).data
+
+        team_api.get_team_submission(team_submission_model.uuid)
+        team_api.get_team_submission_for_team(COURSE_ID, ITEM_1_ID, TEAM_1_ID)
+        team_api.get_team_submission_from_individual_submission(individual_submission_uuid)
+        with self.assertNumQueries(0):
+            self.assertEqual(team_api.get_team_submission(team_submission_model.uuid), expected)
+            self.assertEqual(team_api.get_team_submission_for_team(COURSE_ID, ITEM_1_ID, TEAM_1_ID), expected)
+            self.assertEqual(
+                team_api.get_team_submission_from_individual_submission(individual_submission_uuid),
+                expected,
+            )
+
+    def test_team_submission_cache_invalidated_by_reset(self):
+        """
+        Test that resetting a team's state removes its team submission from the cache
+        """
+        team_submission = self._call_create_submission_for_team_with_default_args()
+        team_api.get_team_submission(team_submission['team_submission_uuid'])
+        team_api.get_team_submission_for_team(COURSE_ID, ITEM_1_ID, TEAM_1_ID)
+        team_api.get_team_submission_from_individual_submission(team_submission['submission_uuids'][0])
+
+        team_api.reset_scores(team_submission['team_submission_uuid'], clear_state=True)
+
+        with self.assertRaises(TeamSubmissionNotFoundError):
+            team_api.get_team_submission(team_submission['team_submission_uuid'])
+        with self.assertRaises(TeamSubmissionNotFoundError):
+            team_api.get_team_submission_for_team(COURSE_ID, ITEM_1_ID, TEAM_1_ID)
+        with self.assertRaises(TeamSubmissionNotFoundError):
+            team_api.get_team_submission_from_individual_submission(team_submission['submission_uuids'][0])
+
+        # The team submits again, and its new team submission is found
+        new_team_submission = self._call_create_submission_for_team_with_default_args()
+        self.assertEqual(
+            team_api.get_team_submission_for_team(COURSE_ID, ITEM_1_ID, TEAM_1_ID)['team_submission_uuid'],
+            new_team_submission['team_submission_uuid'],
+        )
+
+    def test_team_submission_cache_invalidated_by_individual_reset(self):
+        """
+        Test that clearing the state of one team member updates the cached submission uuids of the team submission
+        """
+        team_submission = self._call_create_submission_for_team_with_default_args()
+        team_api.get_team_submission(team_submission['team_submission_uuid'])
+
+        sub_api.reset_score(self.student_ids[0], COURSE_ID, ITEM_1_ID, clear_state=True)
+
+        self.assertEqual(
+            len(team_api.get_team_submission(team_submission['team_submission_uuid'])['submission_uuids']),
+            len(self.student_ids) - 1,
+        )
+
     def assert_team_submission_list(self, team_submissions, expected_submission_1, expected_submission_2):
         """
         Convenience method.
@@ -469,6 +595,95 @@ class TestTeamSubmissionsApi(TestCase):
         self.assertEqual(len(team_submissions), 2)
         self.assert_team_submission_list(team_submissions, team_submission_models[2], team_submission_models[3])
 
+    def test_get_all_team_submissions_num_queries(self):
+        """
+        Test that the number of queries of team_api.get_all_team_submissions does not depend on the number of teams
+        """
+        for team_id in (TEAM_1_ID, TEAM_2_ID, 'team_cherry'):
+            self._make_team_submission(team_id=team_id, create_submissions=True)
+        with self.assertNumQueries(2):
+            team_submissions = team_api.get_all_team_submissions(COURSE_ID, ITEM_1_ID)
+        self.assertEqual([team_submission['answer'] for team_submission in team_submissions], ['Foo'] * 3)
+
+    def _make_team_submissions_for_listing(self):
+        """ Make three team submissions on ITEM_1_ID, one deleted team submission, and one on ITEM_2_ID """
+        team_submissions = [
+            self._make_team_submission(team_id=team_id, create_submissions=True)
+            for team_id in (TEAM_1_ID, TEAM_2_ID, 'team_cherry')
+        ]
+        self._make_team_submission(team_id='team_durian', status=DELETED)
+        self._make_team_submission(item_id=ITEM_2_ID, create_submissions=True)
+        return team_submissions
+
+    def test_iter_all_team_submissions(self):
+        """
+        Test that team_api.iter_all_team_submissions yields the same team submissions as get_all_team_submissions
+        """
+        team_submissions = self._make_team_submissions_for_listing()
+        generator = team_api.iter_all_team_submissions(COURSE_ID, ITEM_1_ID, chunk_size=2)
+        # Two pages: the team submissions and their individual submissions, twice
+        with self.assertNumQueries(4):
+            yielded = list(generator)
+        self.assertEqual(yielded, [TeamSubmissionSerializer(model).data for model in team_submissions])
+
+    def test_iter_all_team_submissions_without_answers(self):
+        """
+        Test that the answers can be left out, and that they are not loaded
+        """
+        team_submissions = self._make_team_submissions_for_listing()
+        with self.assertNumQueries(2):
+            yielded = list(team_api.iter_all_team_submissions(COURSE_ID, ITEM_1_ID, include_answer=False))
+        for data, model in zip(yielded, team_submissions):
+            expected = TeamSubmissionSerializer(model).data
+            del expected['answer']
+            self.assertEqual(data, expected)
+        self.assertEqual(len(yielded), len(team_submissions))
+
+    def test_iter_all_team_submissions_ids_only(self):
+        """
+        Test that only the uuids and team ids can be listed
+        """
+        team_submissions = self._make_team_submissions_for_listing()
+        with self.assertNumQueries(1):
+            yielded = list(team_api.iter_all_team_submissions(COURSE_ID, ITEM_1_ID, ids_only=True))
+        self.assertEqual(
+            yielded,
+            [{'team_submission_uuid': str(model.uuid), 'team_id': model.team_id} for model in team_submissions],
+        )
+
+    def test_get_team_submissions_page(self):
+        """
+        Test paging through the team submissions of an item
+        """
+        team_submissions = self._make_team_submissions_for_listing()
+
+        first_page = team_api.get_team_submissions_page(COURSE_ID, ITEM_1_ID, page_size=2, ids_only=True)
+        self.assertEqual(
+            [data['team_submission_uuid'] for data in first_page['team_submissions']],
+            [str(model.uuid) for model in team_submissions[:2]],
+        )
+        self.assertEqual(first_page['next_after_id'], team_submissions[1].id)
+
+        second_page = team_api.get_team_submissions_page(
+            COURSE_ID, ITEM_1_ID, after_id=first_page['next_after_id'], page_size=2
+        )
+        self.assertEqual(second_page['team_submissions'], [TeamSubmissionSerializer(team_submissions[2]).data])
+        self.assertIsNone(second_page['next_after_id'])
+
+        self.assertEqual(
+            team_api.get_team_submissions_page(OTHER_COURSE_ID, ITEM_1_ID),
+            {'team_submissions': [], 'next_after_id': None},
+        )
+
+    @mock.patch('submissions.models.TeamSubmission.SoftDeletedManager.get_queryset')
+    def test_get_team_submissions_page_error(self, mocked_qs):
+        """
+        Test that database errors are raised as TeamSubmissionInternalError
+        """
+        mocked_qs.return_value.filter.return_value.order_by.return_value.values_list.side_effect = DatabaseError()
+        with self.assertRaises(TeamSubmissionInternalError):
+            team_api.get_team_submissions_page(COURSE_ID, ITEM_1_ID, ids_only=True)
+
     def test_get_all_team_submissions_no_submissions(self):
         """
         Test that calling team_api.get_all_team_submissions when there are no matching teams returns an empty list.
@@ -523,6 +738,46 @@ class TestTeamSubmissionsApi(TestCase):
             self.assertEqual(annotation.reason, 'they did some extra credit!')
             self.assertEqual(annotation.annotation_type, 'staff_override')
 
+    def test_set_score_num_queries(self):
+        """
+        Test that the scores of a team are set with a fixed number of queries, and signaled after commit
+        """
+        team_submission = self._make_team_submission(create_submissions=True)
+        team_api.get_team_submission(team_submission.uuid)
+        with mock.patch('submissions.api.score_set') as mock_signal:
+            with self.captureOnCommitCallbacks() as callbacks:
+                # Submissions lookup, scores insert, score summaries lookup and insert,
+                # annotations insert, and savepoints
+                with self.assertNumQueries(9):
+                    team_api.set_score(team_submission.uuid, 6, 10, 'some_staff', 'staff_override', 'regrade')
+            mock_signal.send.assert_not_called()
+            for callback in callbacks:
+                callback()
+        self.assertEqual(
+            sorted(call.kwargs['anonymous_user_id'] for call in mock_signal.send.call_args_list),
+            sorted(self.student_ids),
+        )
+        self.assertEqual(
+            Score.objects.filter(submission__team_submission=team_submission, scoreannotation__isnull=False).count(),
+            len(self.student_ids),
+        )
+        self.assertEqual(
+            {
+                sub_api.get_score(self._student_item_dict(student_id))['points_earned']
+                for student_id in self.student_ids
+            },
+            {6},
+        )
+
+    def test_set_score_invalid_points(self):
+        """
+        Test that invalid points are rejected before any score is saved
+        """
+        team_submission = self._make_team_submission(create_submissions=True)
+        with self.assertRaises(SubmissionInternalError):
+            team_api.set_score(team_submission.uuid, -1, 10)
+        self.assertFalse(Score.objects.exists())
+
     @mock.patch('submissions.api._log_score')
     def test_set_score_error(self, mock_log):
         """
@@ -587,7 +842,47 @@ class TestTeamSubmissionsApi(TestCase):
             len(student_items)
         )
 
-    @mock.patch('submissions.team_api._api.reset_score')
+    def test_reset_scores_num_queries(self):
+        """
+        Test that a team is reset with a fixed number of queries, and signaled after commit
+        """
+        team_submission = self._make_team_submission(create_submissions=True)
+        team_api.set_score(team_submission.uuid, 6, 10)
+        with mock.patch('submissions.api.score_reset') as mock_signal:
+            with self.captureOnCommitCallbacks(execute=True):
+                # Team submission and submissions lookups, reset scores insert and score summaries update,
+                # submissions lookup and soft-delete, memberships delete, team submission soft-delete,
+                # and savepoints
+                with self.assertNumQueries(15):
+                    team_api.reset_scores(team_submission.uuid, clear_state=True)
+                mock_signal.send.assert_not_called()
+        self.assertEqual(
+            sorted(call.kwargs['anonymous_user_id'] for call in mock_signal.send.call_args_list),
+            sorted(self.student_ids),
+        )
+        for student_id in self.student_ids:
+            self.assertIsNone(sub_api.get_score(self._student_item_dict(student_id)))
+
+    def test_set_and_reset_scores_without_bulk_insert_returning(self):
+        team_submission = self._make_team_submission(create_submissions=True)
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            team_api.set_score(team_submission.uuid, 6, 10)
+            for student_id in self.student_ids:
+                self.assertEqual(sub_api.get_score(self._student_item_dict(student_id))['points_earned'], 6)
+            team_api.reset_scores(team_submission.uuid, clear_state=True)
+        for student_id in self.student_ids:
+            self.assertIsNone(sub_api.get_score(self._student_item_dict(student_id)))
+        team_submission.refresh_from_db()
+        self.assertEqual(team_submission.status, DELETED)
+
+    def test_reset_scores_ids_not_read_back(self):
+        team_submission = self._make_team_submission(create_submissions=True)
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            with mock.patch('django.db.models.query.QuerySet.bulk_create'):
+                with self.assertRaises(TeamSubmissionInternalError):
+                    team_api.reset_scores(team_submission.uuid)
+
+    @mock.patch('submissions.team_api._api.reset_student_items')
     def test_reset_scores_error(self, mock_individual_reset):
         mock_individual_reset.side_effect = DatabaseError()
         team_submission = self._make_team_submission(create_submissions=True)